@@ -1,10 +1,69 @@
-import scripts.initialization
-import scripts.dataCollection
-import scripts.dataPreprocessing
-import scripts.dataProcessing
+import argparse
+import importlib
+from helpers.profiling import tracer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Collect, clean and join the F1 lap data")
+    parser.add_argument('--storage', choices=['parquet', 'excel'], default='parquet',
+                        help="Backend the pipeline stages are stored with")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes events are collected with")
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help="Events whose sessions are loaded in the background ahead of collection, 0 to disable")
+    parser.add_argument('--car-telemetry', action='store_true',
+                        help="Also store per-sample car telemetry of every lap in Data/Telemetry/")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only process rounds that are new or changed since the last run")
+    parser.add_argument('--interpolate-weather', action='store_true',
+                        help="Join every lap to the weather interpolated to its middle instead of the sample nearest its start")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted collection, skipping the events it completed")
+    parser.add_argument('--no-excel-report', action='store_true',
+                        help="Skip exporting the final table to Data/Data.xlsx")
+    parser.add_argument('--no-query-layer', action='store_true',
+                        help="Skip refreshing the SQLite query database Data/Pipeline.sqlite")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="Write a Chrome trace of the run to PATH and folded stacks to PATH.folded")
+    return parser.parse_args()
+
+
+def run_stage(name, module, *args, function='main', **kwargs):
+    """
+    Import a stage's script only when it runs, so parsing arguments and
+    the early stages don't pay for the imports of the later ones
+    """
+    with tracer.span(name):
+        return getattr(importlib.import_module(module), function)(*args, **kwargs)
+
+
+def main():
+    args = parse_args()
+
+    from helpers.storage import configure_store
+    configure_store(args.storage)
+
+    if args.profile:
+        tracer.enable()
+
+    run_stage('initialization', 'scripts.initialization')
+    run_stage('collection', 'scripts.dataCollection',
+              workers=args.workers, incremental=args.incremental, prefetch=args.prefetch,
+              car_telemetry=args.car_telemetry, resume=args.resume)
+    run_stage('preprocessing', 'scripts.dataPreprocessing', incremental=args.incremental)
+    run_stage('processing', 'scripts.dataProcessing', incremental=args.incremental,
+              interpolate_weather=args.interpolate_weather)
+    if not args.no_query_layer:
+        run_stage('query layer', 'helpers.queryLayer', function='refresh_query_layer',
+                  incremental=args.incremental)
+    if not args.no_excel_report:
+        run_stage('report', 'scripts.dataProcessing', function='export_report')
+
+    if args.profile:
+        tracer.export_chrome_trace(args.profile)
+        tracer.export_folded(args.profile + '.folded')
+        print(f"Profile written to {args.profile}")
+
 
 if __name__ == "__main__":
-    scripts.initialization.main()
-    scripts.dataCollection.main()
-    scripts.dataPreprocessing.main()
-    scripts.dataProcessing.main()
\ No newline at end of file
+    main()
@@ -0,0 +1,86 @@
+import importlib
+import os
+import threading
+from contextlib import contextmanager
+
+# Settings read by the modules that need them, set once by configure()
+settings = {
+    'cache_dir': 'Cache',
+    'data_dir': 'Data',
+}
+
+_fastf1 = None
+_lock = threading.Lock()
+
+
+def configure(cache_dir=None, data_dir=None):
+    """
+    Set where the FastF1 HTTP cache and the pipeline data live. Paths
+    are made absolute here, so a later change of working directory
+    does not move them. Nothing heavy is imported: the FastF1 cache is
+    enabled the first time a session is actually requested
+
+    Parameters:
+    - cache_dir: Folder of the FastF1 cache
+    - data_dir: Root folder of the pipeline data
+    """
+    global _fastf1
+    with _lock:
+        if cache_dir is not None:
+            settings['cache_dir'] = os.path.abspath(cache_dir)
+            # Already in use, so point it at the new folder right away
+            if _fastf1 is not None:
+                _enable_cache(_fastf1)
+        if data_dir is not None:
+            settings['data_dir'] = os.path.abspath(data_dir)
+    return settings
+
+
+def data_path(*parts):
+    """
+    Path under the configured data folder, read when called so it
+    follows configure()
+    """
+    return os.path.join(settings['data_dir'], *parts)
+
+
+def cache_path(*parts):
+    """
+    Path under the configured cache folder, read when called so it
+    follows configure()
+    """
+    return os.path.join(settings['cache_dir'], *parts)
+
+
+@contextmanager
+def working_directory(path):
+    """
+    Run a block from another working folder, e.g. a temporary one the
+    relative default data and cache folders then point into
+    """
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def get_fastf1():
+    """
+    The fastf1 module, imported on first use with its cache enabled
+    once in the configured folder
+    """
+    global _fastf1
+    if _fastf1 is None:
+        with _lock:
+            if _fastf1 is None:
+                module = importlib.import_module('fastf1')
+                _enable_cache(module)
+                _fastf1 = module
+    return _fastf1
+
+
+def _enable_cache(fastf1):
+    os.makedirs(settings['cache_dir'], exist_ok=True)
+    fastf1.Cache.enable_cache(settings['cache_dir'])
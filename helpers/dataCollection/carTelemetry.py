@@ -0,0 +1,77 @@
+import numpy as np
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.profiling import traced
+from helpers.telemetryStore import CHANNEL_DTYPES
+
+
+class CarTelemetry:
+    def __init__(self,
+                 year,
+                 grand_prix,
+                 session_pool=None,
+                 drivers=None):
+        """
+        Per-sample car telemetry (speed, throttle, brake, gear, RPM,
+        DRS) of every lap of a race
+
+        Parameters:
+        - year: Racing season year
+        - grand_prix: Name of the Grand Prix event
+        - session_pool: SessionPool to take the session from,
+                        defaults to the shared pool
+        - drivers: Driver numbers to extract, defaults to every driver
+        """
+        session_pool = shared_pool if session_pool is None else session_pool
+        self.session = session_pool.get_session(
+                                year, grand_prix, 'Race',
+                                laps=True, telemetry=True
+                            )
+        self.drivers = list(drivers) if drivers is not None \
+                            else list(self.session.drivers)
+
+
+    @traced()
+    def get_car_telemetry(self):
+        """
+        One dict per driver with its LapNumber array, the number of
+        Samples in each lap, and every channel's samples in lap order
+        """
+        return [
+            split_laps(self.session.car_data[driver], self.session.laps, driver)
+            for driver in self.drivers
+            if driver in self.session.car_data
+        ]
+
+
+def split_laps(car_data, laps, driver):
+    """
+    Assign every car telemetry sample of a driver to the lap it was
+    recorded in, with one sorted search over the lap start times.
+    Samples before the first lap or after the last are dropped, and
+    Time is made relative to the start of each lap
+    """
+    laps = laps[(laps['DriverNumber'] == driver) & laps['LapStartTime'].notna()]
+    laps = laps.sort_values('LapStartTime')
+    starts = laps['LapStartTime'].dt.total_seconds().to_numpy()
+    # Lap end times, or the next lap's start when a lap has no end
+    ends = laps['Time'].dt.total_seconds().to_numpy()
+    ends = np.where(np.isnan(ends), np.append(starts[1:], np.inf), ends)
+
+    time = car_data['SessionTime'].dt.total_seconds().to_numpy()
+    lap = np.searchsorted(starts, time, side='right') - 1
+    keep = lap >= 0
+    keep[keep] &= time[keep] < ends[lap[keep]]
+    lap = lap[keep]
+
+    samples = {
+        channel: car_data[channel].to_numpy()[keep]
+        for channel in CHANNEL_DTYPES
+        if channel != 'Time'
+    }
+    samples['Time'] = time[keep] - starts[lap]
+    return {
+        'DriverNumber': int(driver),
+        'LapNumber': laps['LapNumber'].to_numpy(dtype=np.int64),
+        'Samples': np.bincount(lap, minlength=len(starts)),
+        **samples,
+    }
@@ -0,0 +1,242 @@
+import hashlib
+import os
+import threading
+from itertools import chain
+import numpy as np
+from helpers.config import cache_path
+from helpers.profiling import traced
+
+
+class CircuitIndex:
+    def __init__(self,
+                 reference,
+                 corners,
+                 layout=None,
+                 spacing=1.0):
+        """
+        Geometry of one circuit layout: a reference line resampled at
+        a fixed spacing, the distance along the lap of every point, the
+        corners, and a KD-tree over the line, so any position sample
+        maps to a lap distance or a corner in O(log n)
+
+        Parameters:
+        - reference: (n, 3) X, Y, Z positions in metres of one clean
+                     lap, kept as the trace of the reference lap
+        - corners: Frame of corner Number and either X, Y in metres,
+                   placed onto the reference line, or Distance along it
+        - layout: Key of the layout, as given by layout_key
+        - spacing: Metres between points of the resampled line
+        """
+        from scipy.spatial import cKDTree
+
+        reference = np.asarray(reference, dtype=np.float64)
+        steps = np.sqrt((np.diff(reference, axis=0) ** 2).sum(axis=1))
+        traced_distance = np.concatenate(([0.0], np.cumsum(steps)))
+
+        self.layout = layout
+        self.trace = reference
+        self.length = float(traced_distance[-1])
+        self.distance = np.arange(0, self.length, spacing)
+        self.reference = np.column_stack([
+            np.interp(self.distance, traced_distance, reference[:, axis])
+            for axis in range(3)
+        ])
+        self.tree = cKDTree(self.reference[:, :2])
+
+        corners = corners.sort_values('Number').reset_index(drop=True)
+        if {'X', 'Y'} <= set(corners.columns):
+            corner_distance = self.locate(corners[['X', 'Y']].to_numpy(dtype=np.float64))
+        else:
+            corner_distance = corners['Distance'].to_numpy(dtype=np.float64)
+        order = np.argsort(corner_distance, kind='stable')
+        self.corner_numbers = corners['Number'].to_numpy()[order]
+        self.corner_distance = corner_distance[order]
+
+
+    @classmethod
+    def from_session(cls, session, spacing=1.0):
+        """
+        Index of the layout a loaded session was run on, traced from
+        the session's fastest lap that has position telemetry
+        """
+        corners = session.get_circuit_info().corners.copy()
+        if {'X', 'Y'} <= set(corners.columns):
+            corners[['X', 'Y']] = corners[['X', 'Y']] / 10
+        return cls(reference_positions(session), corners, layout=layout_key(session), spacing=spacing)
+
+
+    def locate(self, positions):
+        """
+        Distance along the lap, in metres, of (n, 2) or (n, 3) X, Y(, Z)
+        positions in metres, from the nearest point of the reference line
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        _, nearest = self.tree.query(positions[:, :2])
+        return self.distance[nearest]
+
+
+    def offset(self, positions):
+        """
+        Metres between every position and the reference line
+        """
+        gap, _ = self.tree.query(np.asarray(positions, dtype=np.float64)[:, :2])
+        return gap
+
+
+    def corner_at(self, distance):
+        """
+        Number of the last corner at or before every lap distance, or
+        of the last corner of the lap before the first one
+        """
+        slot = np.searchsorted(self.corner_distance, np.asarray(distance) % self.length, side='right') - 1
+        return self.corner_numbers[slot]
+
+
+    def next_corner(self, distance):
+        """
+        Number of, and metres to, the next corner from every lap distance
+        """
+        distance = np.asarray(distance) % self.length
+        slot = np.searchsorted(self.corner_distance, distance, side='left') % len(self.corner_distance)
+        return self.corner_numbers[slot], (self.corner_distance[slot] - distance) % self.length
+
+
+    def save(self, path):
+        np.savez(
+            path,
+            trace=self.trace,
+            reference=self.reference,
+            distance=self.distance,
+            length=self.length,
+            corner_numbers=self.corner_numbers,
+            corner_distance=self.corner_distance,
+            layout=np.array(self.layout or ''),
+        )
+
+
+    @classmethod
+    def load(cls, path):
+        from scipy.spatial import cKDTree
+
+        with np.load(path) as saved:
+            index = cls.__new__(cls)
+            index.trace = saved['trace']
+            index.reference = saved['reference']
+            index.distance = saved['distance']
+            index.length = float(saved['length'])
+            index.corner_numbers = saved['corner_numbers']
+            index.corner_distance = saved['corner_distance']
+            index.layout = str(saved['layout']) or None
+        index.tree = cKDTree(index.reference[:, :2])
+        return index
+
+
+class CircuitIndexCache:
+    def __init__(self, path=None):
+        """
+        Circuit indexes built once per layout and reused by every
+        session run on it, kept in memory and saved to disk
+
+        Parameters:
+        - path: Folder the indexes are saved in, one .npz file each,
+                defaults to Circuits/ in the configured cache folder
+        """
+        self._path = path
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+
+    @property
+    def path(self):
+        # Resolved on use, as the shared cache is created before configure()
+        return cache_path('Circuits') if self._path is None else self._path
+
+
+    @traced()
+    def get(self, session):
+        """
+        Index of the layout of a loaded session, built from it when
+        the layout has not been seen before
+        """
+        key = layout_key(session)
+        with self._lock:
+            if key in self._indexes:
+                return self._indexes[key]
+
+        file_path = os.path.join(self.path, key + '.npz')
+        index = None
+        if os.path.exists(file_path):
+            try:
+                index = CircuitIndex.load(file_path)
+            except KeyError:
+                # Saved before the reference lap's trace was kept
+                pass
+        if index is None:
+            index = CircuitIndex.from_session(session)
+            os.makedirs(self.path, exist_ok=True)
+            # Written aside and renamed, as collection workers share the cache
+            temp_path = f'{file_path}.{os.getpid()}.tmp.npz'
+            index.save(temp_path)
+            os.replace(temp_path, file_path)
+
+        with self._lock:
+            return self._indexes.setdefault(key, index)
+
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+def reference_positions(session):
+    """
+    (n, 3) X, Y, Z positions in metres of the fastest lap of a session
+    with position telemetry. pick_fastest finds no lap when none is a
+    personal best, and a lap's telemetry may be missing, so the timed
+    laps are tried from the fastest
+
+    Raises ValueError when no lap has position telemetry
+    """
+    fastest = session.laps.pick_fastest()
+    timed = session.laps[session.laps['LapTime'].notna()].sort_values('LapTime')
+    candidates = chain(
+                    [fastest] if fastest is not None and not fastest.empty else [],
+                    (lap for _, lap in timed.iterrows())
+                )
+    for lap in candidates:
+        laps = session.laps.pick_drivers(lap['DriverNumber'])
+        laps = laps[laps['LapNumber'] == lap['LapNumber']]
+        laps.session = session
+        try:
+            # Default unit is 1/10 metres
+            positions = laps.get_telemetry()[['X', 'Y', 'Z']].to_numpy(dtype=np.float64) / 10
+        except (KeyError, ValueError, IndexError):
+            continue
+        positions = positions[~np.isnan(positions).any(axis=1)]
+        if len(positions) >= 2:
+            return positions
+
+    raise ValueError(f"No lap of {session.event['Location']} has position telemetry to trace the circuit from")
+
+
+def layout_key(session):
+    """
+    Key of the circuit layout a session was run on: the circuit, and a
+    digest of its corners, which changes when the layout is modified
+    """
+    try:
+        circuit = session.session_info['Meeting']['Circuit']['ShortName']
+    except (AttributeError, KeyError, TypeError):
+        circuit = session.event['Location']
+
+    corners = session.get_circuit_info().corners
+    # Rounded, so small survey differences between seasons keep the key
+    columns = ['X', 'Y'] if {'X', 'Y'} <= set(corners.columns) else ['Distance']
+    placement = (corners[columns].to_numpy(dtype=np.float64) / 500).round().astype(np.int64)
+    digest = hashlib.sha256(placement.tobytes()).hexdigest()[:10]
+    name = ''.join(c if c.isalnum() else '_' for c in str(circuit))
+    return f'{name}-{len(corners)}-{digest}'
+
+
+# Indexes shared by the collectors
+circuit_indexes = CircuitIndexCache()
@@ -0,0 +1,210 @@
+import warnings
+import numpy as np
+import pandas as pd
+from helpers.profiling import traced
+from helpers.telemetryStore import TelemetryStore
+
+# Channels resampled onto the distance grid
+COMPARED_CHANNELS = ['Speed', 'Throttle', 'Brake']
+
+# Throttle, in percent, counted as full throttle
+FULL_THROTTLE = 95
+
+
+class DriverComparison:
+    def __init__(self,
+                 laps,
+                 channels,
+                 grid_points=1000,
+                 minisectors=25,
+                 lap_length_tolerance=0.03):
+        """
+        Driving style of every driver of an event, from car telemetry
+        aligned by distance along the lap, and compared between every
+        pair of drivers minisector by minisector
+
+        Parameters:
+        - laps: Lap index with DriverNumber, LapNumber and the Start/Stop
+                range of every lap's samples, as kept by TelemetryStore
+        - channels: Arrays of the samples of all laps end to end, at least
+                    Time (seconds since the lap start), Speed, Throttle
+                    and Brake
+        - grid_points: Points of the common distance grid of a lap
+        - minisectors: Equal-length sections the lap is split into
+        - lap_length_tolerance: Laps whose length differs from the
+                                median by more than this share, such
+                                as pit laps, are left out
+        """
+        if grid_points % minisectors != 0:
+            raise ValueError("grid_points must be a multiple of minisectors")
+        self.laps = laps.reset_index(drop=True)
+        self.channels = channels
+        self.grid_points = grid_points
+        self.minisectors = minisectors
+        self.lap_length_tolerance = lap_length_tolerance
+        self._resampled = None
+
+
+    @classmethod
+    def from_store(cls, year, round_number, store=None, **kwargs):
+        store = TelemetryStore() if store is None else store
+        laps, channels = store.read_event(
+                    year, round_number, channels=['Time'] + COMPARED_CHANNELS
+                )
+        return cls(laps, channels, **kwargs)
+
+
+    @classmethod
+    def from_car_telemetry(cls, drivers, **kwargs):
+        """
+        Comparison of the per-driver dicts of CarTelemetry.get_car_telemetry,
+        straight from a loaded session
+        """
+        stops = np.cumsum(np.concatenate([driver['Samples'] for driver in drivers]))
+        laps = pd.DataFrame({
+            'DriverNumber': np.concatenate([
+                np.full(len(driver['LapNumber']), int(driver['DriverNumber']))
+                for driver in drivers
+            ]),
+            'LapNumber': np.concatenate([driver['LapNumber'] for driver in drivers]),
+            'Start': stops - np.concatenate([driver['Samples'] for driver in drivers]),
+            'Stop': stops,
+        })
+        channels = {
+            channel: np.concatenate([np.asarray(driver[channel], dtype=np.float64) for driver in drivers])
+            for channel in ['Time'] + COMPARED_CHANNELS
+        }
+        return cls(laps, channels, **kwargs)
+
+
+    @traced()
+    def resample(self):
+        """
+        Every lap's channels on the common distance grid, as
+        (laps, grid_points) arrays, with the laps frame they belong to
+        """
+        if self._resampled is None:
+            self._resampled = resample_by_distance(
+                        self.laps, self.channels, self.grid_points, self.lap_length_tolerance
+                    )
+        return self._resampled
+
+
+    @traced()
+    def minisector_metrics(self):
+        """
+        Median over each driver's laps of, for every minisector, the
+        braking point (metres into the minisector where braking starts),
+        the minimum speed and the share of it at full throttle
+
+        Returns the driver numbers and a dict of (drivers, minisectors)
+        arrays
+        """
+        laps, traces = self.resample()
+        per_point = self.grid_points // self.minisectors
+        sector_length = traces['LapLength'] / self.minisectors
+
+        def by_sector(values):
+            return values.reshape(len(laps), self.minisectors, per_point)
+
+        braking = by_sector(traces['Brake'] > 0.5)
+        first_brake = np.where(braking.any(axis=2), braking.argmax(axis=2), np.nan)
+        lap_metrics = {
+            'BrakingPoint': first_brake / per_point * sector_length[:, None],
+            'MinSpeed': by_sector(traces['Speed']).min(axis=2),
+            'FullThrottle': (by_sector(traces['Throttle']) >= FULL_THROTTLE).mean(axis=2),
+        }
+
+        drivers, driver_of_lap = np.unique(laps['DriverNumber'].to_numpy(), return_inverse=True)
+        metrics = {}
+        with warnings.catch_warnings():
+            # Minisectors a driver never brakes in have no braking point
+            warnings.simplefilter('ignore', RuntimeWarning)
+            for name, values in lap_metrics.items():
+                metrics[name] = np.stack([
+                    np.nanmedian(values[driver_of_lap == d], axis=0)
+                    for d in range(len(drivers))
+                ]) if len(drivers) > 0 else np.empty((0, self.minisectors))
+        return drivers, metrics
+
+
+    @traced()
+    def pairwise_deltas(self):
+        """
+        Differences between every ordered pair of drivers in each
+        minisector, as a tidy frame of Driver, Opponent, Minisector and
+        one Delta column per metric (driver minus opponent)
+        """
+        drivers, metrics = self.minisector_metrics()
+        driver, opponent = np.nonzero(~np.eye(len(drivers), dtype=bool))
+
+        # (pairs, minisectors) deltas of every metric in one operation
+        frame = {
+            'Driver': np.repeat(drivers[driver], self.minisectors),
+            'Opponent': np.repeat(drivers[opponent], self.minisectors),
+            'Minisector': np.tile(np.arange(1, self.minisectors + 1), len(driver)),
+        }
+        for name, values in metrics.items():
+            frame['Delta' + name] = (values[driver] - values[opponent]).ravel()
+        return pd.DataFrame(frame)
+
+
+def resample_by_distance(laps, channels, grid_points=1000, lap_length_tolerance=0.03):
+    """
+    Resample the channels of every lap onto a grid of equally spaced
+    fractions of the lap distance, using one sorted search over all laps
+
+    Distance is integrated from speed, so laps recorded at different
+    rates, or of slightly different lengths, line up along the track
+
+    Returns the kept laps, and a dict of (laps, grid_points) arrays per
+    channel plus the LapLength of every lap in metres
+    """
+    start = laps['Start'].to_numpy()
+    stop = laps['Stop'].to_numpy()
+    counts = stop - start
+    laps = laps[counts >= 2]
+    start, counts = start[counts >= 2], counts[counts >= 2]
+    if len(laps) == 0:
+        traces = {channel: np.empty((0, grid_points)) for channel in COMPARED_CHANNELS}
+        return laps.reset_index(drop=True), {**traces, 'LapLength': np.empty(0)}
+
+    # Samples of the kept laps, end to end, with their lap
+    lap = np.repeat(np.arange(len(laps)), counts)
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    samples = np.arange(len(lap)) - first[lap] + start[lap]
+    time = np.asarray(channels['Time'], dtype=np.float64)[samples]
+    speed = np.asarray(channels['Speed'], dtype=np.float64)[samples]
+
+    # Trapezoidal distance in metres, restarting at every lap
+    step = np.zeros(len(lap))
+    step[1:] = np.diff(time) * (speed[1:] + speed[:-1]) / 2 / 3.6
+    step[first] = 0
+    distance = np.cumsum(step)
+    distance -= distance[first][lap]
+    lap_length = distance[first + counts - 1]
+
+    median = np.median(lap_length) if len(lap_length) > 0 else 0
+    valid = np.abs(lap_length - median) <= lap_length_tolerance * median
+    valid &= lap_length > 0
+
+    # Fraction of the lap covered, offset by the lap, is increasing
+    # over all samples, so one searchsorted places every grid point
+    key = lap + distance / np.where(lap_length > 0, lap_length, 1)[lap] * (1 - 1e-9)
+    grid = np.linspace(0, 1 - 1e-9, grid_points)
+    query = (np.arange(len(laps))[:, None] + grid[None, :]).ravel()
+    after = np.clip(np.searchsorted(key, query, side='left'), 0, len(key) - 1)
+    lap_of_query = np.repeat(np.arange(len(laps)), grid_points)
+    after = np.minimum(np.maximum(after, first[lap_of_query] + 1), first[lap_of_query] + counts[lap_of_query] - 1)
+    before = after - 1
+    span = key[after] - key[before]
+    weight = np.clip(np.where(span > 0, (query - key[before]) / np.where(span > 0, span, 1), 0), 0, 1)
+
+    traces = {}
+    for channel in COMPARED_CHANNELS:
+        values = np.asarray(channels[channel], dtype=np.float64)[samples]
+        resampled = values[before] + weight * (values[after] - values[before])
+        traces[channel] = resampled.reshape(len(laps), grid_points)[valid]
+    traces['LapLength'] = lap_length[valid]
+
+    return laps[valid].reset_index(drop=True), traces
@@ -1,101 +1,47 @@
-import fastf1
 import pandas as pd
 import numpy as np
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.profiling import traced
+from helpers.dataCollection.pointsLedger import get_points_ledger
 
-# Enable Caching
-fastf1.Cache.enable_cache('Cache/')
 
 class DriverMetrics():
-    def __init__(self, year:int, grand_prix):
+    def __init__(self, year:int, grand_prix, session_pool=None):
         self.year = year
         self.grand_prix = grand_prix
-        self.session = fastf1.get_session(year, grand_prix, 'Q')
-        self.session.load()
+        self.session_pool = shared_pool if session_pool is None else session_pool
+        self.session = self.session_pool.get_session(
+                                year, grand_prix, 'Q',
+                                laps=True
+                            )
 
+    @traced()
     def get_scores_before(self):
-        # Fetch the event schedule to confirm the year's events
-        schedule = pd.read_excel('Data/Raw Data/Race Calendar.xlsx')
-        events = schedule[(schedule['location'] == self.grand_prix)\
-                            & (schedule['year'] == self.year)].index[0]
-
-        events = schedule[:events][['year', 'location']]
-        if len(events) == 0:
-            event = schedule.iloc[0][['year', 'location']]
-            session = fastf1.get_session(event.year, event.location, 'Race')
-            session.load()
-
-            points = pd.DataFrame({
-                'DriverNumber': session.drivers,
-                'PointsAtStart': [0] * len(session.results)
-            })
-        else:
-            points = None
-            for event in events.itertuples():
-                session = fastf1.get_session(event.year, event.location, 'Race')
-                session.load()
-                
-                # Get race results
-                results = session.results[['DriverNumber', 'Points']]
-                if points is None:
-                    points = results.reset_index().drop('index', axis=1)
-                else:
-                    points = pd.concat([points, results])
-                points = points.reset_index().drop('index', axis=1)
-
-            points = points.groupby('DriverNumber')\
-                        .agg(['sum'])\
-                        .reset_index()
+        # Standings come from the season's points ledger, so earlier
+        # rounds are read once per season instead of once per event
+        round_number = int(self.session.event['RoundNumber'])
+        ledger = get_points_ledger(self.year, session_pool=self.session_pool)
+        points = ledger.points_before(round_number)
 
+        if len(points) == 0:
             points = pd.DataFrame({
-                'DriverNumber': points[('DriverNumber','')],
-                'PointsAtStart': points[('Points', 'sum')]
+                'DriverNumber': self.session.drivers,
+                'PointsAtStart': [0] * len(self.session.drivers)
             })
             
         return points
     
 
-    def get_fastest_qualifying(self):        
-        # Prepare to store best laps
-        best_laps = []
-        
-        # Iterate through each driver
-        for driver in self.session.drivers:
-            # Get driver information
-            driver_info = self.session.get_driver(driver)
-            
-            # Get the driver's fastest qualifying lap
-            fastest_lap = self.session.laps.pick_drivers(driver).pick_fastest()
-            if isinstance(fastest_lap.LapTime, float):
-                continue
-            # Extract lap details
-            lap_data = {
-                # Driver Information
-                'DriverNumber': driver,
-                
-                # Qualifying Lap Details
-                'BestLapTime': fastest_lap.LapTime.total_seconds() \
-                                if fastest_lap.LapTime else np.nan,
-                'QualifyingPosition': driver_info.Position,
-                
-                # Lap Specifics
-                'QualiCompound': fastest_lap.Compound,
-                'QualiSector1Time': fastest_lap.Sector1Time.total_seconds(),
-                'QualiSector2Time': fastest_lap.Sector2Time.total_seconds(),
-                'QualiSector3Time': fastest_lap.Sector3Time.total_seconds(),
-            }
-            
-            best_laps.append(lap_data)
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(best_laps)
-        
-        # Sort by best lap time
-        df = df.reset_index()\
-                .drop('index', axis=1)
-        
-        return df
+    @traced()
+    def get_fastest_qualifying(self):
+        return extract_fastest_laps(
+                    self.session.laps,
+                    self.session.drivers,
+                    self.session.results
+                )
 
 
+    @traced()
     def get_driver_metrics(self):
         quali = self.get_fastest_qualifying()
         quali['DriverNumber'] = quali['DriverNumber'].astype(int)
@@ -108,4 +54,40 @@ class DriverMetrics():
         df = quali.join(points, how='inner', rsuffix='_r')
         df = df.reset_index()
         
-        return df
\ No newline at end of file
+        return df
+
+
+def extract_fastest_laps(laps, drivers, results):
+    """
+    Fastest qualifying lap of every driver who set a time, selected
+    column-wise from the laps frame
+    """
+    # Like pick_fastest, only personal best laps are considered
+    laps = laps[
+                laps['DriverNumber'].isin(drivers)
+                & (laps['IsPersonalBest'] == True)
+                & laps['LapTime'].notna()
+            ]
+    fastest = laps.sort_values('LapTime', kind='stable')\
+                    .drop_duplicates('DriverNumber')
+    
+    # Keep the session's driver order
+    driver_order = pd.Categorical(fastest['DriverNumber'], categories=list(drivers))
+    fastest = fastest.iloc[np.argsort(driver_order.codes, kind='stable')]
+    
+    positions = results.set_index('DriverNumber')['Position']
+    
+    return pd.DataFrame({
+        # Driver Information
+        'DriverNumber': fastest['DriverNumber'].to_numpy(),
+        
+        # Qualifying Lap Details
+        'BestLapTime': fastest['LapTime'].dt.total_seconds().to_numpy(),
+        'QualifyingPosition': fastest['DriverNumber'].map(positions).to_numpy(),
+        
+        # Lap Specifics
+        'QualiCompound': fastest['Compound'].to_numpy(),
+        'QualiSector1Time': fastest['Sector1Time'].dt.total_seconds().to_numpy(),
+        'QualiSector2Time': fastest['Sector2Time'].dt.total_seconds().to_numpy(),
+        'QualiSector3Time': fastest['Sector3Time'].dt.total_seconds().to_numpy(),
+    })
@@ -0,0 +1,226 @@
+import json
+import os
+from contextlib import contextmanager
+import pandas as pd
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.config import data_path
+from helpers.manifest import fingerprint
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where saves are merged without a lock
+    fcntl = None
+
+
+class PointsLedger:
+    def __init__(self,
+                 year,
+                 session_pool=None,
+                 path=None):
+        """
+        Cumulative championship points of one season, kept per round
+        so the standings before any round are read without replaying
+        the earlier races
+
+        Parameters:
+        - year: Racing season year
+        - session_pool: SessionPool to take result sessions from,
+                        defaults to the shared pool
+        - path: JSON file the per-round points are persisted to,
+                defaults to Raw Data/Points Ledger/ in the configured
+                data folder
+        """
+        self.year = int(year)
+        self.session_pool = shared_pool if session_pool is None else session_pool
+        self.path = path if path is not None \
+                        else data_path('Raw Data', 'Points Ledger', f'{self.year}.json')
+        self._schedule = None
+        # round -> {DriverNumber: points scored in that round}
+        self._rounds = {}
+        # round -> {DriverNumber: points scored before that round}
+        self._cumulative = {}
+        self._load()
+
+
+    def points_before(self, round_number):
+        """
+        Championship points of every classified driver before the
+        given round, as a DriverNumber/PointsAtStart frame
+        """
+        round_number = int(round_number)
+        if round_number not in self._cumulative:
+            self._build_cumulative(round_number)
+
+        points = self._cumulative[round_number]
+        return pd.DataFrame({
+            'DriverNumber': list(points.keys()),
+            'PointsAtStart': list(points.values())
+        })
+
+
+    def state_before(self, round_number):
+        """
+        Digest of the standings before a round, which changes when the
+        results of any earlier round are refreshed
+        """
+        self.points_before(round_number)
+        return fingerprint(sorted(self._cumulative[int(round_number)].items()))
+
+
+    def record_round(self, round_number, points):
+        """
+        Store the points scored in one round. Standings after that
+        round are invalidated only if its results actually changed,
+        which is returned
+        """
+        round_number = int(round_number)
+        points = {
+            str(driver): float(value)
+            for driver, value in points.items()
+        }
+        if self._rounds.get(round_number) == points:
+            return False
+
+        self._rounds[round_number] = points
+        self._cumulative = {
+            k: v
+            for k, v in self._cumulative.items()
+            if k <= round_number
+        }
+        self._save(round_number)
+        return True
+
+
+    def refresh_round(self, round_number):
+        """
+        Re-read one round's results, e.g. after a penalty changed them,
+        returning whether they changed
+        """
+        return self.record_round(round_number, self._collect_round(round_number))
+
+
+    def _build_cumulative(self, round_number):
+        earlier = [r for r in self._season_rounds() if r < round_number]
+        for r in earlier:
+            if r not in self._rounds:
+                self.record_round(r, self._collect_round(r))
+
+        # Start from the closest standings already computed
+        cached = [r for r in self._cumulative if r < round_number]
+        start = max(cached) if cached else None
+        totals = dict(self._cumulative[start]) if start is not None else {}
+        for r in earlier:
+            if start is not None and r < start:
+                continue
+            for driver, value in self._rounds[r].items():
+                totals[driver] = totals.get(driver, 0.0) + value
+
+        self._cumulative[round_number] = totals
+
+
+    def _collect_round(self, round_number):
+        event = self._season_schedule().loc[round_number]
+        session_types = ['Race']
+        if 'sprint' in str(event['EventFormat']):
+            session_types.append('Sprint')
+
+        points = {}
+        for session_type in session_types:
+            session = self.session_pool.get_session(
+                                self.year, event['Location'], session_type
+                            )
+            results = session.results[['DriverNumber', 'Points']]
+            for driver, value in results.itertuples(index=False):
+                points[driver] = points.get(driver, 0.0) \
+                                    + (0.0 if pd.isna(value) else float(value))
+
+        return points
+
+
+    def _season_schedule(self):
+        if self._schedule is None:
+            schedule = self.session_pool.get_event_schedule(self.year)
+            schedule = schedule[schedule['RoundNumber'] > 0]
+            self._schedule = schedule.set_index('RoundNumber')
+        return self._schedule
+
+
+    def _season_rounds(self):
+        # The whole season, so a calendar starting mid-season still
+        # counts the rounds before it
+        return sorted(int(r) for r in self._season_schedule().index)
+
+
+    def _load(self):
+        self._rounds = self._read_rounds()
+
+
+    def _read_rounds(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            rounds = json.load(f)
+        return {
+            int(round_number): points
+            for round_number, points in rounds.items()
+        }
+
+
+    def _save(self, round_number):
+        """
+        Write one round's points into the file as it is now, so rounds
+        other workers of the season saved meanwhile are kept, and take
+        theirs in turn
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._file_lock():
+            stored = self._read_rounds()
+            stored[round_number] = self._rounds[round_number]
+            # Written aside and swapped in one step, for readers not
+            # holding the lock
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(
+                    {str(k): v for k, v in sorted(stored.items())},
+                    f,
+                    indent=2
+                )
+            os.replace(temp_path, self.path)
+
+        changed = [r for r, points in stored.items() if self._rounds.get(r) != points]
+        self._rounds.update(stored)
+        if changed:
+            self._cumulative = {
+                k: v
+                for k, v in self._cumulative.items()
+                if k <= min(changed)
+            }
+
+
+    @contextmanager
+    def _file_lock(self):
+        # Held around read, merge and write, as collection workers of
+        # the same season save concurrently
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# One ledger per season and session pool, shared by every
+# DriverMetrics of that season
+_ledgers = {}
+
+
+def get_points_ledger(year, session_pool=None):
+    session_pool = shared_pool if session_pool is None else session_pool
+    key = (int(year), session_pool)
+    if key not in _ledgers:
+        _ledgers[key] = PointsLedger(year, session_pool=session_pool)
+    return _ledgers[key]
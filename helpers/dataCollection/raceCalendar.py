@@ -1,15 +1,14 @@
-import fastf1
+from helpers.dataCollection.sessionPool import shared_pool
 
-# Enable Caching
-fastf1.Cache.enable_cache('Cache/')
 
 class RaceCalendar():
-    def __init__(self, year:int):
+    def __init__(self, year:int, session_pool=None):
         self.year = year
+        self.session_pool = shared_pool if session_pool is None else session_pool
 
 
     def get_race_calendar(self):
-        schedule = fastf1.get_event_schedule(self.year)
+        schedule = self.session_pool.get_event_schedule(self.year)
         
         # Select relevant columns
         races_df = schedule[['RoundNumber', 'EventName', 'Location', 'Country', 'EventDate']]
@@ -1,59 +1,58 @@
-import fastf1
 import pandas as pd
 import numpy as np
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.profiling import traced
 
 
-# Enable Caching
-fastf1.Cache.enable_cache('Cache/')
-
 class RaceTelemetry():
-    def __init__(self, year:int, grand_prix):
+    def __init__(self, year:int, grand_prix, session_pool=None):
         self.year = year
         self.grand_prix = grand_prix
-        self.session = fastf1.get_session(year, grand_prix, 'Race')
-        self.session.load()
+        session_pool = shared_pool if session_pool is None else session_pool
+        self.session = session_pool.get_session(
+                                year, grand_prix, 'Race',
+                                laps=True, messages=True
+                            )
 
 
+    @traced()
     def get_race_telemetry(self):
-        laps = self.session.laps
+        return extract_lap_table(self.session.laps, self.session.drivers)
+
+
+def extract_lap_table(laps, drivers):
+    """
+    Lap details of the given drivers, built column-wise from the laps
+    frame, ordered by driver and then lap
+    """
+    laps = laps[laps['DriverNumber'].isin(drivers)]
+    
+    # Keep the session's driver order, and each driver's lap order
+    driver_order = pd.Categorical(laps['DriverNumber'], categories=list(drivers))
+    laps = laps.iloc[np.argsort(driver_order.codes, kind='stable')]
+    
+    return pd.DataFrame({
+        # Driver Information
+        'DriverNumber': laps['DriverNumber'].to_numpy(),
+        
+        'LapStartTime': laps['LapStartTime'].to_numpy(),
+        # Lap Performance Data
+        'LapTime': laps['LapTime'].dt.total_seconds().to_numpy(),
+        'LapNumber': laps['LapNumber'].to_numpy(),
         
-        # Prepare comprehensive data
-        comprehensive_data = []
+        # Tire Information
+        'Compound': laps['Compound'].to_numpy(),
+        'TyreLife': laps['TyreLife'].to_numpy(),
         
-        for driver in self.session.drivers:
-            driver_laps = laps.pick_drivers(driver)
-            
-            for lap in driver_laps.itertuples():
-                # Gather detailed information for each lap
-                lap_data = {
-                    # Driver Information
-                    'DriverNumber': driver,
-                    
-                    'LapStartTime': lap.LapStartTime,
-                    # Lap Performance Data
-                    'LapTime': lap.LapTime.total_seconds() if lap.LapTime else np.nan,
-                    'LapNumber': lap.LapNumber,
-                    
-                    # Tire Information
-                    'Compound': lap.Compound,
-                    'TyreLife': lap.TyreLife,
-                    
-                    # Sector Times
-                    'Sector1Time': lap.Sector1Time.total_seconds(),
-                    'Sector2Time': lap.Sector2Time.total_seconds(),
-                    'Sector3Time': lap.Sector3Time.total_seconds(),
-                    
-                    # Track Conditions
-                    'TrackStatus': lap.TrackStatus,
-                    
-                    # Additional Performance Metrics
-                    'IsPersonalBest': lap.IsPersonalBest,
-                    'Deleted': lap.Deleted
-                }
-                
-                comprehensive_data.append(lap_data)
+        # Sector Times
+        'Sector1Time': laps['Sector1Time'].dt.total_seconds().to_numpy(),
+        'Sector2Time': laps['Sector2Time'].dt.total_seconds().to_numpy(),
+        'Sector3Time': laps['Sector3Time'].dt.total_seconds().to_numpy(),
         
-        # Convert to DataFrame
-        df = pd.DataFrame(comprehensive_data)
+        # Track Conditions
+        'TrackStatus': laps['TrackStatus'].to_numpy(),
         
-        return df
\ No newline at end of file
+        # Additional Performance Metrics
+        'IsPersonalBest': laps['IsPersonalBest'].to_numpy(),
+        'Deleted': laps['Deleted'].to_numpy()
+    })
@@ -0,0 +1,196 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from helpers.config import get_fastf1
+from helpers.profiling import tracer
+
+# Parts of a session that can be loaded independently
+SESSION_PARTS = ('laps', 'telemetry', 'weather', 'messages')
+
+# Errors of a load worth trying again: dropped connections, timeouts
+# and the other I/O errors of the HTTP client, which subclass OSError
+TRANSIENT_ERRORS = (OSError,)
+
+
+class SessionPool:
+    def __init__(self,
+                 max_sessions=4,
+                 loader=None,
+                 schedule_loader=None,
+                 retries=3,
+                 backoff=2.0):
+        """
+        Parameters:
+        - max_sessions: Number of sessions kept in memory before the
+                        least recently used one is evicted
+        - loader: Callable (year, grand_prix, session_type) returning an
+                  unloaded session, defaults to fastf1.get_session
+        - schedule_loader: Callable (year) returning the event schedule,
+                           defaults to fastf1.get_event_schedule
+        - retries: Times a load failing with a transient error is tried
+                   again before the error is raised
+        - backoff: Seconds waited before the first retry, doubled for
+                   every following one
+        """
+        self.max_sessions = max_sessions
+        self.retries = retries
+        self.backoff = backoff
+        self.loader = loader if loader is not None else load_fastf1_session
+        self.schedule_loader = schedule_loader if schedule_loader is not None \
+                                    else load_fastf1_schedule
+        self._sessions = OrderedDict()
+        self._schedules = {}
+        # Sessions may be loaded from prefetch threads. The pool lock
+        # guards the bookkeeping, and one lock per session or schedule
+        # makes a caller wait for a load in flight instead of repeating
+        # it. Those are [lock, users] pairs, dropped with the last user
+        self._lock = threading.RLock()
+        self._load_locks = {}
+
+
+    def get_session(self,
+                    year,
+                    grand_prix,
+                    session_type='Race',
+                    laps=False,
+                    telemetry=False,
+                    weather=False,
+                    messages=False):
+        """
+        Return the session for (year, grand_prix, session_type), loading
+        only the requested parts that are not already in memory
+        """
+        key = (int(year), grand_prix, session_type)
+        requested = {
+            part
+            for part, wanted in zip(
+                        SESSION_PARTS,
+                        (laps, telemetry, weather, messages)
+                    )
+            if wanted
+        }
+        # Telemetry is merged onto laps, so it can't be loaded on its own
+        if 'telemetry' in requested:
+            requested.add('laps')
+
+        with self._load_lock(key):
+            with self._lock:
+                cached = self._sessions.get(key)
+                if cached is not None:
+                    self._sessions.move_to_end(key)
+            if cached is not None:
+                session, loaded = cached
+            else:
+                session, loaded = self._retry(self.loader, *key), None
+                with self._lock:
+                    self._sessions[key] = (session, loaded)
+                    self._evict()
+
+            if loaded is None or not requested <= loaded:
+                loaded = requested if loaded is None else loaded | requested
+                with tracer.span('session.load', event=f'{key[0]} {key[1]} {key[2]}',
+                                 parts=sorted(loaded)):
+                    self._retry(session.load, **{part: part in loaded for part in SESSION_PARTS})
+                with self._lock:
+                    self._sessions[key] = (session, loaded)
+                    self._evict()
+
+        return session
+
+
+    def get_event_schedule(self, year):
+        """
+        Event schedule of a season, loaded once
+        """
+        year = int(year)
+        with self._load_lock(('schedule', year)):
+            with self._lock:
+                schedule = self._schedules.get(year)
+            if schedule is None:
+                schedule = self._retry(self.schedule_loader, year)
+                with self._lock:
+                    self._schedules[year] = schedule
+        return schedule
+
+
+    def _retry(self, function, *args, **kwargs):
+        return retry_with_backoff(function, *args, retries=self.retries,
+                                  backoff=self.backoff, **kwargs)
+
+
+    @contextmanager
+    def _load_lock(self, key):
+        # Counting the callers holding or waiting on a lock keeps it
+        # alive until the last one leaves, so all of them share it
+        with self._lock:
+            entry = self._load_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._load_locks[key]
+
+
+    def _evict(self):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._schedules.clear()
+
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._sessions
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+def retry_with_backoff(function,
+                       *args,
+                       retries=3,
+                       backoff=2.0,
+                       max_backoff=60.0,
+                       retry_on=TRANSIENT_ERRORS,
+                       **kwargs):
+    """
+    Call function, trying again after a growing, jittered delay while
+    it raises one of the retry_on errors. Other errors, and the last
+    transient one, are raised
+    """
+    for attempt in range(retries + 1):
+        try:
+            return function(*args, **kwargs)
+        except retry_on as error:
+            if attempt == retries:
+                raise
+            delay = min(backoff * 2 ** attempt, max_backoff) * random.uniform(0.5, 1.0)
+            tracer.count('session.retries')
+            print(f"{getattr(function, '__name__', 'Load')} failed ({error!r}), "
+                  f"retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+            time.sleep(delay)
+
+
+def load_fastf1_session(year, grand_prix, session_type='Race'):
+    # FastF1 is only imported once a session is actually needed
+    return get_fastf1().get_session(year, grand_prix, session_type)
+
+
+def load_fastf1_schedule(year):
+    return get_fastf1().get_event_schedule(year)
+
+
+# Pool shared by every collector unless one is passed explicitly
+shared_pool = SessionPool()
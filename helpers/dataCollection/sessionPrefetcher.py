@@ -0,0 +1,105 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from helpers.dataCollection.sessionPool import shared_pool
+
+# Sessions and parts every per-event collector reads, so one prefetch
+# covers geometry, weather, race telemetry and driver metrics
+EVENT_SESSIONS = (
+    ('Race', {'laps': True, 'telemetry': True, 'weather': True, 'messages': True}),
+    ('Q', {'laps': True}),
+)
+
+
+class SessionPrefetcher:
+    def __init__(self,
+                 races,
+                 session_pool=None,
+                 lookahead=2,
+                 threads=1,
+                 needs_sessions=None):
+        """
+        Loads the sessions of upcoming events in background threads
+        while the current event is being computed, so downloads and
+        parsing overlap with the collectors' CPU work
+
+        Parameters:
+        - races: Race calendar frame with year and location columns,
+                 in the order the events are collected
+        - session_pool: SessionPool the sessions are loaded into,
+                        defaults to the shared pool
+        - lookahead: Number of events loaded ahead of the one being
+                     collected. No more are submitted until the
+                     collection moves on, which bounds the memory held
+        - threads: Number of sessions loaded at the same time
+        - needs_sessions: Callable taking a calendar row, False for
+                          events whose collectors will not read a
+                          session, e.g. when every output is cached.
+                          Those events are not prefetched
+        """
+        self.races = races
+        self.session_pool = shared_pool if session_pool is None else session_pool
+        self.lookahead = lookahead
+        self.threads = threads
+        self.needs_sessions = needs_sessions
+        self._executor = None
+        self._futures = {}
+        self._next_submit = 0
+
+        # The current event and the look-ahead window must fit in the
+        # pool, or prefetched sessions are evicted before they are used
+        needed = (lookahead + 1) * len(EVENT_SESSIONS)
+        self.session_pool.max_sessions = max(self.session_pool.max_sessions, needed)
+
+
+    def __iter__(self):
+        """
+        Yield the rows of the calendar in order, with the sessions of
+        the following events loading in the background
+        """
+        with self:
+            for i in range(len(self.races)):
+                self._fill_window(i)
+                self._futures.pop(i, None)
+                yield self.races.iloc[i]
+
+
+    def __enter__(self):
+        self._executor = ThreadPoolExecutor(
+                    max_workers=self.threads,
+                    thread_name_prefix='session-prefetch'
+                )
+        return self
+
+
+    def __exit__(self, *exc_info):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        return False
+
+
+    def _fill_window(self, current):
+        end = min(current + self.lookahead + 1, len(self.races))
+        self._next_submit = max(self._next_submit, current)
+        while self._next_submit < end:
+            race = self.races.iloc[self._next_submit]
+            if self.needs_sessions is not None and not self.needs_sessions(race):
+                self._next_submit += 1
+                continue
+            self._futures[self._next_submit] = self._executor.submit(
+                        self._load_event, race['year'], race['location']
+                    )
+            self._next_submit += 1
+
+
+    def _load_event(self, year, grand_prix):
+        for session_type, parts in EVENT_SESSIONS:
+            try:
+                self.session_pool.get_session(year, grand_prix, session_type, **parts)
+            except Exception:
+                # Left to the collector, which loads the session again
+                # and reports the event as failed if it still can't
+                print(f"Prefetching {year} {grand_prix} {session_type} failed:")
+                traceback.print_exc()
@@ -0,0 +1,320 @@
+import zlib
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+
+# Points of the top ten finishers of a race
+RACE_POINTS = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+SPRINT_POINTS = [8, 7, 6, 5, 4, 3, 2, 1]
+COMPOUNDS = ['SOFT', 'MEDIUM', 'HARD']
+
+
+class SyntheticLaps(pd.DataFrame):
+    """
+    Laps frame offering the parts of the fastf1 Laps interface the
+    collectors use
+    """
+    _metadata = ['session']
+
+    @property
+    def _constructor(self):
+        return SyntheticLaps
+
+
+    def pick_drivers(self, identifiers):
+        if isinstance(identifiers, (str, int)):
+            identifiers = [identifiers]
+        laps = self[self['DriverNumber'].isin([str(i) for i in identifiers])]
+        laps.session = self.session
+        return laps
+
+
+    def pick_fastest(self):
+        laps = self[(self['IsPersonalBest'] == True) & self['LapTime'].notna()]
+        if len(laps) == 0:
+            return None
+        return laps.loc[laps['LapTime'].idxmin()]
+
+
+    def get_telemetry(self):
+        return self.session._telemetry(self)
+
+
+class SyntheticSession:
+    def __init__(self,
+                 year,
+                 grand_prix,
+                 session_type='Race',
+                 n_drivers=20,
+                 n_laps=57,
+                 hz=4,
+                 round_number=1,
+                 event_format='conventional'):
+        """
+        Deterministic stand-in for a fastf1 Session, generating laps,
+        position telemetry, weather and results at a realistic scale
+        without network access
+
+        Parameters:
+        - year: Racing season year
+        - grand_prix: Name of the Grand Prix event
+        - session_type: 'Race', 'Sprint' or 'Q'
+        - n_drivers: Number of drivers on the grid
+        - n_laps: Number of race laps
+        - hz: Telemetry samples per second
+        - round_number: Round of the event in the season
+        - event_format: fastf1 event format, e.g. 'sprint_qualifying'
+        """
+        self.year = int(year)
+        self.grand_prix = grand_prix
+        self.session_type = session_type
+        self.n_drivers = n_drivers
+        self.total_laps = n_laps if session_type != 'Sprint' else n_laps // 3
+        self.hz = hz
+        self.event = pd.Series({
+            'RoundNumber': round_number,
+            'Location': grand_prix,
+            'EventName': f'{grand_prix} Grand Prix',
+            'EventFormat': event_format,
+        })
+        self.drivers = [str(d + 1) for d in range(n_drivers)]
+        self._seed = zlib.crc32(f'{year}/{grand_prix}/{session_type}'.encode())
+        self._track = _track_shape(zlib.crc32(f'{grand_prix}'.encode()))
+        self.laps = None
+        self.weather_data = None
+        self.results = None
+        self._car_data = None
+
+
+    def load(self, laps=True, telemetry=True, weather=True, messages=True):
+        rng = np.random.default_rng(self._seed)
+        self.results = self._generate_results(rng)
+        if laps or telemetry:
+            self.laps = self._generate_laps(rng)
+        if weather:
+            self.weather_data = self._generate_weather(rng)
+
+
+    @property
+    def car_data(self):
+        # Generated on first use, as few callers need it
+        if self._car_data is None:
+            self._car_data = self._generate_car_data()
+        return self._car_data
+
+
+    def get_driver(self, identifier):
+        return self.results.set_index('DriverNumber').loc[str(identifier)]
+
+
+    def get_circuit_info(self):
+        return SimpleNamespace(corners=self._track['corners'])
+
+
+    def _generate_results(self, rng):
+        order = rng.permutation(self.drivers)
+        points = RACE_POINTS if self.session_type == 'Race' else \
+                    SPRINT_POINTS if self.session_type == 'Sprint' else []
+        return pd.DataFrame({
+            'DriverNumber': order,
+            'Position': np.arange(1, self.n_drivers + 1, dtype=float),
+            'Points': [
+                float(points[i]) if i < len(points) else 0.0
+                for i in range(self.n_drivers)
+            ],
+        })
+
+
+    def _generate_laps(self, rng):
+        n_laps = self.total_laps if self.session_type != 'Q' else 18
+        base = self._track['lap_time']
+        rows = []
+        for driver in self.drivers:
+            pace = rng.normal(0, 0.4)
+            stint_length = rng.integers(12, 30)
+            lap_number = np.arange(1, n_laps + 1)
+            tyre_life = (lap_number - 1) % stint_length + 1
+            compound = np.array(COMPOUNDS)[((lap_number - 1) // stint_length + rng.integers(0, 3)) % 3]
+            sectors = base / 3 + pace / 3 + 0.03 * tyre_life[:, None] \
+                        + rng.normal(0, 0.15, size=(n_laps, 3))
+            lap_time = sectors.sum(axis=1)
+            start = 3600 + np.concatenate(([0.0], np.cumsum(lap_time)[:-1]))
+            best_so_far = np.minimum.accumulate(lap_time)
+            rows.append(pd.DataFrame({
+                'DriverNumber': driver,
+                'LapNumber': lap_number.astype(float),
+                'LapStartTime': pd.to_timedelta(start, unit='s'),
+                'LapTime': pd.to_timedelta(lap_time, unit='s'),
+                'Time': pd.to_timedelta(start + lap_time, unit='s'),
+                'Sector1Time': pd.to_timedelta(sectors[:, 0], unit='s'),
+                'Sector2Time': pd.to_timedelta(sectors[:, 1], unit='s'),
+                'Sector3Time': pd.to_timedelta(sectors[:, 2], unit='s'),
+                'Compound': compound,
+                'TyreLife': tyre_life.astype(float),
+                'TrackStatus': np.where(rng.random(n_laps) < 0.08, '4', '1'),
+                'IsPersonalBest': lap_time <= best_so_far,
+                'Deleted': rng.random(n_laps) < 0.01,
+            }))
+
+        laps = SyntheticLaps(pd.concat(rows, ignore_index=True))
+        laps.session = self
+        return laps
+
+
+    def _generate_weather(self, rng):
+        duration = 3600 + self.total_laps * self._track['lap_time'] + 1800
+        time = np.arange(0, duration, 60.0)
+        n = len(time)
+        return pd.DataFrame({
+            'Time': pd.to_timedelta(time, unit='s'),
+            'AirTemp': 24 + np.cumsum(rng.normal(0, 0.05, n)),
+            'TrackTemp': 38 + np.cumsum(rng.normal(0, 0.1, n)),
+            'Humidity': np.clip(50 + np.cumsum(rng.normal(0, 0.3, n)), 10, 100),
+            'WindSpeed': np.abs(2 + np.cumsum(rng.normal(0, 0.05, n))),
+            'Rainfall': np.zeros(n, dtype=bool),
+        })
+
+
+    def _generate_car_data(self):
+        """
+        Car telemetry of every driver from the start of the first lap to
+        the end of the last, with speed following the corners
+        """
+        rng = np.random.default_rng(self._seed + 1)
+        n_corners = len(self._track['corners'])
+        car_data = {}
+        for driver, laps in self.laps.groupby('DriverNumber', sort=False):
+            starts = laps['LapStartTime'].dt.total_seconds().to_numpy()
+            durations = laps['LapTime'].dt.total_seconds().to_numpy()
+            time = np.arange(starts[0], starts[-1] + durations[-1], 1 / self.hz)
+            lap = np.searchsorted(starts, time, side='right') - 1
+            progress = (time - starts[lap]) / durations[lap]
+
+            speed = np.clip(
+                        215 + 95 * np.cos(2 * np.pi * n_corners * progress)
+                            + rng.normal(0, 3, len(time)),
+                        60, 340
+                    )
+            throttle = np.clip((speed - 110) / 1.6, 0, 100)
+            car_data[driver] = pd.DataFrame({
+                'SessionTime': pd.to_timedelta(time, unit='s'),
+                'Speed': speed.round(),
+                'RPM': (7000 + 5000 * (speed % 42) / 42).round(),
+                'nGear': np.clip(speed // 42 + 1, 1, 8),
+                'Throttle': throttle.round(),
+                'Brake': throttle < 5,
+                'DRS': np.where(speed > 300, 12, 0),
+            })
+        return car_data
+
+
+    def _telemetry(self, laps):
+        """
+        Position samples along the track for the given laps, in the
+        fastf1 unit of 1/10 metres
+        """
+        rng = np.random.default_rng(self._seed + len(laps))
+        frames = []
+        for lap in laps.itertuples():
+            duration = lap.LapTime.total_seconds()
+            n = max(int(duration * self.hz), 2)
+            progress = np.linspace(0, 1, n, endpoint=False)
+            x, y, z = self._track['position'](progress)
+            frames.append(pd.DataFrame({
+                'SessionTime': lap.LapStartTime + pd.to_timedelta(progress * duration, unit='s'),
+                'X': (x + rng.normal(0, 0.3, n)) * 10,
+                'Y': (y + rng.normal(0, 0.3, n)) * 10,
+                'Z': z * 10,
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+
+class SyntheticSessionLoader:
+    def __init__(self,
+                 n_drivers=20,
+                 n_laps=57,
+                 hz=4,
+                 n_rounds=22):
+        """
+        Drop-in replacement for fastf1.get_session and
+        fastf1.get_event_schedule, to pass to a SessionPool
+
+        Parameters:
+        - n_drivers: Number of drivers on the grid
+        - n_laps: Number of race laps
+        - hz: Telemetry samples per second
+        - n_rounds: Number of events in a season
+        """
+        self.n_drivers = n_drivers
+        self.n_laps = n_laps
+        self.hz = hz
+        self.n_rounds = n_rounds
+
+
+    def __call__(self, year, grand_prix, session_type='Race'):
+        schedule = self.get_event_schedule(year)
+        if isinstance(grand_prix, (int, np.integer)):
+            event = schedule[schedule['RoundNumber'] == grand_prix].iloc[0]
+        else:
+            event = schedule[schedule['Location'] == grand_prix].iloc[0]
+        return SyntheticSession(
+                    year, event['Location'], session_type,
+                    n_drivers=self.n_drivers,
+                    n_laps=self.n_laps,
+                    hz=self.hz,
+                    round_number=int(event['RoundNumber']),
+                    event_format=event['EventFormat']
+                )
+
+
+    def get_event_schedule(self, year):
+        rounds = np.arange(1, self.n_rounds + 1)
+        return pd.DataFrame({
+            'RoundNumber': rounds,
+            'EventName': [f'Synthetic {r} Grand Prix' for r in rounds],
+            'Location': [f'Synthetic {r}' for r in rounds],
+            'Country': 'Nowhere',
+            'EventDate': pd.date_range(f'{int(year)}-03-01', periods=self.n_rounds, freq='14D'),
+            # Every fourth event is a sprint weekend
+            'EventFormat': ['sprint_qualifying' if r % 4 == 0 else 'conventional' for r in rounds],
+        })
+
+
+def use_synthetic_sessions(session_pool, **kwargs):
+    """
+    Make a SessionPool serve synthetic sessions and schedules
+
+    Parameters:
+    - session_pool: Pool whose loaders are replaced
+    - kwargs: Passed to SyntheticSessionLoader
+    """
+    loader = SyntheticSessionLoader(**kwargs)
+    session_pool.clear()
+    session_pool.loader = loader
+    session_pool.schedule_loader = loader.get_event_schedule
+    return loader
+
+
+def _track_shape(seed):
+    """
+    Closed track of about 5 km with elevation changes and corners
+    """
+    rng = np.random.default_rng(seed)
+    harmonics = rng.normal(0, 1, size=(3, 2))
+
+    def position(progress):
+        theta = 2 * np.pi * progress
+        x = 1200 * np.cos(theta) + 150 * np.cos(3 * theta + harmonics[0, 0])
+        y = 500 * np.sin(theta) + 120 * np.sin(2 * theta + harmonics[1, 1])
+        z = 10 * np.sin(theta + harmonics[2, 0]) + 3 * np.sin(5 * theta)
+        return x, y, z
+
+    n_corners = int(rng.integers(12, 20))
+    return {
+        'position': position,
+        'lap_time': float(rng.uniform(75, 100)),
+        'corners': pd.DataFrame({
+            'Number': np.arange(1, n_corners + 1),
+            'Distance': np.sort(rng.uniform(0, 5000, n_corners)),
+        }),
+    }
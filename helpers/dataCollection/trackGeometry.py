@@ -1,80 +1,154 @@
 import numpy as np
-import fastf1
-from scipy.spatial.distance import euclidean
+from helpers.dataCollection.circuitIndex import circuit_indexes
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.profiling import traced
 
-# Enable Caching
-fastf1.Cache.enable_cache('Cache/')
 
 class TrackGeometryAnalyzer:
     def __init__(self,
                  year,
-                 grand_prix):
+                 grand_prix,
+                 session_pool=None,
+                 drivers=None,
+                 finishers=None,
+                 reference_lap=False,
+                 circuit_index_cache=None):
         """
         Parameters:
         - year: Racing season year
         - grand_prix: Name of the Grand Prix event
+        - session_pool: SessionPool to take the session from,
+                        defaults to the shared pool
+        - drivers: Driver numbers whose laps the geometry is averaged
+                   over, defaults to the first classified driver
+        - finishers: Average over this many classified finishers
+                     instead, when drivers is not given
+        - reference_lap: Summarize the raw telemetry of the reference
+                         lap of the layout's circuit index instead,
+                         shared by every event run on the layout
+        - circuit_index_cache: CircuitIndexCache the layout's index is
+                               taken from, defaults to the shared one
         """
-        self.session = fastf1.get_session(year, grand_prix, 'Race')
-        self.session.load()
-        self.driver = self.session.drivers[0]
-        self.circuit_info = self.session.get_circuit_info()
+        session_pool = shared_pool if session_pool is None else session_pool
+        self.session = session_pool.get_session(
+                                year, grand_prix, 'Race',
+                                laps=True, telemetry=True
+                            )
+        if drivers is not None:
+            self.drivers = list(drivers)
+        elif finishers is not None:
+            self.drivers = classified_finishers(self.session, finishers)
+        else:
+            self.drivers = self.session.drivers[:1]
+        self.reference_lap = reference_lap
+        self.circuit_indexes = circuit_indexes if circuit_index_cache is None \
+                                    else circuit_index_cache
     
     
+    @traced()
     def calculate_track_geometry(self):
         """
-        Comprehensive track geometry calculation
+        Comprehensive track geometry calculation, averaged over the
+        selected drivers or from the layout's reference lap
+        """
+        if self.reference_lap:
+            try:
+                index = self.circuit_indexes.get(self.session)
+            except ValueError:
+                # No lap to trace the layout from, so the drivers' laps
+                # are summarized instead
+                index = None
+            if index is not None:
+                geometry = summarize_track_geometry(
+                                track_geometry_arrays(index.trace),
+                                total_laps=1,
+                                number_of_corners=len(index.corner_numbers)
+                            )
+                geometry['TotalLaps'] = self.session.total_laps
+                return geometry
+
+        number_of_corners = len(self.session.get_circuit_info().corners)
+        geometries = [
+            summarize_track_geometry(
+                track_geometry_arrays(self.get_driver_positions(driver)),
+                total_laps=self.session.total_laps,
+                number_of_corners=number_of_corners
+            )
+            for driver in self.drivers
+        ]
+        
+        # Return comprehensive track geometry
+        return {
+            key: geometries[0][key] if key in ('TotalLaps', 'NumberOfCorners')
+                    else np.mean([geometry[key] for geometry in geometries])
+            for key in geometries[0]
+        }
+
+
+    def get_driver_positions(self, driver):
+        """
+        All laps' X, Y, Z positions of one driver as an (n, 3) array
+        in metres
         """
-        # Collect all laps' telemetry
         telemetry = self.session\
                         .laps\
-                        .pick_drivers(self.driver)\
+                        .pick_drivers(driver)\
                         .get_telemetry()
         
         # Default unit is 1/10 metres
-        for col in ['X', 'Y', 'Z']:
-            telemetry[col] = telemetry[col] / 10
-        
-        # Calculate track length
-        def calculate_track_length(telemetry):
-            # Calculate cumulative distance using Euclidean distance between points
-            distances = [
-                            euclidean(
-                                telemetry.iloc[i][['X', 'Y', 'Z']], 
-                                telemetry.iloc[i + 1][['X', 'Y', 'Z']]
-                            ) 
-                            for i in range(len(telemetry) - 1)
-                        ]
-            return np.sum(distances) / self.session.total_laps
-        
-        # Calculate elevation changes
-        def calculate_elevation_profile(telemetry):
-            z_data = telemetry['Z']
-            return {
-                'MaxElevation': z_data.max(),
-                'MinElevation': z_data.min(),
-                'TotalElevationChange': z_data.max() - z_data.min(),
-                'ElevationSD': z_data.std()
-            }
-        
-        # Calculate track curvature
-        def calculate_track_curvature(telemetry):
-            # Calculate angle changes between consecutive points
-            dx = np.diff(telemetry['X'])
-            dy = np.diff(telemetry['Y'])
-            angles = np.arctan2(dy, dx)
-            angle_changes = np.diff(angles)
-            
-            return {
-                'NumberOfCorners': len(self.circuit_info.corners),
-                'TotalCurvature': np.sum(np.abs(angle_changes)) / self.session.total_laps,
-                'MaxCurvature': np.max(np.abs(angle_changes)),
-                'CurvatureSD': np.std(angle_changes)
-            }
-        
-        # Return comprehensive track geometry
-        return {
-            'TrackLength': calculate_track_length(telemetry),
-            'TotalLaps': self.session.total_laps,
-            **calculate_elevation_profile(telemetry),
-            **calculate_track_curvature(telemetry)
-        }
\ No newline at end of file
+        return telemetry[['X', 'Y', 'Z']].to_numpy(dtype=np.float64) / 10
+
+
+def classified_finishers(session, n):
+    """
+    Driver numbers of the first n classified finishers of a session
+    """
+    results = session.results.dropna(subset=['Position']).sort_values('Position')
+    return [str(driver) for driver in results['DriverNumber'].iloc[:n]]
+
+
+def track_geometry_arrays(positions):
+    """
+    Distance, cumulative distance, elevation and heading change of a
+    position trace, computed in one pass over contiguous arrays
+
+    Parameters:
+    - positions: (n, 3) array of X, Y, Z positions in metres
+    """
+    positions = np.ascontiguousarray(positions, dtype=np.float64)
+    steps = np.diff(positions, axis=0)
+    
+    # Euclidean distance between consecutive points
+    distance = np.sqrt(np.einsum('ij,ij->i', steps, steps))
+    
+    # Angle changes between consecutive points
+    angles = np.arctan2(steps[:, 1], steps[:, 0])
+    
+    return {
+        'Distance': distance,
+        'CumulativeDistance': np.concatenate(([0.0], np.cumsum(distance))),
+        'Elevation': positions[:, 2],
+        'AngleChanges': np.diff(angles)
+    }
+
+
+def summarize_track_geometry(arrays,
+                             total_laps,
+                             number_of_corners):
+    """
+    Reduce the arrays of track_geometry_arrays to per-lap track metrics
+    """
+    elevation = arrays['Elevation']
+    angle_changes = arrays['AngleChanges']
+    return {
+        'TrackLength': np.sum(arrays['Distance']) / total_laps,
+        'TotalLaps': total_laps,
+        'MaxElevation': np.nanmax(elevation),
+        'MinElevation': np.nanmin(elevation),
+        'TotalElevationChange': np.nanmax(elevation) - np.nanmin(elevation),
+        'ElevationSD': np.nanstd(elevation, ddof=1),
+        'NumberOfCorners': number_of_corners,
+        'TotalCurvature': np.sum(np.abs(angle_changes)) / total_laps,
+        'MaxCurvature': np.max(np.abs(angle_changes)),
+        'CurvatureSD': np.std(angle_changes)
+    }
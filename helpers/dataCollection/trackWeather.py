@@ -1,63 +1,85 @@
-import fastf1
 import pandas as pd
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.profiling import traced
 
-# Enable Caching
-fastf1.Cache.enable_cache('Cache/')
 
 class TrackWeatherAnalyzer:
     def __init__(self,
                  year,
-                 grand_prix):
+                 grand_prix,
+                 session_pool=None):
         """
         Parameters:
         - year: Racing season year
         - grand_prix: Name of the Grand Prix event
+        - session_pool: SessionPool to take the session from,
+                        defaults to the shared pool
         """
-        self.session = fastf1.get_session(year, grand_prix, 'Race')
-        self.session.load()
+        session_pool = shared_pool if session_pool is None else session_pool
+        self.session = session_pool.get_session(
+                                year, grand_prix, 'Race',
+                                weather=True
+                            )
 
 
+    @traced()
     def engineer_weather_features(self):
         """
         Create advanced weather features for machine learning
         """
-        features = pd.DataFrame({
-            'Time': self.session.weather_data['Time'],
-            
-            # Temperature-related features
-            'AirTemp': self.session.weather_data['AirTemp'],
-            'TrackTemp': self.session.weather_data['TrackTemp'],
-            'Rain': self.session.weather_data['Rainfall'],
-
-            # Humidity and wind complexity
-            'HumidityWindInteraction': \
-                self.session.weather_data['Humidity'] \
-                    * self.session.weather_data['WindSpeed'],
-            'WindChillFactor': \
-                self.calculate_wind_chill(
-                            self.session.weather_data['AirTemp'], 
-                            self.session.weather_data['WindSpeed']
-                        ),
-            
-            # Track surface condition indicators
-            'SurfaceGripIndex': self.calculate_surface_grip(
-                self.session.weather_data['TrackTemp'], 
-                self.session.weather_data['Humidity']
-            )
-        })
-        return features
+        return engineer_weather_features(self.session.weather_data)
 
 
     def calculate_wind_chill(self, temp, wind_speed):
-        """
-        Calculate wind chill factor
-        """
-        return 13.12 + (0.6215 * temp) - (11.37 * (wind_speed**0.16)) + (0.3965 * temp * (wind_speed**0.16))
+        return wind_chill(temp, wind_speed)
 
 
     def calculate_surface_grip(self, temp, humidity):
-        """
-        Estimate track surface grip based on weather conditions
-        """
-        # Complex calculation considering temperature and humidity
-        return (temp * (100 - humidity)) / 100
\ No newline at end of file
+        return surface_grip(temp, humidity)
+
+
+def engineer_weather_features(weather_data):
+    """
+    Weather features of FastF1 weather samples, or of any frame with
+    the same columns, e.g. conditions sent to the prediction server
+    """
+    features = pd.DataFrame({
+        # Temperature-related features
+        'AirTemp': weather_data['AirTemp'],
+        'TrackTemp': weather_data['TrackTemp'],
+        'Rain': weather_data['Rainfall'],
+
+        # Humidity and wind complexity
+        'HumidityWindInteraction': \
+            weather_data['Humidity'] \
+                * weather_data['WindSpeed'],
+        'WindChillFactor': \
+            wind_chill(
+                        weather_data['AirTemp'], 
+                        weather_data['WindSpeed']
+                    ),
+        
+        # Track surface condition indicators
+        'SurfaceGripIndex': surface_grip(
+            weather_data['TrackTemp'], 
+            weather_data['Humidity']
+        )
+    })
+    if 'Time' in weather_data:
+        features.insert(0, 'Time', weather_data['Time'])
+    return features
+
+
+def wind_chill(temp, wind_speed):
+    """
+    Calculate wind chill factor
+    """
+    return 13.12 + (0.6215 * temp) - (11.37 * (wind_speed**0.16)) + (0.3965 * temp * (wind_speed**0.16))
+
+
+def surface_grip(temp, humidity):
+    """
+    Estimate track surface grip based on weather conditions
+    """
+    # Complex calculation considering temperature and humidity
+    return (temp * (100 - humidity)) / 100
@@ -1,5 +1,23 @@
+import pandas as pd
+
+
+def to_session_seconds(time):
+    """
+    Session times in seconds, from timedeltas or from fractions of a
+    day as read back from Excel
+    """
+    if pd.api.types.is_timedelta64_dtype(time):
+        return time.dt.total_seconds()
+    return time * 24 * 3600
+
+
 def quantize_time(df,
                   time_col='Time'):
-    df[time_col + 'Quant'] = (df[time_col] * 10**5 // 60).astype(int)
+    time = df[time_col]
+    # Session times are timedeltas, or fractions of a day when read
+    # back from Excel
+    if pd.api.types.is_timedelta64_dtype(time):
+        time = time / pd.Timedelta(days=1)
+    df[time_col + 'Quant'] = (time * 10**5 // 60).astype(int)
 
-    return df
\ No newline at end of file
+    return df
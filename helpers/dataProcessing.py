@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+
+def asof_join(left,
+              right,
+              left_on,
+              right_on,
+              by=('year', 'round'),
+              tolerance=None,
+              interpolate=None):
+    """
+    Attach to every left row the right row of the same event nearest in
+    time, using one sorted search over all events at once
+
+    Parameters:
+    - left, right: Frames with the `by` event columns and a time column
+                   in seconds
+    - left_on, right_on: Time columns of the left and right frames
+    - by: Columns identifying an event; rows only match within one
+    - tolerance: Largest time difference, in seconds, still matched
+    - interpolate: Numeric right columns interpolated linearly between
+                   the samples around the left time instead of taken
+                   from the nearest one
+
+    Returns the left frame with the right columns added, unmatched rows
+    holding NaN, and the share of left rows that found a match
+    """
+    by = list(by)
+    left = left.reset_index(drop=True)
+    right = right[right[right_on].notna()].reset_index(drop=True)
+    if len(right) == 0:
+        matched = pd.DataFrame(
+                        np.nan,
+                        index=left.index,
+                        columns=right.columns.drop(by)
+                    )
+        return _attach(left, matched), 0.0
+
+    # Integer code per event, shared by both sides
+    events = pd.MultiIndex.from_frame(
+                    pd.concat([left[by], right[by]], ignore_index=True)
+                )
+    codes, _ = pd.factorize(events)
+    left_codes, right_codes = codes[:len(left)], codes[len(left):]
+
+    left_time = left[left_on].to_numpy(dtype=np.float64)
+    right_time = right[right_on].to_numpy(dtype=np.float64)
+
+    # Lay events end to end on one axis, so a single searchsorted
+    # finds the neighbours of every left row within its own event
+    origin = min(np.nanmin(left_time, initial=np.inf), right_time.min())
+    span = max(np.nanmax(left_time, initial=-np.inf), right_time.max()) - origin + 1
+    right_key = right_codes * span + (right_time - origin)
+    order = np.argsort(right_key, kind='stable')
+    right_key = right_key[order]
+    right_codes, right_time = right_codes[order], right_time[order]
+
+    # Missing left times sort past the end and never match
+    n = len(right_key)
+    position = np.searchsorted(right_key, left_codes * span + (left_time - origin))
+    before = np.clip(position - 1, 0, n - 1)
+    after = np.clip(position, 0, n - 1)
+    has_before = (position > 0) & (right_codes[before] == left_codes)
+    has_after = (position < n) & (right_codes[after] == left_codes)
+
+    gap_before = np.where(has_before, left_time - right_time[before], np.inf)
+    gap_after = np.where(has_after, right_time[after] - left_time, np.inf)
+    nearest = np.where(gap_before <= gap_after, before, after)
+    gap = np.minimum(gap_before, gap_after)
+    hit = np.isfinite(gap)
+    if tolerance is not None:
+        hit &= gap <= tolerance
+
+    matched = right.drop(columns=by)\
+                    .reindex(np.where(hit, order[nearest], -1))\
+                    .reset_index(drop=True)
+
+    for col in interpolate or []:
+        values = right[col].to_numpy(dtype=np.float64)[order]
+        both = hit & has_before & has_after & (right_time[after] > right_time[before])
+        weight = np.where(
+                    both,
+                    gap_before / np.where(both, right_time[after] - right_time[before], 1),
+                    0
+                )
+        interpolated = values[before] + weight * (values[after] - values[before])
+        matched[col] = np.where(both, interpolated, matched[col].to_numpy(dtype=np.float64))
+
+    return _attach(left, matched), float(hit.mean()) if len(left) > 0 else 0.0
+
+
+def _attach(left, matched):
+    matched.columns = [
+        col + '_r' if col in left.columns else col
+        for col in matched.columns
+    ]
+    return pd.concat([left, matched], axis=1)
@@ -0,0 +1,212 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Files of a model matrix folder
+FEATURES_FILE = 'features.npy'
+TARGET_FILE = 'target.npy'
+KEYS_FILE = 'keys.npy'
+COLUMNS_FILE = 'columns.json'
+
+
+class LapFeatureBuilder:
+    def __init__(self,
+                 categories=None,
+                 category_column='Compound',
+                 scale_column='TyreLife',
+                 passthrough_columns=()):
+        """
+        Builds the model features of a lap table: one column per
+        category scaled by another column, e.g. the tyre life on each
+        compound, followed by columns passed through as float32. The
+        interaction is computed from the category codes, so no one-hot
+        matrix is materialized
+
+        Parameters:
+        - categories: Categories given a column, in order, learnt from
+                      the data by fit when None
+        - category_column: Column holding the category of every row
+        - scale_column: Column the category indicator is multiplied by
+        - passthrough_columns: Feature columns copied as they are
+        """
+        self.categories = None if categories is None else list(categories)
+        self.category_column = category_column
+        self.scale_column = scale_column
+        self.passthrough_columns = list(passthrough_columns)
+        self.categories_ = None
+
+
+    def fit(self, df):
+        """
+        Fix the categories, so every later transform gives the same
+        columns whatever categories its rows hold
+        """
+        if self.categories is not None:
+            self.categories_ = list(self.categories)
+        else:
+            self.categories_ = sorted(df[self.category_column].dropna().astype(str).unique())
+        return self
+
+
+    def transform(self, df):
+        """
+        Interaction and passthrough features of df, as float32 columns
+        of a frame sharing its index
+        """
+        codes, scale = self._codes(df)
+        features = {
+            name: np.where(codes == i, scale, np.float32(0))
+            for i, name in enumerate(self.interaction_columns())
+        }
+        for column in self.passthrough_columns:
+            features[column] = df[column].to_numpy(dtype=np.float32)
+        return pd.DataFrame(features, index=df.index)
+
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+
+    def interaction_matrix(self, df):
+        """
+        The interaction features alone as a sparse matrix, holding one
+        value per row of a known category
+        """
+        from scipy import sparse
+
+        codes, scale = self._codes(df)
+        rows = np.flatnonzero(codes >= 0)
+        return sparse.csr_matrix(
+                    (scale[rows], (rows, codes[rows])),
+                    shape=(len(df), len(self.categories_)),
+                    dtype=np.float32
+                )
+
+
+    def interaction_columns(self):
+        return [f'{self.category_column}_{category}' for category in self.categories_]
+
+
+    def feature_names_out(self):
+        return self.interaction_columns() + self.passthrough_columns
+
+
+    def to_dict(self):
+        return {
+            'categories': self.categories_,
+            'category_column': self.category_column,
+            'scale_column': self.scale_column,
+            'passthrough_columns': self.passthrough_columns,
+        }
+
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Fitted builder from the state stored by to_dict
+        """
+        builder = cls(**state)
+        return builder.fit(None)
+
+
+    def _codes(self, df):
+        if self.categories_ is None:
+            raise ValueError("LapFeatureBuilder must be fitted before transforming")
+        # Unknown categories get code -1 and no interaction value
+        codes = pd.Categorical(
+                    df[self.category_column].astype(str),
+                    categories=self.categories_
+                ).codes
+        scale = df[self.scale_column].to_numpy(dtype=np.float32)
+        return codes, scale
+
+
+def write_model_matrix(store,
+                       stage,
+                       table,
+                       path,
+                       feature_columns,
+                       target_column='LapTime',
+                       key_columns=('year', 'round', 'DriverNumber'),
+                       builder=None):
+    """
+    Copy a partitioned table into .npy files that np.load can memory-map:
+    float32 features, the float64 target and int32 keys, plus a JSON
+    list of the columns. The files are allocated at their final size
+    and filled one partition at a time, so the table is never held whole
+
+    Parameters:
+    - store: DataStore the table is read from
+    - stage, table: Table holding the model data
+    - path: Folder the matrix files are written to
+    - feature_columns: Columns of the feature matrix, in order
+    - target_column: Column the model predicts
+    - key_columns: Columns identifying the rows, e.g. for grouped splits
+    - builder: Fitted LapFeatureBuilder whose state is stored with the
+               columns, so new laps can be given the same features
+    """
+    key_columns = list(key_columns)
+    partitions = store.partitions(stage, table)
+    rows = {
+        partition: len(store.read(
+                    stage, table,
+                    columns=[target_column],
+                    filters=[('year', '==', partition[0]), ('round', '==', partition[1])]
+                ))
+        for partition in partitions
+    }
+    n_rows = sum(rows.values())
+
+    os.makedirs(path, exist_ok=True)
+    features = np.lib.format.open_memmap(
+                    os.path.join(path, FEATURES_FILE), mode='w+',
+                    dtype=np.float32, shape=(n_rows, len(feature_columns))
+                )
+    target = np.lib.format.open_memmap(
+                    os.path.join(path, TARGET_FILE), mode='w+',
+                    dtype=np.float64, shape=(n_rows,)
+                )
+    keys = np.lib.format.open_memmap(
+                    os.path.join(path, KEYS_FILE), mode='w+',
+                    dtype=np.int32, shape=(n_rows, len(key_columns))
+                )
+
+    start = 0
+    columns = list(feature_columns) + [target_column] + key_columns
+    for partition, df in store.iter_partitions(stage, table, columns=columns, partitions=partitions):
+        end = start + rows[partition]
+        features[start:end] = df[list(feature_columns)].to_numpy(dtype=np.float32)
+        target[start:end] = df[target_column].to_numpy(dtype=np.float64)
+        keys[start:end] = df[key_columns].to_numpy(dtype=np.int32)
+        start = end
+
+    for array in (features, target, keys):
+        array.flush()
+    del features, target, keys
+
+    with open(os.path.join(path, COLUMNS_FILE), 'w') as f:
+        json.dump({
+            'features': list(feature_columns),
+            'target': target_column,
+            'keys': key_columns,
+            'rows': n_rows,
+            'builder': builder.to_dict() if builder is not None else None,
+        }, f, indent=2)
+
+    return n_rows
+
+
+def load_model_matrix(path, mmap_mode='r'):
+    """
+    Features, target, keys and column description written by
+    write_model_matrix, memory-mapped instead of read into memory
+    """
+    with open(os.path.join(path, COLUMNS_FILE)) as f:
+        columns = json.load(f)
+    return (
+        np.load(os.path.join(path, FEATURES_FILE), mmap_mode=mmap_mode),
+        np.load(os.path.join(path, TARGET_FILE), mmap_mode=mmap_mode),
+        np.load(os.path.join(path, KEYS_FILE), mmap_mode=mmap_mode),
+        columns,
+    )
@@ -0,0 +1,253 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import time
+from functools import lru_cache
+from helpers.config import cache_path
+
+
+class FeatureCache:
+    def __init__(self,
+                 path=None,
+                 max_bytes=2 * 1024**3,
+                 enabled=True,
+                 evict_every=100):
+        """
+        Cache of collector outputs, keyed by event, collector code
+        version and parameters, so unchanged events are not recomputed
+
+        Every entry is a pickle with a JSON sidecar describing it; the
+        sidecar's modification time records when it was last used
+
+        Parameters:
+        - path: Folder the entries are stored in, defaults to
+                Features/ in the configured cache folder
+        - max_bytes: Total size above which least recently used entries
+                     are evicted
+        - enabled: Compute every value without caching when False
+        - evict_every: Entries written between two evictions, as an
+                       eviction scans the whole cache
+        """
+        self._path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.evict_every = evict_every
+        self._writes = 0
+
+
+    @property
+    def path(self):
+        # Resolved on use, as the shared cache is created before configure()
+        return cache_path('Features') if self._path is None else self._path
+
+
+    def get_or_compute(self,
+                       collector,
+                       method,
+                       year,
+                       grand_prix,
+                       compute,
+                       params=None):
+        """
+        Return the cached output of collector.method for an event, or
+        compute and store it
+
+        Parameters:
+        - collector: Collector class, whose module source sets the version
+        - method: Name of the collector method producing the value
+        - year: Racing season year
+        - grand_prix: Name of the Grand Prix event
+        - compute: Callable producing the value on a cache miss
+        - params: JSON-serialisable parameters the value depends on
+        """
+        if not self.enabled:
+            return compute()
+
+        description = self._describe(collector, method, year, grand_prix, params)
+        key = _entry_key(description)
+
+        value_path, description_path = self._entry_paths(key)
+        if os.path.exists(value_path) and os.path.exists(description_path):
+            with open(value_path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(description_path)
+            return value
+
+        value = compute()
+        os.makedirs(self.path, exist_ok=True)
+        # Written aside and renamed, as collection workers share the cache
+        temp_path = f'{value_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, value_path)
+        with open(description_path, 'w') as f:
+            json.dump(description, f, indent=2)
+
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict()
+        return value
+
+
+    def contains(self,
+                 collector,
+                 method,
+                 year,
+                 grand_prix,
+                 params=None):
+        """
+        Whether get_or_compute would return a stored value for these
+        arguments without computing it
+        """
+        if not self.enabled:
+            return False
+        key = _entry_key(self._describe(collector, method, year, grand_prix, params))
+        return all(os.path.exists(path) for path in self._entry_paths(key))
+
+
+    def _describe(self, collector, method, year, grand_prix, params):
+        return {
+            'module': collector.__module__,
+            'collector': collector.__name__,
+            'method': method,
+            'version': collector_version(collector),
+            'year': int(year),
+            'grand_prix': grand_prix,
+            'params': params or {},
+        }
+
+
+    def entries(self):
+        """
+        Description, size, last use and staleness of every entry, most
+        recently used first
+        """
+        if not os.path.isdir(self.path):
+            return []
+
+        entries = []
+        for file_name in os.listdir(self.path):
+            if not file_name.endswith('.json'):
+                continue
+            key = file_name[:-len('.json')]
+            value_path, description_path = self._entry_paths(key)
+            try:
+                with open(description_path) as f:
+                    description = json.load(f)
+                size = os.path.getsize(value_path)
+                last_used = os.path.getmtime(description_path)
+            except (OSError, ValueError):
+                continue
+            entries.append({
+                'key': key,
+                **description,
+                'size': size,
+                'last_used': last_used,
+                'stale': _is_stale(description),
+            })
+
+        return sorted(entries, key=lambda entry: entry['last_used'], reverse=True)
+
+
+    def evict(self, max_bytes=None):
+        """
+        Remove least recently used entries until the cache fits in
+        max_bytes, defaulting to the cache's own bound
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(entry['size'] for entry in entries)
+        removed = []
+        while entries and total > max_bytes:
+            entry = entries.pop()
+            self.remove(entry['key'])
+            total -= entry['size']
+            removed.append(entry)
+        return removed
+
+
+    def prune(self, stale=True, collector=None, older_than=None):
+        """
+        Remove stale entries, entries of one collector, or entries not
+        used for older_than seconds
+        """
+        now = time.time()
+        removed = []
+        for entry in self.entries():
+            if (stale and entry['stale']) \
+                    or (collector is not None and entry['collector'] == collector) \
+                    or (older_than is not None and now - entry['last_used'] > older_than):
+                self.remove(entry['key'])
+                removed.append(entry)
+        return removed
+
+
+    def remove(self, key):
+        for path in self._entry_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+    def _entry_paths(self, key):
+        return (
+            os.path.join(self.path, key + '.pkl'),
+            os.path.join(self.path, key + '.json'),
+        )
+
+
+def _entry_key(description):
+    return hashlib.sha256(
+                json.dumps(description, sort_keys=True, default=str).encode()
+            ).hexdigest()
+
+
+def collector_version(collector):
+    """
+    Digest of the source of the module defining a collector and of
+    every helpers module it imports, directly or not, so any change to
+    the collector or the code it depends on invalidates its entries
+    """
+    return _module_version(collector.__module__)
+
+
+@lru_cache(maxsize=None)
+def _module_version(module_name):
+    digest = hashlib.sha256()
+    for name in sorted(_helper_dependencies(module_name)):
+        digest.update(name.encode())
+        digest.update(inspect.getsource(sys.modules[name]).encode())
+    return digest.hexdigest()[:12]
+
+
+def _helper_dependencies(module_name, found=None):
+    """
+    Names of the helpers modules a module imports, from the modules and
+    objects in its namespace, followed recursively, itself included
+    """
+    found = set() if found is None else found
+    found.add(module_name)
+    for value in vars(sys.modules[module_name]).values():
+        dependency = inspect.getmodule(value)
+        name = getattr(dependency, '__name__', '')
+        if name.startswith('helpers.') and name not in found:
+            _helper_dependencies(name, found)
+    return found
+
+
+def _is_stale(description):
+    try:
+        module = importlib.import_module(description['module'])
+        collector = getattr(module, description['collector'])
+    except (ImportError, AttributeError):
+        return True
+    return collector_version(collector) != description['version']
+
+
+# Cache shared by the collection scripts
+feature_cache = FeatureCache()
@@ -1,15 +1,15 @@
 import os
-import fastf1
+from helpers.config import configure
 
 def setup_cache_directory():
     """
     Create a 'Cache' folder in the current working directory 
-    if it doesn't already exist
+    if it doesn't already exist, and use it as the FastF1 cache
     """
     cache_path = os.path.join(os.getcwd(), 'Cache')
     os.makedirs(cache_path, exist_ok=True)
     
-    fastf1.Cache.enable_cache(cache_path)
+    configure(cache_dir=cache_path)
 
 
 def setup_data_directory():
@@ -0,0 +1,185 @@
+import json
+import os
+import pickle
+import threading
+import time
+import numpy as np
+import pandas as pd
+from helpers.config import data_path
+from helpers.featureBuilder import LapFeatureBuilder, load_model_matrix
+from helpers.storage import get_store, CLEANED
+from helpers.dataCollection.trackWeather import engineer_weather_features
+
+# Files of a model artifact folder
+ESTIMATOR_FILE = 'estimator.pkl'
+METADATA_FILE = 'model.json'
+
+# Weather columns of a prediction request, as in FastF1 weather data
+RAW_WEATHER_COLUMNS = ['AirTemp', 'TrackTemp', 'Humidity', 'WindSpeed', 'Rainfall']
+
+
+class LapTimeModel:
+    def __init__(self,
+                 estimator,
+                 builder,
+                 feature_columns,
+                 target_column='LapTime'):
+        """
+        Fitted lap-time estimator with the feature builder and column
+        order it was trained with, saved and loaded as one artifact
+
+        Parameters:
+        - estimator: Fitted scikit-learn regressor
+        - builder: Fitted LapFeatureBuilder of the model data
+        - feature_columns: Columns of the matrix the estimator was fitted on
+        - target_column: Column the estimator predicts
+        """
+        self.estimator = estimator
+        self.builder = builder
+        self.feature_columns = list(feature_columns)
+        self.target_column = target_column
+
+
+    def predict(self, laps):
+        """
+        Predict the lap time of every row of a lap frame holding the
+        builder's input columns
+        """
+        features = self.builder.transform(laps)[self.feature_columns]
+        # Estimators fitted on a frame check the column names
+        if not hasattr(self.estimator, 'feature_names_in_'):
+            features = features.to_numpy(dtype=np.float32)
+        return self.estimator.predict(features)
+
+
+    def save(self, path=None):
+        path = model_path() if path is None else path
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, ESTIMATOR_FILE), 'wb') as f:
+            pickle.dump(self.estimator, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(path, METADATA_FILE), 'w') as f:
+            json.dump({
+                'estimator': type(self.estimator).__name__,
+                'builder': self.builder.to_dict(),
+                'features': self.feature_columns,
+                'target': self.target_column,
+                'saved': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }, f, indent=2)
+        return path
+
+
+    @classmethod
+    def load(cls, path=None):
+        path = model_path() if path is None else path
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        with open(os.path.join(path, ESTIMATOR_FILE), 'rb') as f:
+            estimator = pickle.load(f)
+        return cls(
+                    estimator,
+                    LapFeatureBuilder.from_dict(metadata['builder']),
+                    metadata['features'],
+                    metadata['target']
+                )
+
+
+    @classmethod
+    def train(cls, estimator, matrix_path=None):
+        """
+        Fit an estimator on the memory-mapped model matrix written by
+        the processing stage, by default in the configured data folder
+        """
+        matrix_path = data_path('Model Matrix') if matrix_path is None else matrix_path
+        features, target, _, columns = load_model_matrix(matrix_path)
+        estimator.fit(features, target)
+        return cls(
+                    estimator,
+                    LapFeatureBuilder.from_dict(columns['builder']),
+                    columns['features'],
+                    columns['target']
+                )
+
+
+def model_path():
+    """
+    Folder of the saved model in the configured data folder
+    """
+    return data_path('Models', 'Lap Time Model')
+
+
+class EventFeatures:
+    def __init__(self, store=None):
+        """
+        Features of an event that stay fixed during its race: track
+        geometry and every driver's metrics. Each event is read once
+        from the cleaned tables and kept as one row per driver
+
+        Parameters:
+        - store: DataStore the cleaned tables are read from, defaults
+                 to the pipeline's store
+        """
+        self.store = get_store() if store is None else store
+        self._events = {}
+        self._lock = threading.Lock()
+
+
+    def warm(self, events):
+        """
+        Load the given (year, round) events ahead of the first request
+        """
+        for year, round_number in events:
+            self.event(year, round_number)
+
+
+    def event(self, year, round_number):
+        """
+        Static features of an event, indexed by DriverNumber
+        """
+        key = (int(year), int(round_number))
+        if key not in self._events:
+            with self._lock:
+                if key not in self._events:
+                    self._events[key] = self._load_event(*key)
+        return self._events[key]
+
+
+    def assemble(self, laps):
+        """
+        Model inputs of a batch of laps: the static features of their
+        event and driver joined to the request's lap and weather
+        columns, with the weather features engineered as in collection
+
+        Parameters:
+        - laps: Frame with year, round, DriverNumber, Compound,
+                TyreLife, LapsLeft and the raw weather columns AirTemp,
+                TrackTemp, Humidity, WindSpeed and Rainfall
+        """
+        frames = []
+        for (year, round_number), rows in laps.groupby(['year', 'round'], sort=False):
+            drivers = rows['DriverNumber'].astype(int).to_numpy()
+            static = self.event(year, round_number).reindex(drivers)
+            unknown = drivers[static.isna().all(axis=1).to_numpy()]
+            if len(unknown) > 0:
+                raise KeyError(f"No driver metrics for drivers {sorted(set(unknown))} "
+                               f"in {year} round {round_number}")
+            static.index = rows.index
+            frames.append(static)
+        static = pd.concat(frames).loc[laps.index]
+
+        weather = engineer_weather_features(laps)
+        return pd.concat([laps.drop(columns=RAW_WEATHER_COLUMNS), weather, static], axis=1)
+
+
+    def _load_event(self, year, round_number):
+        filters = [('year', '==', year), ('round', '==', round_number)]
+        geometry = self.store.read(CLEANED, 'Track Geometry', filters=filters)
+        drivers = self.store.read(CLEANED, 'Driver Metrics', filters=filters)
+        if len(geometry) == 0 or len(drivers) == 0:
+            raise KeyError(f"No cleaned features for {year} round {round_number}")
+
+        drivers = drivers.drop(columns=['year', 'round']).set_index('DriverNumber')
+        drivers.index = drivers.index.astype(int)
+        geometry = geometry.drop(columns=['year', 'round']).iloc[0]
+        for column, value in geometry.items():
+            drivers[column] = value
+        return drivers
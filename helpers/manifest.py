@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+from helpers.config import data_path
+
+
+class RunManifest:
+    def __init__(self, path=None):
+        """
+        Record of the (year, round) partitions each pipeline stage has
+        produced, with a fingerprint of the inputs they were built from
+
+        Parameters:
+        - path: JSON file the manifest is persisted to, defaults to
+                Manifest.json in the configured data folder
+        """
+        self.path = data_path('Manifest.json') if path is None else path
+        self._stages = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self._stages = json.load(f)
+
+
+    def pending(self, stage, fingerprints):
+        """
+        Sorted partitions whose fingerprint differs from the one the
+        stage last recorded, i.e. new or changed ones
+
+        Parameters:
+        - stage: Name of the stage
+        - fingerprints: {(year, round): fingerprint} of the current inputs
+        """
+        produced = self._stages.get(stage, {})
+        return sorted(
+            partition
+            for partition, fingerprint in fingerprints.items()
+            if produced.get(_partition_key(*partition)) != fingerprint
+        )
+
+
+    def record(self, stage, year, round_number, fingerprint):
+        self._stages.setdefault(stage, {})[_partition_key(year, round_number)] = fingerprint
+        self._save()
+
+
+    def reset(self, stage, fingerprints=None):
+        """
+        Forget what a stage produced, optionally replacing it with the
+        fingerprints of a full rebuild
+        """
+        self._stages[stage] = {
+            _partition_key(*partition): fingerprint
+            for partition, fingerprint in (fingerprints or {}).items()
+        }
+        self._save()
+
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self._stages, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def fingerprint(*parts):
+    """
+    Short digest of JSON-serialisable values
+    """
+    return hashlib.sha256(
+                json.dumps(parts, sort_keys=True, default=str).encode()
+            ).hexdigest()[:16]
+
+
+def _partition_key(year, round_number):
+    return f'{int(year)}/{int(round_number)}'
+
+
+def partition_fingerprints(store, stage, tables):
+    """
+    Fingerprint of every partition of the first table, combining the
+    signatures of the same partition in all tables
+    """
+    available = [set(store.partitions(stage, table)) for table in tables]
+    return {
+        (year, round_number): fingerprint(*[
+            store.partition_signature(stage, table, year, round_number)
+                if (year, round_number) in partitions else None
+            for table, partitions in zip(tables, available)
+        ])
+        for year, round_number in sorted(available[0])
+    }
+
+
+_manifest = None
+
+
+def get_manifest(path=None):
+    """
+    Manifest shared by the pipeline scripts, loaded on first use
+    """
+    global _manifest
+    path = data_path('Manifest.json') if path is None else path
+    if _manifest is None or _manifest.path != path:
+        _manifest = RunManifest(path)
+    return _manifest
@@ -0,0 +1,316 @@
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import GroupKFold, KFold
+from helpers.config import cache_path
+
+
+class FoldCache:
+    def __init__(self,
+                 path=None,
+                 enabled=True):
+        """
+        Scores of fitted folds, keyed by a fingerprint of the data, the
+        model and its parameters, the fold and the training size, so a
+        search run again only fits what it has not seen
+
+        Parameters:
+        - path: Folder the scores are stored in, one JSON file each,
+                defaults to Model Search/ in the configured cache folder
+        - enabled: Fit every fold without caching when False
+        """
+        self._path = path
+        self.enabled = enabled
+
+
+    @property
+    def path(self):
+        # Resolved on use, as the shared cache is created before configure()
+        return cache_path('Model Search') if self._path is None else self._path
+
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        try:
+            with open(self._entry_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+    def put(self, key, result):
+        if not self.enabled:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        path = self._entry_path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(temp_path, path)
+
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + '.json')
+
+
+class ModelSearch:
+    def __init__(self,
+                 estimator,
+                 param_grid,
+                 cv='race',
+                 n_splits=5,
+                 workers=None,
+                 factor=3,
+                 min_resources=None,
+                 cache=None,
+                 random_state=42):
+        """
+        Hyperparameter search scored by mean absolute error, fitting
+        folds over a process pool and caching every fold's score
+
+        With min_resources set, candidates are compared by successive
+        halving: all of them are fitted on min_resources training rows,
+        the best 1/factor are kept and fitted on factor times more rows,
+        and so on until the full training folds decide between the last
+
+        Parameters:
+        - estimator: scikit-learn regressor the parameters are set on
+        - param_grid: Dict of parameter lists, searched exhaustively
+        - cv: 'race' for folds that leave whole races out, grouped by
+              (year, round), or 'random' for shuffled K-fold
+        - n_splits: Number of folds, None with cv='race' for one fold
+                    per race
+        - workers: Processes the folds are fitted on, defaults to the
+                   number of CPUs
+        - factor: Share of candidates kept by each halving round is 1/factor
+        - min_resources: Training rows of the smallest fold in the first
+                         halving round, None to fit every candidate on
+                         the full folds. Every fold is subsampled by the
+                         same share, and the last round fits full folds
+        - cache: FoldCache the scores are kept in, defaults to the
+                 shared one
+        - random_state: Seed of the random folds and the row subsamples
+        """
+        if cv not in ('race', 'random'):
+            raise ValueError(f"cv must be 'race' or 'random', not {cv!r}")
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.n_splits = n_splits
+        self.workers = workers
+        self.factor = factor
+        self.min_resources = min_resources
+        self.cache = fold_cache if cache is None else cache
+        self.random_state = random_state
+
+
+    def fit(self, X, y, keys=None):
+        """
+        Search the parameter grid on X and y, then refit the best
+        parameters on all of it
+
+        Parameters:
+        - X, y: Features and target, arrays or memory-mapped arrays
+        - keys: Rows' (year, round, ...) keys, required for cv='race'
+
+        The scores of every round are in results_, one dict per
+        candidate and training size
+        """
+        # Workers open a memory-mapped matrix from its file rather than
+        # each receiving a pickled copy of it
+        sources = (_worker_source(X), _worker_source(y))
+        X = np.asarray(X)
+        y = np.asarray(y)
+        folds = self._folds(X, y, keys)
+        fingerprint = data_fingerprint(X, y, keys)
+        candidates = [
+            dict(zip(self.param_grid, values))
+            for values in itertools.product(*self.param_grid.values())
+        ]
+
+        # Share of every fold's training rows a round fits on. Race
+        # folds differ in size, so a row count would cut the larger ones
+        n_train = min(len(train) for train, _ in folds)
+        resources = 1.0 if self.min_resources is None or len(candidates) == 1 \
+                        else min(self.min_resources / n_train, 1.0)
+        self.results_ = []
+
+        with ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=sources
+                ) as executor:
+            while True:
+                scores = self._score_candidates(
+                            executor, candidates, folds, resources, fingerprint
+                        )
+                self.results_ += scores
+
+                if resources >= 1.0:
+                    break
+                # Keep the best 1/factor, and give them more rows, the
+                # full folds once a single candidate is left
+                keep = max(1, len(candidates) // self.factor)
+                ranked = sorted(scores, key=lambda result: result['mean_score'])
+                candidates = [result['params'] for result in ranked[:keep]]
+                resources = 1.0 if len(candidates) == 1 \
+                                else min(resources * self.factor, 1.0)
+
+        final = [result for result in self.results_ if result['resources'] == resources]
+        best = min(final, key=lambda result: result['mean_score'])
+        self.best_params_ = best['params']
+        self.best_score_ = best['mean_score']
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        return self
+
+
+    def _score_candidates(self, executor, candidates, folds, resources, fingerprint):
+        rng = np.random.default_rng(self.random_state)
+        # The same subsample of every fold for all candidates of a round
+        fold_rows = [
+            train if resources >= 1.0
+                else np.sort(rng.choice(
+                            train, size=max(1, int(round(len(train) * resources))), replace=False
+                        ))
+            for train, _ in folds
+        ]
+
+        pending = {}
+        fold_scores = {}
+        for c, params in enumerate(candidates):
+            for f, (train, test) in enumerate(folds):
+                key = self._fold_key(fingerprint, params, f, resources)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    fold_scores[c, f] = cached
+                    continue
+                pending[c, f] = (key, executor.submit(
+                            _fit_fold, self.estimator, params, fold_rows[f], test
+                        ))
+
+        for (c, f), (key, future) in pending.items():
+            fold_scores[c, f] = future.result()
+            self.cache.put(key, fold_scores[c, f])
+
+        results = []
+        for c, params in enumerate(candidates):
+            scores = [fold_scores[c, f]['score'] for f in range(len(folds))]
+            results.append({
+                'params': params,
+                'resources': float(resources),
+                'train_rows': [int(len(rows)) for rows in fold_rows],
+                'mean_score': float(np.mean(scores)),
+                'std_score': float(np.std(scores)),
+                'fit_time': float(sum(fold_scores[c, f]['fit_time'] for f in range(len(folds)))),
+            })
+        return results
+
+
+    def _folds(self, X, y, keys):
+        if self.cv == 'random':
+            splitter = KFold(self.n_splits, shuffle=True, random_state=self.random_state)
+            return list(splitter.split(X, y))
+
+        if keys is None:
+            raise ValueError("cv='race' needs the (year, round) keys of every row")
+        groups = race_groups(keys)
+        n_races = len(np.unique(groups))
+        n_splits = n_races if self.n_splits is None else min(self.n_splits, n_races)
+        return list(GroupKFold(n_splits).split(X, y, groups))
+
+
+    def _fold_key(self, fingerprint, params, fold, resources):
+        description = {
+            'data': fingerprint,
+            'estimator': type(self.estimator).__name__,
+            'estimator_params': clone(self.estimator).get_params(),
+            'params': params,
+            'cv': [self.cv, self.n_splits, self.random_state],
+            'fold': fold,
+            'resources': float(resources),
+        }
+        return hashlib.sha256(
+                    json.dumps(description, sort_keys=True, default=str).encode()
+                ).hexdigest()
+
+
+def race_groups(keys):
+    """
+    Integer group of every row, one per (year, round) race, from an
+    array or frame whose first two columns are year and round
+    """
+    keys = np.asarray(keys)
+    _, groups = np.unique(keys[:, :2], axis=0, return_inverse=True)
+    return groups.ravel()
+
+
+def data_fingerprint(*arrays):
+    """
+    Digest of the contents of some arrays, None ones skipped
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        if array is None:
+            continue
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+# Training data of a search worker, set once when the worker starts
+# instead of sent with every fold
+_worker_data = {}
+
+
+def _worker_source(array):
+    """
+    What a worker is sent to get an array: the file, layout and offset
+    of a memory-mapped array spanning the rest of its .npy file, such
+    as the ones of load_model_matrix, or else the array itself
+    """
+    if isinstance(array, np.memmap) and array.filename is not None \
+            and array.flags.c_contiguous \
+            and array.offset + array.nbytes == os.path.getsize(array.filename):
+        return {
+            'filename': array.filename,
+            'dtype': array.dtype.str,
+            'shape': array.shape,
+            'offset': array.offset,
+        }
+    return np.asarray(array)
+
+
+def _open_worker_source(source):
+    if isinstance(source, dict):
+        return np.memmap(source['filename'], dtype=np.dtype(source['dtype']), mode='r',
+                         offset=source['offset'], shape=source['shape'])
+    return source
+
+
+def _init_worker(X, y):
+    _worker_data['X'] = _open_worker_source(X)
+    _worker_data['y'] = _open_worker_source(y)
+
+
+def _fit_fold(estimator, params, train, test):
+    X, y = _worker_data['X'], _worker_data['y']
+    model = clone(estimator).set_params(**params)
+    start = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_time = time.perf_counter() - start
+    return {
+        'score': float(mean_absolute_error(y[test], model.predict(X[test]))),
+        'fit_time': fit_time,
+    }
+
+
+# Cache shared by the searches of the notebook
+fold_cache = FoldCache()
@@ -0,0 +1,247 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak RSS is not recorded
+    resource = None
+
+# Returned by Tracer.span while tracing is off, so spans cost one check
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    def __init__(self):
+        """
+        Collects timed spans and counters of a pipeline run. Everything
+        is a no-op until enable() is called
+        """
+        self.enabled = False
+        self.spans = []
+        self.counters = {}
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+
+    def enable(self, origin=None):
+        """
+        Start recording
+
+        Parameters:
+        - origin: perf_counter time spans start from, so a worker
+                  process passed its parent's origin lines up with it
+        """
+        self.enabled = True
+        self.spans = []
+        self.counters = {}
+        self._origin = time.perf_counter() if origin is None else origin
+
+
+    @property
+    def origin(self):
+        return self._origin
+
+
+    def span(self, name, memory=False, **attributes):
+        """
+        Context manager timing a block. Attributes, and any added to the
+        returned dict inside the block, are exported with the span
+
+        Parameters:
+        - memory: Also record the change of resident memory over the
+                  block and the peak so far, in MB
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _SpanContext(self, name, dict(attributes), memory)
+
+
+    def count(self, name, value=1):
+        """
+        Add value to a named counter, e.g. rows read by a stage
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def count_dropped(self, name, rows_before, rows_after):
+        """
+        Record how many rows a filter such as dropna removed
+        """
+        if self.enabled:
+            self.count(name + '.rows_in', rows_before)
+            self.count(name + '.rows_dropped', rows_before - rows_after)
+
+
+    def collect(self):
+        """
+        Remove and return the spans and counters recorded so far, e.g.
+        to send those of a worker process back to its parent
+        """
+        spans, counters = self.spans, self.counters
+        self.spans, self.counters = [], {}
+        return spans, counters
+
+
+    def merge(self, spans, counters):
+        """
+        Add spans and counters collected in another process
+        """
+        if self.enabled:
+            self.spans.extend(spans)
+            for name, value in counters.items():
+                self.count(name, value)
+
+
+    def export_chrome_trace(self, path):
+        """
+        Write the spans in the Chrome trace event format, readable by
+        chrome://tracing, Perfetto and speedscope
+        """
+        pid = os.getpid()
+        events = [
+            {
+                'name': span['name'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': span.get('process', pid),
+                'tid': span['thread'],
+                'args': span['attributes'],
+            }
+            for span in self.spans
+        ]
+        events += [
+            {
+                'name': name,
+                'ph': 'C',
+                'ts': 0,
+                'pid': pid,
+                'args': {'value': value},
+            }
+            for name, value in self.counters.items()
+        ]
+        _write_json(path, {'traceEvents': events, 'counters': self.counters})
+
+
+    def export_folded(self, path):
+        """
+        Write the self time of every span stack as folded stacks, the
+        input format of flamegraph.pl and speedscope
+        """
+        self_time = {}
+        for span in self.spans:
+            stack = ';'.join(span['stack'])
+            self_time[stack] = self_time.get(stack, 0.0) + span['duration']
+            if len(span['stack']) > 1:
+                parent = ';'.join(span['stack'][:-1])
+                self_time[parent] = self_time.get(parent, 0.0) - span['duration']
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            for stack, seconds in sorted(self_time.items()):
+                f.write(f'{stack} {max(int(seconds * 1e6), 0)}\n')
+
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+    def _record(self, stack, start, attributes):
+        self.spans.append({
+            'name': stack[-1],
+            'stack': stack,
+            'start': start - self._origin,
+            'duration': time.perf_counter() - start,
+            'process': os.getpid(),
+            'thread': threading.get_ident(),
+            'attributes': attributes,
+        })
+
+
+class _SpanContext:
+    def __init__(self, tracer, name, attributes, memory=False):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.memory = memory
+
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        stack.append(self.name)
+        self.stack = list(stack)
+        self.rss = rss_mb() if self.memory else None
+        self.start = time.perf_counter()
+        return self.attributes
+
+
+    def __exit__(self, *exc_info):
+        if self.memory:
+            if self.rss is not None:
+                self.attributes['rss_delta_mb'] = rss_mb() - self.rss
+            self.attributes['peak_rss_mb'] = peak_rss_mb()
+        self.tracer._stack().pop()
+        self.tracer._record(self.stack, self.start, self.attributes)
+        return False
+
+
+def traced(name=None):
+    """
+    Decorator running a function inside a span named after it
+    """
+    def decorator(function):
+        span_name = name if name is not None else function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the process so far, in MB
+    """
+    if resource is None:
+        return None
+    # Reported in bytes on macOS and in KB on Linux
+    unit = 1024**2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+
+
+def rss_mb():
+    """
+    Current resident set size of the process, in MB, or None where
+    /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024**2
+
+
+def _write_json(path, content):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(content, f, default=str)
+
+
+# Tracer shared by the pipeline
+tracer = Tracer()
@@ -0,0 +1,315 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from helpers.config import data_path
+from helpers.dataProcessing import asof_join
+from helpers.profiling import tracer
+from helpers.storage import get_store, CLEANED, PROCESSED, PARTITION_COLUMNS
+
+# SQL tables mirrored from the store, as (stage, table)
+SOURCE_TABLES = {
+    'race_telemetry': (CLEANED, 'Race Telemetry'),
+    'track_weather': (CLEANED, 'Track Weather'),
+    'track_geometry': (CLEANED, 'Track Geometry'),
+    'driver_metrics': (CLEANED, 'Driver Metrics'),
+    'model_data': (PROCESSED, 'Data'),
+}
+
+# Indexes of every table, by the columns they cover when the table has them
+INDEXES = [
+    ('year', 'round', 'DriverNumber'),
+    ('year', 'round', 'LapStartTime'),
+    ('year', 'round', 'Time'),
+    ('Compound', 'TyreLife'),
+    ('TrackTemp',),
+]
+
+# Laps joined with the weather, track and driver features of their
+# event, as in scripts/dataProcessing, but keeping the raw compound and
+# tyre life. The weather as-of join has no SQL equivalent, so the table
+# is built in pandas and refreshed with the partitions it depends on
+LAP_FEATURES = 'lap_features'
+
+# Plain joins kept as views, computed when queried
+VIEWS = {
+    'driver_laps': """
+        SELECT l.*, d.PointsAtStart, d.BestLapTimeDelta
+        FROM race_telemetry l
+        LEFT JOIN driver_metrics d
+            ON d.year = l.year AND d.round = l.round AND d.DriverNumber = l.DriverNumber
+    """,
+    'event_summary': """
+        SELECT year, round, COUNT(*) AS Laps, COUNT(DISTINCT DriverNumber) AS Drivers,
+               AVG(LapTime) AS MeanLapTime, MIN(LapTime) AS BestLapTime,
+               AVG(AirTemp) AS AirTemp, AVG(TrackTemp) AS TrackTemp,
+               MAX(TrackLength) AS TrackLength
+        FROM lap_features
+        GROUP BY year, round
+    """,
+}
+
+_sql_operators = {
+    '==': '=',
+    '!=': '!=',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+    'in': 'IN',
+    'not in': 'NOT IN',
+}
+
+
+class QueryLayer:
+    def __init__(self,
+                 path=None,
+                 store=None,
+                 weather_tolerance=90):
+        """
+        Embedded SQLite copy of the cleaned and processed tables,
+        indexed by event, driver and time, with the model joins
+        materialized, so filtered slices are read without loading whole
+        tables
+
+        Parameters:
+        - path: Database file, defaults to Pipeline.sqlite in the
+                configured data folder
+        - store: DataStore the tables are copied from, defaults to the
+                 pipeline's store
+        - weather_tolerance: Largest gap, in seconds, between a lap and
+                             the weather sample it is joined to
+        """
+        path = data_path('Pipeline.sqlite') if path is None else path
+        self.path = path
+        self.store = get_store() if store is None else store
+        self.weather_tolerance = weather_tolerance
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS _partitions (
+                name TEXT, year INTEGER, round INTEGER, signature TEXT,
+                PRIMARY KEY (name, year, round)
+            )
+        """)
+
+
+    def refresh(self, incremental=True):
+        """
+        Copy the partitions of the source tables that changed since the
+        last refresh, and rebuild the lap features of their events
+
+        Parameters:
+        - incremental: Rebuild the whole database when False
+
+        Returns the (year, round) partitions whose lap features were rebuilt
+        """
+        if not incremental:
+            for name in list(SOURCE_TABLES) + [LAP_FEATURES]:
+                self.connection.execute(f'DROP TABLE IF EXISTS "{name}"')
+            self.connection.execute('DELETE FROM _partitions')
+
+        changed = set()
+        for name, (stage, table) in SOURCE_TABLES.items():
+            with tracer.span('query_layer.refresh', table=name):
+                refreshed = self._refresh_table(name, stage, table)
+            if stage == CLEANED:
+                changed |= refreshed
+
+        if all(self._has_table(name) for name in SOURCE_TABLES if SOURCE_TABLES[name][0] == CLEANED):
+            for year, round_number in sorted(changed):
+                with tracer.span('query_layer.lap_features', year=year, round=round_number):
+                    self._replace_partition(LAP_FEATURES, year, round_number,
+                                            self._lap_features(year, round_number))
+            self._create_indexes(LAP_FEATURES)
+            for view, sql in VIEWS.items():
+                self.connection.execute(f'DROP VIEW IF EXISTS {view}')
+                self.connection.execute(f'CREATE VIEW {view} AS {sql}')
+        self.connection.commit()
+        return sorted(changed)
+
+
+    def query(self, sql, params=()):
+        """
+        Result of a SQL query as a frame
+        """
+        with tracer.span('query_layer.query'):
+            return pd.read_sql_query(sql, self.connection, params=params)
+
+
+    def read(self, table=LAP_FEATURES, columns=None, filters=None, limit=None):
+        """
+        Rows of a table or view matching every (column, operator, value)
+        filter, following the storage filters convention
+
+        Example: read(filters=[('Compound', '==', 'SOFT'),
+                               ('TyreLife', '>', 20), ('TrackTemp', '>', 30)])
+        """
+        known = self.columns(table)
+        selected = columns or known
+        for column in list(selected) + [condition[0] for condition in filters or []]:
+            if column not in known:
+                raise KeyError(f"{table} has no column {column}")
+
+        clauses, params = [], []
+        for column, op, value in filters or []:
+            if op in ('in', 'not in'):
+                value = list(value)
+                clauses.append(f'"{column}" {_sql_operators[op]} ({", ".join("?" * len(value))})')
+                params.extend(_sql_value(v) for v in value)
+            else:
+                clauses.append(f'"{column}" {_sql_operators[op]} ?')
+                params.append(_sql_value(value))
+
+        sql = 'SELECT ' + ', '.join(f'"{column}"' for column in selected) + f' FROM "{table}"'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        return self.query(sql, params)
+
+
+    def tables(self):
+        """
+        Names of the tables and views that can be queried
+        """
+        rows = self.connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name"
+                ).fetchall()
+        return [name for name, in rows if not name.startswith(('_', 'sqlite'))]
+
+
+    def columns(self, table):
+        return [row[1] for row in self.connection.execute(f'PRAGMA table_info("{table}")')]
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def _refresh_table(self, name, stage, table):
+        stored = dict(
+            ((year, round_number), signature)
+            for year, round_number, signature in self.connection.execute(
+                    'SELECT year, round, signature FROM _partitions WHERE name = ?', (name,)
+                )
+        )
+        current = {
+            partition: self.store.partition_signature(stage, table, *partition)
+            for partition in self.store.partitions(stage, table)
+        }
+        changed = {p for p, signature in current.items() if stored.get(p) != signature}
+        removed = set(stored) - set(current)
+        for year, round_number in sorted(changed):
+            rows = self.store.read(
+                        stage, table,
+                        filters=[('year', '==', year), ('round', '==', round_number)]
+                    )
+            self._replace_partition(name, year, round_number, rows)
+            self._record(name, year, round_number, current[(year, round_number)])
+        for year, round_number in sorted(removed):
+            self._delete_partition(name, year, round_number)
+            self._delete_partition(LAP_FEATURES, year, round_number)
+            self.connection.execute(
+                'DELETE FROM _partitions WHERE name = ? AND year = ? AND round = ?',
+                (name, year, round_number)
+            )
+        if changed:
+            self._create_indexes(name)
+        return changed
+
+
+    def _lap_features(self, year, round_number):
+        partition = 'WHERE year = ? AND round = ?'
+        params = (year, round_number)
+        laps = self.query(f'SELECT * FROM race_telemetry {partition}', params)
+        weather = self.query(f'SELECT * FROM track_weather {partition}', params)
+        track = self.query(f'SELECT * FROM track_geometry {partition}', params)
+        drivers = self.query(f'SELECT * FROM driver_metrics {partition}', params)
+
+        df, _ = asof_join(
+                    laps.assign(WeatherTime=laps['LapStartTime']),
+                    weather.dropna(),
+                    left_on='WeatherTime',
+                    right_on='Time',
+                    tolerance=self.weather_tolerance
+                )
+        df = df.merge(track, on=list(PARTITION_COLUMNS), how='left', suffixes=('', '_r'))
+        df = df.merge(drivers, on=['year', 'round', 'DriverNumber'], how='left', suffixes=('', '_r'))
+        df = df.drop([col for col in df.columns if col[-2:] == '_r'] + ['WeatherTime'], axis=1)
+        df['LapsLeft'] = df['TotalLaps'] - df['LapNumber']
+        return df
+
+
+    def _replace_partition(self, name, year, round_number, rows):
+        self._delete_partition(name, year, round_number)
+        if len(rows) > 0:
+            _to_sql_frame(rows).to_sql(name, self.connection, if_exists='append', index=False)
+
+
+    def _delete_partition(self, name, year, round_number):
+        if self._has_table(name):
+            self.connection.execute(
+                f'DELETE FROM "{name}" WHERE year = ? AND round = ?', (year, round_number)
+            )
+
+
+    def _record(self, name, year, round_number, signature):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO _partitions VALUES (?, ?, ?, ?)',
+            (name, year, round_number, signature)
+        )
+
+
+    def _create_indexes(self, name):
+        if not self._has_table(name):
+            return
+        columns = set(self.columns(name))
+        for index_columns in INDEXES:
+            if set(index_columns) <= columns:
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{name}_{"_".join(index_columns)}" '
+                    f'ON "{name}" ({", ".join(index_columns)})'
+                )
+
+
+    def _has_table(self, name):
+        return self.connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+                ).fetchone() is not None
+
+
+def _to_sql_frame(df):
+    """
+    Columns SQLite can store: timedeltas as seconds, categories as
+    their labels
+    """
+    casts = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_timedelta64_dtype(values):
+            casts[column] = values.dt.total_seconds()
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            casts[column] = values.astype(object)
+    return df.assign(**casts) if casts else df
+
+
+def _sql_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def refresh_query_layer(incremental=False, path=None):
+    """
+    Bring the query database up to date with the pipeline's tables
+    """
+    layer = QueryLayer(path)
+    path = layer.path
+    try:
+        partitions = layer.refresh(incremental=incremental)
+    finally:
+        layer.close()
+    print(f"Query layer: {len(partitions)} events refreshed in {path}")
+
+    return partitions
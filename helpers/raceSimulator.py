@@ -0,0 +1,237 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Dry compounds a strategy can be built from
+DRY_COMPOUNDS = ['SOFT', 'MEDIUM', 'HARD']
+
+
+class RaceSimulator:
+    def __init__(self,
+                 model,
+                 event_features,
+                 year,
+                 round_number,
+                 weather,
+                 drivers=None,
+                 total_laps=None,
+                 pit_loss=22.0,
+                 compounds=DRY_COMPOUNDS,
+                 max_tyre_life=None):
+        """
+        Whole-race simulation of stint plans with the lap-time model
+
+        A driver's lap time only depends on the lap, the compound and
+        the tyre life, so the model is called once for every such
+        combination, and a strategy's race time is a gather and a sum
+        over that table. Thousands of strategies are then simulated
+        for every driver with a few array operations
+
+        Parameters:
+        - model: LapTimeModel predicting the lap times
+        - event_features: EventFeatures of the stored events
+        - year, round_number: Event the race is simulated at
+        - weather: Raw weather (AirTemp, TrackTemp, Humidity, WindSpeed,
+                   Rainfall) as a dict for the whole race, or a frame
+                   with one row per lap as a forecast
+        - drivers: Driver numbers to simulate, defaults to every driver
+                   with metrics at the event
+        - total_laps: Race distance, defaults to the event's TotalLaps
+        - pit_loss: Seconds lost to one pit stop
+        - compounds: Compounds strategies are built from
+        - max_tyre_life: Oldest tyre age tabulated, defaults to the
+                         race distance
+        """
+        static = event_features.event(year, round_number)
+        self.year = int(year)
+        self.round_number = int(round_number)
+        self.drivers = [int(d) for d in (static.index if drivers is None else drivers)]
+        self.total_laps = int(static['TotalLaps'].iloc[0] if total_laps is None else total_laps)
+        self.pit_loss = pit_loss
+        self.compounds = list(compounds)
+        self.max_tyre_life = self.total_laps if max_tyre_life is None else max_tyre_life
+        self.table = self._lap_time_table(model, event_features, weather)
+
+
+    def simulate(self, strategies, drivers=None):
+        """
+        Race time of every strategy for every driver
+
+        Parameters:
+        - strategies: (pit_laps, compounds) arrays as returned by
+                      enumerate_strategies
+        - drivers: Subset of the simulator's drivers
+
+        Returns a (drivers, strategies) array of race times in seconds
+        """
+        rows = [self.drivers.index(int(d)) for d in drivers] if drivers is not None \
+                    else slice(None)
+        pit_laps, compounds = strategies
+        return simulate_strategies(self.table[rows], pit_laps, compounds, self.pit_loss)
+
+
+    def best_strategies(self, strategies, top=3):
+        """
+        Fastest strategies of every driver, as a frame
+        """
+        times = self.simulate(strategies)
+        pit_laps, compounds = strategies
+        rows = []
+        for d, driver in enumerate(self.drivers):
+            for s in np.argsort(times[d], kind='stable')[:top]:
+                stops = pit_laps[s][pit_laps[s] < self.total_laps]
+                rows.append({
+                    'DriverNumber': driver,
+                    'RaceTime': times[d, s],
+                    'PitLaps': stops.tolist(),
+                    'Compounds': [self.compounds[c] for c in compounds[s][:len(stops) + 1]],
+                })
+        return pd.DataFrame(rows)
+
+
+    def _lap_time_table(self, model, event_features, weather):
+        """
+        Predicted lap time of every (driver, compound, tyre life, lap),
+        as a float32 array of that shape
+        """
+        laps = np.arange(1, self.total_laps + 1)
+        grid = np.array(list(itertools.product(
+                    self.drivers,
+                    range(len(self.compounds)),
+                    range(1, self.max_tyre_life + 1),
+                    laps
+                )))
+
+        if isinstance(weather, pd.DataFrame):
+            # A forecast, one row per lap
+            conditions = weather.reset_index(drop=True).iloc[grid[:, 3] - 1].reset_index(drop=True)
+        else:
+            conditions = pd.DataFrame(weather, index=range(len(grid)))
+
+        requests = pd.concat([
+                    pd.DataFrame({
+                        'year': self.year,
+                        'round': self.round_number,
+                        'DriverNumber': grid[:, 0],
+                        'Compound': np.array(self.compounds)[grid[:, 1]],
+                        'TyreLife': grid[:, 2],
+                        'LapsLeft': self.total_laps - grid[:, 3],
+                    }),
+                    conditions[['AirTemp', 'TrackTemp', 'Humidity', 'WindSpeed', 'Rainfall']]
+                ], axis=1)
+
+        predictions = model.predict(event_features.assemble(requests))
+        return predictions.astype(np.float32).reshape(
+                    len(self.drivers), len(self.compounds), self.max_tyre_life, self.total_laps
+                )
+
+
+def simulate_strategies(table,
+                        pit_laps,
+                        compounds,
+                        pit_loss=22.0,
+                        initial_tyre_life=1,
+                        chunk_size=4096):
+    """
+    Race times of stint plans from a lap-time table
+
+    Parameters:
+    - table: (drivers, compounds, tyre life, laps) lap times, tyre
+             life 1 at index 0
+    - pit_laps: (strategies, stops) int array of the laps at the end of
+                which the driver pits, padded with the race distance
+    - compounds: (strategies, stops + 1) int array of the compound code
+                 of every stint
+    - pit_loss: Seconds lost to one pit stop
+    - initial_tyre_life: Tyre life on the first lap of the race
+    - chunk_size: Strategies simulated together, bounding the
+                  (drivers, strategies, laps) gather held in memory
+
+    Returns a (drivers, strategies) float64 array of race times
+    """
+    if len(pit_laps) > chunk_size:
+        return np.concatenate([
+            simulate_strategies(
+                        table,
+                        pit_laps[start:start + chunk_size],
+                        compounds[start:start + chunk_size],
+                        pit_loss, initial_tyre_life, chunk_size
+                    )
+            for start in range(0, len(pit_laps), chunk_size)
+        ], axis=1)
+
+    n_drivers, _, max_life, total_laps = table.shape
+    laps = np.arange(1, total_laps + 1, dtype=np.int32)
+
+    # Stint of every lap: pits at the end of an earlier lap
+    stint = (laps[None, :, None] > pit_laps[:, None, :]).sum(axis=2)
+    stint_start = np.concatenate(
+                    [np.zeros((len(pit_laps), 1), dtype=pit_laps.dtype), pit_laps],
+                    axis=1
+                )
+    start = np.take_along_axis(stint_start, stint, axis=1)
+    tyre_life = laps[None, :] - start + np.where(stint == 0, initial_tyre_life, 1) - 1
+    tyre_life = np.minimum(tyre_life, max_life)
+    compound = np.take_along_axis(compounds, stint, axis=1)
+
+    # Flattened gather of the (compound, life, lap) cell of every lap
+    cells = (compound * max_life + (tyre_life - 1)) * total_laps + (laps[None, :] - 1)
+    flat = table.reshape(n_drivers, -1)
+    times = flat[:, cells].sum(axis=2, dtype=np.float64)
+
+    stops = (pit_laps < total_laps).sum(axis=1)
+    return times + pit_loss * stops[None, :]
+
+
+def enumerate_strategies(total_laps,
+                         n_compounds=len(DRY_COMPOUNDS),
+                         max_stops=2,
+                         min_stint=5,
+                         step=1,
+                         two_compounds=True):
+    """
+    Every stint plan of up to max_stops stops, as padded arrays
+
+    Parameters:
+    - total_laps: Race distance
+    - n_compounds: Number of compounds to choose from
+    - max_stops: Most pit stops of a plan
+    - min_stint: Fewest laps of a stint
+    - step: Spacing of the pit laps tried
+    - two_compounds: Only keep plans using two different compounds,
+                     as required in a dry race
+
+    Returns (pit_laps, compounds) for simulate_strategies
+    """
+    pit_rows, compound_rows = [], []
+    pit_options = range(min_stint, total_laps - min_stint + 1, step)
+    for stops in range(max_stops + 1):
+        for pits in itertools.combinations(pit_options, stops):
+            if any(b - a < min_stint for a, b in zip(pits, pits[1:])):
+                continue
+            for plan in itertools.product(range(n_compounds), repeat=stops + 1):
+                if two_compounds and len(set(plan)) < 2:
+                    continue
+                pit_rows.append(list(pits) + [total_laps] * (max_stops - stops))
+                compound_rows.append(list(plan) + [plan[-1]] * (max_stops - stops))
+
+    return np.array(pit_rows, dtype=np.int32).reshape(-1, max_stops), \
+                np.array(compound_rows, dtype=np.int32).reshape(-1, max_stops + 1)
+
+
+def simulate_scenarios(simulators, strategies, workers=None):
+    """
+    Simulate the same strategies under several scenarios, e.g. weather
+    forecasts or pit losses, one simulator each, across processes
+
+    Returns one (drivers, strategies) array per simulator
+    """
+    if workers == 1:
+        return [simulator.simulate(strategies) for simulator in simulators]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_simulate, simulators, itertools.repeat(strategies)))
+
+
+def _simulate(simulator, strategies):
+    return simulator.simulate(strategies)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# Keys identifying an event and a driver
+INTEGER_COLUMNS = {
+    'year': 'int16',
+    'round': 'int8',
+    'DriverNumber': 'int16',
+    'TimeQuant': 'int32',
+    'LapStartTimeQuant': 'int32',
+}
+
+# Repeated labels, stored once per table as categories
+CATEGORICAL_COLUMNS = ['location', 'Compound', 'QualiCompound']
+
+# Physical measurements and engineered features, where float32 keeps
+# far more precision than the sensors provide. Session times and lap
+# times are left as float64: times an hour into a session lose
+# milliseconds in float32, and LapTime is the model target
+FLOAT32_COLUMNS = [
+    # Track geometry
+    'TrackLength', 'TotalLaps', 'MaxElevation', 'MinElevation',
+    'TotalElevationChange', 'ElevationSD', 'NumberOfCorners',
+    'TotalCurvature', 'MaxCurvature', 'CurvatureSD',
+    # Weather
+    'AirTemp', 'TrackTemp', 'Rain',
+    'HumidityWindInteraction', 'WindChillFactor', 'SurfaceGripIndex',
+    # Laps
+    'LapNumber', 'TyreLife', 'LapsLeft',
+    'Sector1Time', 'Sector2Time', 'Sector3Time',
+    # Drivers
+    'PointsAtStart', 'BestLapTimeDelta', 'QualifyingPosition',
+    'QualiSector1Time', 'QualiSector2Time', 'QualiSector3Time',
+    # Compound one-hot columns of the model data, scaled by tyre life
+    'Compound_SOFT', 'Compound_MEDIUM', 'Compound_HARD',
+    'Compound_INTERMEDIATE', 'Compound_WET',
+]
+
+
+def column_dtype(column):
+    """
+    Dtype the schema gives a column, None when it leaves it as is
+    """
+    if column in INTEGER_COLUMNS:
+        return INTEGER_COLUMNS[column]
+    if column in CATEGORICAL_COLUMNS:
+        return 'category'
+    if column in FLOAT32_COLUMNS:
+        return 'float32'
+    return None
+
+
+def apply_schema(df):
+    """
+    Cast the columns of a table to their schema dtypes. Applied
+    whenever a table is written or read, so every stage sees the same
+    dtypes whatever the backend returned
+
+    Columns are only cast when that loses nothing: strings such as the
+    raw DriverNumber stay strings, integer keys holding NaN stay float,
+    and timedeltas are left alone
+    """
+    casts = {}
+    for column in df.columns:
+        dtype = column_dtype(column)
+        if dtype is None:
+            continue
+        current = df[column].dtype
+
+        if dtype == 'category':
+            if not isinstance(current, pd.CategoricalDtype):
+                casts[column] = 'category'
+            continue
+
+        if current == dtype or not _is_number(df[column]):
+            continue
+        if column in INTEGER_COLUMNS and df[column].isna().any():
+            continue
+        casts[column] = dtype
+
+    return df.astype(casts) if casts else df
+
+
+def empty_frame(columns):
+    """
+    Frame without rows, with the schema dtypes of the given columns
+    """
+    return pd.DataFrame({
+        column: pd.Series(dtype=column_dtype(column) or 'float64')
+        for column in columns
+    })
+
+
+def memory_usage(df):
+    """
+    Bytes a table takes, and the bytes it would take as the float64
+    matrix np.hstack used to build
+    """
+    return int(df.memory_usage(index=False, deep=True).sum()), \
+                df.shape[0] * df.shape[1] * np.dtype(np.float64).itemsize
+
+
+def _is_number(series):
+    # Object columns of numbers come back from empty or Excel tables
+    if series.dtype == object:
+        return series.map(lambda value: isinstance(value, (int, float, np.number))).all()
+    return pd.api.types.is_numeric_dtype(series.dtype)
@@ -0,0 +1,368 @@
+import operator
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from helpers.config import data_path
+from helpers.profiling import tracer
+from helpers.schema import apply_schema, empty_frame
+
+# Pipeline stages, each stored under its own folder of the data root
+RAW = 'Raw Data'
+CLEANED = 'Cleaned Data'
+PROCESSED = 'Processed Data'
+
+# Columns every table is partitioned by
+PARTITION_COLUMNS = ('year', 'round')
+
+_operators = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, target: value in target,
+    'not in': lambda value, target: value not in target,
+}
+
+
+class DataStore:
+    """
+    Storage of the pipeline tables, addressed by (stage, table) and
+    partitioned by (year, round)
+
+    Filters follow the pyarrow convention: a list of
+    (column, operator, value) tuples that must all hold
+    """
+    def __init__(self, root=None):
+        """
+        Parameters:
+        - root: Folder the stages are stored under, defaults to the
+                configured data folder
+        """
+        self.root = data_path() if root is None else root
+
+
+    def read(self, stage, table, columns=None, filters=None):
+        raise NotImplementedError
+
+
+    def write(self, stage, table, df):
+        """
+        Replace a whole table
+        """
+        raise NotImplementedError
+
+
+    def write_partition(self, stage, table, year, round_number, df):
+        """
+        Replace the rows of one (year, round) partition of a table
+        """
+        raise NotImplementedError
+
+
+    def partitions(self, stage, table):
+        """
+        Sorted (year, round) partitions stored for a table
+        """
+        raise NotImplementedError
+
+
+    def clear(self, stage, table):
+        """
+        Remove every partition of a table
+        """
+        raise NotImplementedError
+
+
+    def iter_partitions(self, stage, table, columns=None, partitions=None):
+        """
+        Yield ((year, round), rows) one partition at a time, so a table
+        can be processed without holding all of it in memory
+
+        Parameters:
+        - partitions: (year, round) partitions to read, defaults to all
+        """
+        if partitions is None:
+            partitions = self.partitions(stage, table)
+        for year, round_number in partitions:
+            yield (year, round_number), self.read(
+                        stage, table,
+                        columns=columns,
+                        filters=[('year', '==', year), ('round', '==', round_number)]
+                    )
+
+
+    def exists(self, stage, table):
+        return len(self.partitions(stage, table)) > 0
+
+
+    def partition_signature(self, stage, table, year, round_number):
+        """
+        String that changes whenever a partition's rows change
+        """
+        df = self.read(
+                    stage, table,
+                    filters=[('year', '==', year), ('round', '==', round_number)]
+                )
+        return str(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+class ParquetStore(DataStore):
+    """
+    One Parquet file per partition:
+    <root>/<stage>/<table>/year=<year>/round=<round>/part.parquet
+    """
+    def read(self, stage, table, columns=None, filters=None):
+        with tracer.span('storage.read', stage=stage, table=table):
+            return self._read(stage, table, columns, filters)
+
+
+    def iter_partitions(self, stage, table, columns=None, partitions=None):
+        # The table is listed once, rather than again for every partition
+        stored = self.partitions(stage, table)
+        if partitions is None:
+            partitions = stored
+        stored = set(stored)
+        for year, round_number in partitions:
+            with tracer.span('storage.read', stage=stage, table=table):
+                yield (year, round_number), self._read(
+                            stage, table,
+                            columns=columns,
+                            partitions=[(year, round_number)] if (year, round_number) in stored else []
+                        )
+
+
+    def _read(self, stage, table, columns=None, filters=None, partitions=None):
+        partition_filters, row_filters = _split_filters(filters)
+        frames = [
+            pd.read_parquet(
+                self.partition_path(stage, table, year, round_number),
+                columns=columns,
+                filters=row_filters or None
+            )
+            for year, round_number in (self.partitions(stage, table) if partitions is None else partitions)
+            if _partition_matches(year, round_number, partition_filters)
+        ]
+        if len(frames) == 0:
+            return self._empty(stage, table, columns)
+        # Categories differ between partitions, so they are restored
+        # after the concat turns them into plain strings
+        return apply_schema(pd.concat(frames, ignore_index=True))
+
+
+    def _empty(self, stage, table, columns=None):
+        """
+        Frame without rows of the given columns, or of the columns of
+        the table's stored partitions when none are given
+        """
+        if columns is None:
+            stored = self.partitions(stage, table)
+            if len(stored) > 0:
+                import pyarrow.parquet as pq
+                columns = pq.read_schema(self.partition_path(stage, table, *stored[0])).names
+        return empty_frame(columns or [])
+
+
+    def write(self, stage, table, df):
+        self.clear(stage, table)
+        for (year, round_number), partition in df.groupby(list(PARTITION_COLUMNS)):
+            self.write_partition(stage, table, year, round_number, partition)
+
+
+    def clear(self, stage, table):
+        shutil.rmtree(self._table_path(stage, table), ignore_errors=True)
+
+
+    def write_partition(self, stage, table, year, round_number, df):
+        path = self.partition_path(stage, table, year, round_number)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tracer.span('storage.write', stage=stage, table=table, rows=len(df)):
+            with atomic_path(path) as temp_path:
+                apply_schema(df).reset_index(drop=True).to_parquet(temp_path, index=False)
+
+
+    def partitions(self, stage, table):
+        table_path = self._table_path(stage, table)
+        if not os.path.isdir(table_path):
+            return []
+
+        found = []
+        for year_dir in os.listdir(table_path):
+            if not year_dir.startswith('year='):
+                continue
+            for round_dir in os.listdir(os.path.join(table_path, year_dir)):
+                # A folder without its file is a write that never finished
+                if round_dir.startswith('round=') and os.path.exists(
+                            os.path.join(table_path, year_dir, round_dir, 'part.parquet')
+                        ):
+                    found.append((
+                        int(year_dir[len('year='):]),
+                        int(round_dir[len('round='):])
+                    ))
+        return sorted(found)
+
+
+    def partition_signature(self, stage, table, year, round_number):
+        stat = os.stat(self.partition_path(stage, table, year, round_number))
+        return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+    def _table_path(self, stage, table):
+        return os.path.join(self.root, stage, table)
+
+
+    def partition_path(self, stage, table, year, round_number):
+        return os.path.join(
+                    self._table_path(stage, table),
+                    f'year={int(year)}',
+                    f'round={int(round_number)}',
+                    'part.parquet'
+                )
+
+
+class ExcelStore(DataStore):
+    """
+    One workbook per table: <root>/<stage>/<table>.xlsx
+    """
+    def read(self, stage, table, columns=None, filters=None):
+        # The filter columns are read too, and dropped once applied
+        usecols = None if columns is None else list(dict.fromkeys(
+                    list(columns) + [condition[0] for condition in filters or []]
+                ))
+        with tracer.span('storage.read', stage=stage, table=table):
+            df = pd.read_excel(self._table_path(stage, table), usecols=usecols)
+        df = apply_filters(df, filters)
+        if columns is not None:
+            df = df[list(columns)]
+        return apply_schema(df)
+
+
+    def write(self, stage, table, df):
+        path = self._table_path(stage, table)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tracer.span('storage.write', stage=stage, table=table, rows=len(df)):
+            with atomic_path(path) as temp_path:
+                df.to_excel(temp_path, index=False)
+
+
+    def clear(self, stage, table):
+        try:
+            os.remove(self._table_path(stage, table))
+        except FileNotFoundError:
+            pass
+
+
+    def write_partition(self, stage, table, year, round_number, df):
+        if self.exists(stage, table):
+            stored = self.read(stage, table)
+            stored = stored[
+                        (stored['year'] != year)
+                        | (stored['round'] != round_number)
+                    ]
+            df = pd.concat([stored, df]).sort_values(list(PARTITION_COLUMNS))
+        self.write(stage, table, df)
+
+
+    def partitions(self, stage, table):
+        path = self._table_path(stage, table)
+        if not os.path.exists(path):
+            return []
+        keys = pd.read_excel(path, usecols=list(PARTITION_COLUMNS))
+        return sorted(
+            (int(year), int(round_number))
+            for year, round_number in keys.drop_duplicates().itertuples(index=False)
+        )
+
+
+    def _table_path(self, stage, table):
+        return os.path.join(self.root, stage, table + '.xlsx')
+
+
+def apply_filters(df, filters):
+    """
+    Keep the rows of df matching every (column, operator, value) filter
+    """
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        if op in ('in', 'not in'):
+            matches = df[column].isin(value)
+            mask &= matches if op == 'in' else ~matches
+        else:
+            mask &= _operators[op](df[column], value)
+    return df[mask]
+
+
+def export_excel(df, path):
+    """
+    Write a table as an Excel workbook, for reports and the R analysis
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with atomic_path(path) as temp_path:
+        df.to_excel(temp_path, index=False)
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Temporary path next to path, renamed over it once the block
+    completes, so a killed run leaves either the old file or the new
+    one, never a truncated one. The extension is kept, as writers such
+    as to_excel pick their format from it
+    """
+    root, extension = os.path.splitext(path)
+    temp_path = f'{root}.{os.getpid()}.{threading.get_ident()}.tmp{extension}'
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _split_filters(filters):
+    partition_filters, row_filters = [], []
+    for condition in filters or []:
+        if condition[0] in PARTITION_COLUMNS:
+            partition_filters.append(condition)
+        else:
+            row_filters.append(condition)
+    return partition_filters, row_filters
+
+
+def _partition_matches(year, round_number, filters):
+    values = {'year': year, 'round': round_number}
+    return all(
+        _operators[op](values[column], value)
+        for column, op, value in filters
+    )
+
+
+backends = {
+    'parquet': ParquetStore,
+    'excel': ExcelStore,
+}
+
+_store = None
+
+
+def configure_store(backend='parquet', root=None):
+    """
+    Select the storage backend the pipeline scripts use
+    """
+    global _store
+    _store = backends[backend](root)
+    return _store
+
+
+def get_store():
+    """
+    Store shared by the pipeline scripts, Parquet unless configured
+    """
+    if _store is None:
+        configure_store()
+    return _store
@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from helpers.config import data_path
+
+# On-disk dtype of every channel. Time is seconds since the start of
+# the lap; the others are stored at the resolution FastF1 reports them
+CHANNEL_DTYPES = {
+    'Time': 'float32',
+    'Speed': 'float16',
+    'RPM': 'uint16',
+    'nGear': 'uint8',
+    'Throttle': 'uint8',
+    'Brake': 'uint8',
+    'DRS': 'uint8',
+}
+
+# Columns of an event's lap index, one row per (driver, lap)
+INDEX_COLUMNS = ['DriverNumber', 'LapNumber', 'Start', 'Stop']
+
+INDEX_FILE = 'index.npy'
+CHANNELS_FILE = 'channels.json'
+
+
+class TelemetryStore:
+    def __init__(self, root=None):
+        """
+        Columnar store of per-sample car telemetry. Every event is a
+        folder holding one .npy file per channel, with the samples of
+        all its laps end to end, and a (driver, lap) -> sample range
+        index. Files are memory-mapped on read, so slicing a lap only
+        pages in that lap's samples
+
+        Layout: <root>/year=<year>/round=<round>/<channel>.npy
+
+        Parameters:
+        - root: Folder the events are stored under, defaults to
+                Telemetry/ in the configured data folder
+        """
+        self._root = root
+        self._index = {}
+
+
+    @property
+    def root(self):
+        # Resolved on use, as the collection's store is created before configure()
+        return data_path('Telemetry') if self._root is None else self._root
+
+
+    def write_event(self, year, round_number, drivers):
+        """
+        Replace the telemetry of an event
+
+        Parameters:
+        - drivers: Iterable of per-driver dicts as produced by
+                   CarTelemetry.get_car_telemetry, holding DriverNumber,
+                   LapNumber and Samples (samples of every lap), and one
+                   array per channel covering those samples in lap order
+        """
+        path = self._event_path(year, round_number)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+
+        index, channels = [], {channel: [] for channel in CHANNEL_DTYPES}
+        start = 0
+        for driver in drivers:
+            stops = start + np.cumsum(driver['Samples'])
+            index.append(np.column_stack([
+                np.full(len(stops), int(driver['DriverNumber'])),
+                driver['LapNumber'],
+                stops - driver['Samples'],
+                stops,
+            ]))
+            for channel, dtype in CHANNEL_DTYPES.items():
+                values = np.nan_to_num(np.asarray(driver[channel], dtype=np.float64))
+                channels[channel].append(values.astype(dtype))
+            start = stops[-1] if len(stops) > 0 else start
+
+        index = np.concatenate(index) if index else np.empty((0, len(INDEX_COLUMNS)))
+        np.save(os.path.join(temp_path, INDEX_FILE), index.astype(np.int64))
+        for channel, dtype in CHANNEL_DTYPES.items():
+            values = np.concatenate(channels[channel]) if channels[channel] \
+                        else np.empty(0, dtype=dtype)
+            np.save(os.path.join(temp_path, channel + '.npy'), values)
+        with open(os.path.join(temp_path, CHANNELS_FILE), 'w') as f:
+            json.dump({'channels': CHANNEL_DTYPES, 'index': INDEX_COLUMNS}, f, indent=2)
+
+        # Swapped in whole, so readers never see half an event. The old
+        # event is moved aside rather than deleted first, so a failed
+        # swap leaves it in place to be restored
+        old_path = f'{path}.{os.getpid()}.old.tmp'
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        try:
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(old_path):
+                os.rename(old_path, path)
+            raise
+        shutil.rmtree(old_path, ignore_errors=True)
+        self._index.pop((int(year), int(round_number)), None)
+        return len(index)
+
+
+    def laps(self, year, round_number):
+        """
+        Lap index of an event as a frame of DriverNumber, LapNumber and
+        the Start/Stop range of the lap's samples
+        """
+        return pd.DataFrame(self._lap_index(year, round_number), columns=INDEX_COLUMNS)
+
+
+    def read_lap(self, year, round_number, driver, lap, channels=None):
+        """
+        Samples of one lap as a frame, read from memory-mapped channels
+
+        Parameters:
+        - channels: Channels to read, defaults to all of them
+        """
+        start, stop = self._lap_range(year, round_number, driver, lap)
+        return pd.DataFrame({
+            channel: self._channel(year, round_number, channel)[start:stop]
+            for channel in (channels or CHANNEL_DTYPES)
+        })
+
+
+    def read_event(self, year, round_number, channels=None):
+        """
+        Lap index and memory-mapped channels of a whole event, for
+        computations over every lap at once
+        """
+        return self.laps(year, round_number), {
+            channel: self._channel(year, round_number, channel)
+            for channel in (channels or CHANNEL_DTYPES)
+        }
+
+
+    def read_laps(self, year, round_number, driver, laps=None, channels=None):
+        """
+        Samples of several laps of a driver, with a LapNumber column
+
+        Parameters:
+        - laps: Lap numbers to read, defaults to the whole race
+        """
+        index = self.laps(year, round_number)
+        index = index[index['DriverNumber'] == int(driver)]
+        if laps is not None:
+            index = index[index['LapNumber'].isin(laps)]
+
+        frames = []
+        for lap in index.itertuples():
+            frame = self.read_lap(year, round_number, driver, lap.LapNumber, channels)
+            frame.insert(0, 'LapNumber', lap.LapNumber)
+            frames.append(frame)
+        if len(frames) == 0:
+            return pd.DataFrame(columns=['LapNumber'] + list(channels or CHANNEL_DTYPES))
+        return pd.concat(frames, ignore_index=True)
+
+
+    def events(self):
+        """
+        Sorted (year, round) events in the store
+        """
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for year_dir in os.listdir(self.root):
+            if not year_dir.startswith('year='):
+                continue
+            for round_dir in os.listdir(os.path.join(self.root, year_dir)):
+                if round_dir.startswith('round=') and not round_dir.endswith('.tmp'):
+                    found.append((int(year_dir[len('year='):]), int(round_dir[len('round='):])))
+        return sorted(found)
+
+
+    def size(self):
+        """
+        Bytes the store takes on disk
+        """
+        return sum(
+            os.path.getsize(os.path.join(folder, name))
+            for folder, _, names in os.walk(self.root)
+            for name in names
+        )
+
+
+    def _lap_range(self, year, round_number, driver, lap):
+        index = self._lap_index(year, round_number)
+        match = np.flatnonzero((index[:, 0] == int(driver)) & (index[:, 1] == int(lap)))
+        if len(match) == 0:
+            raise KeyError(f"No telemetry for driver {driver} lap {lap} "
+                           f"in {year} round {round_number}")
+        return index[match[0], 2], index[match[0], 3]
+
+
+    def _lap_index(self, year, round_number):
+        key = (int(year), int(round_number))
+        if key not in self._index:
+            self._index[key] = np.load(os.path.join(self._event_path(*key), INDEX_FILE))
+        return self._index[key]
+
+
+    def _channel(self, year, round_number, channel):
+        return np.load(
+                    os.path.join(self._event_path(year, round_number), channel + '.npy'),
+                    mmap_mode='r'
+                )
+
+
+    def _event_path(self, year, round_number):
+        return os.path.join(self.root, f'year={int(year)}', f'round={int(round_number)}')
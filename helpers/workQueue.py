@@ -0,0 +1,301 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Folders of the queue, one JSON file per task, moved between them
+# with os.rename, which is atomic on a POSIX shared filesystem
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class LeaseLost(Exception):
+    """
+    Raised when a worker's lease expired and the task was requeued
+    """
+
+
+class WorkQueue:
+    def __init__(self,
+                 root,
+                 lease_seconds=300,
+                 max_attempts=3,
+                 worker_id=None):
+        """
+        Task queue kept as files in a directory shared by every worker,
+        e.g. an NFS mount, needing no server
+
+        A worker claims a task by renaming its file from pending/ to
+        leased/, which only one worker can win, and then keeps the
+        lease alive by touching the file. A lease whose file a worker
+        has not seen touched for lease_seconds belongs to a worker that
+        died, and that worker moves it back to pending/. The wait is
+        timed on the observing worker's own clock, from when the file's
+        modification time last changed, so the machines' clocks and
+        the file server's need not agree
+
+        Parameters:
+        - root: Shared folder of the queue
+        - lease_seconds: Time without a heartbeat after which a lease
+                         is expired and its task requeued
+        - max_attempts: Claims of a task before it is moved to failed/
+        - worker_id: Name of this worker in the leases, defaults to
+                     host, process and a random suffix
+        """
+        self.root = root
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+        # Leased file name -> (modification time, local time it was first seen)
+        self._observed = {}
+        for folder in (PENDING, LEASED, DONE, FAILED):
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+
+
+    def enqueue(self, tasks):
+        """
+        Add tasks, dicts holding at least an 'id', unless a task of the
+        same id is already queued, running or done
+
+        Returns the ids added
+        """
+        added = []
+        for task in tasks:
+            if self._find(task['id']) is not None:
+                continue
+            self._write(self._path(PENDING, task['id']), {**task, 'attempts': 0})
+            added.append(task['id'])
+        return added
+
+
+    def claim(self, prefer=None):
+        """
+        Lease the next pending task, or return None when none is left
+
+        Parameters:
+        - prefer: Callable taking a task id, True for tasks to claim
+                  first, e.g. those of an event whose session this
+                  worker already holds
+        """
+        self.requeue_expired()
+        names = sorted(self._list(PENDING))
+        if prefer is not None:
+            names = [n for n in names if prefer(n[:-len('.json')])] \
+                        + [n for n in names if not prefer(n[:-len('.json')])]
+
+        for name in names:
+            task_id = name[:-len('.json')]
+            leased_path = self._path(LEASED, task_id)
+            try:
+                os.rename(self._path(PENDING, task_id), leased_path)
+            except FileNotFoundError:
+                # Claimed by another worker first
+                continue
+
+            try:
+                task = self._read(leased_path)
+            except FileNotFoundError:
+                # Requeued by another worker in the meantime
+                continue
+            task['attempts'] = task.get('attempts', 0) + 1
+            task['worker'] = self.worker_id
+            task['claimed_at'] = time.time()
+            self._write(leased_path, task)
+            return task
+        return None
+
+
+    def heartbeat(self, task):
+        """
+        Extend the lease of a task, raising LeaseLost if it was requeued
+        """
+        path = self._path(LEASED, task['id'])
+        try:
+            owner = self._read(path).get('worker')
+        except (FileNotFoundError, ValueError):
+            owner = None
+        if owner != self.worker_id:
+            raise LeaseLost(f"Lease of {task['id']} is no longer held by {self.worker_id}")
+        os.utime(path)
+
+
+    @contextmanager
+    def lease(self, task):
+        """
+        Heartbeat a task from a background thread while the block runs.
+        If the lease was lost, or a heartbeat failed so it may expire,
+        LeaseLost is raised when the block ends, so its results are not
+        kept
+        """
+        stop = threading.Event()
+        lost = []
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.heartbeat(task)
+                except Exception as error:
+                    # Also e.g. an unreachable shared folder, after which
+                    # the lease can expire while the block still runs
+                    lost.append(error)
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield task
+        finally:
+            stop.set()
+            thread.join()
+        if lost:
+            if isinstance(lost[0], LeaseLost):
+                raise lost[0]
+            raise LeaseLost(f"Heartbeat of {task['id']} failed: {lost[0]!r}") from lost[0]
+
+
+    def complete(self, task, result=None, outputs=None):
+        """
+        Mark a leased task done, recording what it produced
+
+        Parameters:
+        - outputs: {staged path: final path} of files the task wrote
+                   aside, moved into place once the lease is confirmed,
+                   so a worker that lost its lease never overwrites the
+                   output of the task's new owner
+        """
+        self.heartbeat(task)
+        for staged_path, final_path in (outputs or {}).items():
+            os.makedirs(os.path.dirname(final_path) or '.', exist_ok=True)
+            os.replace(staged_path, final_path)
+        done = {**task, 'result': result, 'finished_at': time.time()}
+        self._write(self._path(DONE, task['id']), done)
+        self._remove(self._path(LEASED, task['id']))
+
+
+    def fail(self, task, error):
+        """
+        Give a task back after an error, to pending/ while it has
+        attempts left and to failed/ after that
+        """
+        self.heartbeat(task)
+        task = {**task, 'error': str(error)}
+        folder = PENDING if task.get('attempts', 0) < self.max_attempts else FAILED
+        self._write(self._path(LEASED, task['id']), task)
+        os.rename(self._path(LEASED, task['id']), self._path(folder, task['id']))
+
+
+    def requeue_expired(self):
+        """
+        Move the leases this worker has not seen heartbeaten for
+        lease_seconds back to pending/, or to failed/ once their
+        attempts are used up
+
+        Returns the requeued task ids
+        """
+        requeued = []
+        now = time.monotonic()
+        names = self._list(LEASED)
+        self._observed = {name: seen for name, seen in self._observed.items() if name in names}
+        for name in names:
+            path = os.path.join(self.root, LEASED, name)
+            try:
+                modified = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen_modified, seen_at = self._observed.get(name, (None, None))
+            if modified != seen_modified:
+                # New lease or fresh heartbeat, timed from now
+                self._observed[name] = (modified, now)
+                continue
+            if now - seen_at < self.lease_seconds:
+                continue
+
+            # Taken out of leased/ under a name of this worker, which
+            # only one requeuer can win, and checked again there, so a
+            # heartbeat that landed since the expiry was read keeps
+            # its lease
+            taken = f'{path}.{self.worker_id}.requeue'
+            try:
+                os.rename(path, taken)
+            except FileNotFoundError:
+                # Requeued by another worker, or completed meanwhile
+                self._observed.pop(name, None)
+                continue
+            try:
+                task = self._read(taken)
+            except ValueError:
+                task = None
+            if task is None or os.stat(taken).st_mtime_ns != seen_modified:
+                os.rename(taken, path)
+                continue
+            folder = PENDING if task.get('attempts', 0) < self.max_attempts else FAILED
+            os.rename(taken, self._path(folder, task['id']))
+            self._observed.pop(name, None)
+            requeued.append(task['id'])
+        return requeued
+
+
+    def tasks(self, state):
+        """
+        Tasks in one of the pending, leased, done or failed states
+        """
+        tasks = []
+        for name in sorted(self._list(state)):
+            try:
+                tasks.append(self._read(os.path.join(self.root, state, name)))
+            except (FileNotFoundError, ValueError):
+                continue
+        return tasks
+
+
+    def counts(self):
+        return {state: len(self._list(state)) for state in (PENDING, LEASED, DONE, FAILED)}
+
+
+    def finished(self):
+        """
+        Whether no task is pending or leased
+        """
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+
+    def _find(self, task_id):
+        for state in (PENDING, LEASED, DONE, FAILED):
+            if os.path.exists(self._path(state, task_id)):
+                return state
+        return None
+
+
+    def _list(self, state):
+        return [name for name in os.listdir(os.path.join(self.root, state))
+                if name.endswith('.json')]
+
+
+    def _path(self, state, task_id):
+        return os.path.join(self.root, state, task_id + '.json')
+
+
+    def _read(self, path):
+        with open(path) as f:
+            return json.load(f)
+
+
+    def _write(self, path, content):
+        # Written aside and renamed, so readers never see half a file
+        temp_path = f'{path}.{self.worker_id}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(content, f, indent=2)
+        os.replace(temp_path, path)
+
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
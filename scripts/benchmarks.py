@@ -0,0 +1,557 @@
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import euclidean
+from fastf1.core import Laps
+from helpers.dataCollection.trackGeometry import track_geometry_arrays, summarize_track_geometry
+from helpers.dataCollection.raceTelemetry import extract_lap_table
+from helpers.dataCollection.driverMetrics import extract_fastest_laps
+from helpers.dataProcessing import asof_join
+from helpers.storage import ParquetStore, RAW, CLEANED, apply_filters
+from helpers.queryLayer import QueryLayer
+from helpers.featureCache import feature_cache
+from helpers.dataCollection.sessionPool import SessionPool
+from helpers.dataCollection.sessionPrefetcher import SessionPrefetcher
+from helpers.dataCollection.syntheticSession import SyntheticSessionLoader
+from helpers.raceSimulator import simulate_strategies, enumerate_strategies
+from helpers.dataCollection.carTelemetry import CarTelemetry
+from helpers.telemetryStore import TelemetryStore, CHANNEL_DTYPES
+from helpers.dataCollection.driverComparison import DriverComparison, FULL_THROTTLE
+from helpers.dataCollection.circuitIndex import CircuitIndexCache
+from scripts.dataPreprocessing import clean_race_telemetry
+import scripts.dataCollection as dataCollection
+
+
+def main():
+    benchmark_track_geometry()
+    benchmark_lap_extraction()
+    benchmark_weather_join()
+    benchmark_streaming_memory()
+    benchmark_session_prefetch()
+    benchmark_race_simulation()
+    benchmark_telemetry_store()
+    benchmark_driver_comparison()
+    benchmark_circuit_index()
+    benchmark_query_layer()
+
+
+def time_call(function, *args, repeat=3, **kwargs):
+    """
+    Best wall time of a few calls, with the result of the last one
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def synthetic_lap_positions(n_points=500_000, seed=0):
+    """
+    X, Y, Z positions in metres tracing a noisy closed loop
+    """
+    rng = np.random.default_rng(seed)
+    theta = np.linspace(0, 2 * np.pi, n_points)
+    return np.column_stack([
+        1000 * np.cos(theta) + rng.normal(0, 0.5, n_points),
+        600 * np.sin(2 * theta) + rng.normal(0, 0.5, n_points),
+        10 * np.sin(3 * theta)
+    ])
+
+
+def benchmark_track_geometry(n_points=500_000, legacy_points=5_000):
+    """
+    Compare the NumPy geometry engine against the former per-sample
+    euclidean loop. The loop is timed on a slice and scaled up, as it
+    takes minutes on the full lap
+    """
+    positions = synthetic_lap_positions(n_points)
+    telemetry = pd.DataFrame(positions, columns=['X', 'Y', 'Z'])
+
+    def legacy_track_length(telemetry):
+        distances = [
+                        euclidean(
+                            telemetry.iloc[i][['X', 'Y', 'Z']],
+                            telemetry.iloc[i + 1][['X', 'Y', 'Z']]
+                        )
+                        for i in range(len(telemetry) - 1)
+                    ]
+        return np.sum(distances)
+
+    legacy_time, legacy_length = time_call(
+                    legacy_track_length,
+                    telemetry.iloc[:legacy_points],
+                    repeat=1
+                )
+    legacy_time *= n_points / legacy_points
+
+    vectorized_time, geometry = time_call(
+                    lambda p: summarize_track_geometry(
+                                    track_geometry_arrays(p),
+                                    total_laps=1,
+                                    number_of_corners=0
+                                ),
+                    positions
+                )
+    sample_length = track_geometry_arrays(positions[:legacy_points])['Distance'].sum()
+    assert np.isclose(sample_length, legacy_length)
+
+    print(f"Track geometry on {n_points:,} points:")
+    print(f"\t- Euclidean loop (estimated): {legacy_time:.2f}s")
+    print(f"\t- NumPy engine: {vectorized_time:.4f}s")
+    print(f"\t- Speedup: {legacy_time / vectorized_time:.0f}x")
+
+    return geometry
+
+
+def synthetic_laps(n_drivers=20, n_laps=70, seed=0):
+    """
+    Laps frame with the columns the collectors read, one row per
+    driver and lap
+    """
+    rng = np.random.default_rng(seed)
+    n = n_drivers * n_laps
+    drivers = np.repeat([str(d + 1) for d in range(n_drivers)], n_laps)
+    lap_number = np.tile(np.arange(1, n_laps + 1), n_drivers)
+    sectors = rng.normal([30, 35, 25], 0.5, size=(n, 3))
+    lap_time = sectors.sum(axis=1)
+    start = np.zeros(n)
+    for d in range(n_drivers):
+        rows = slice(d * n_laps, (d + 1) * n_laps)
+        start[rows] = 3600 + np.concatenate(([0], np.cumsum(lap_time[rows])[:-1]))
+
+    return Laps({
+        'DriverNumber': drivers,
+        'LapNumber': lap_number.astype(float),
+        'LapStartTime': pd.to_timedelta(start, unit='s'),
+        'LapTime': pd.to_timedelta(lap_time, unit='s'),
+        'Sector1Time': pd.to_timedelta(sectors[:, 0], unit='s'),
+        'Sector2Time': pd.to_timedelta(sectors[:, 1], unit='s'),
+        'Sector3Time': pd.to_timedelta(sectors[:, 2], unit='s'),
+        'Compound': rng.choice(['SOFT', 'MEDIUM', 'HARD'], n),
+        'TyreLife': ((lap_number - 1) % 25 + 1).astype(float),
+        'TrackStatus': rng.choice(['1', '1', '1', '4'], n),
+        'IsPersonalBest': rng.random(n) < 0.2,
+        'Deleted': rng.random(n) < 0.01,
+    })
+
+
+def benchmark_lap_extraction(n_drivers=20, n_laps=70):
+    """
+    Compare the column-wise lap and fastest-lap extraction against the
+    former per-driver, per-lap loops
+    """
+    laps = synthetic_laps(n_drivers, n_laps)
+    drivers = list(pd.unique(laps['DriverNumber']))
+    results = pd.DataFrame({
+        'DriverNumber': drivers,
+        'Position': np.arange(1, len(drivers) + 1, dtype=float)
+    })
+
+    def legacy_lap_table(laps, drivers):
+        rows = []
+        for driver in drivers:
+            for lap in laps.pick_drivers(driver).itertuples():
+                rows.append({
+                    'DriverNumber': driver,
+                    'LapStartTime': lap.LapStartTime,
+                    'LapTime': lap.LapTime.total_seconds() if lap.LapTime else np.nan,
+                    'LapNumber': lap.LapNumber,
+                    'Compound': lap.Compound,
+                    'TyreLife': lap.TyreLife,
+                    'Sector1Time': lap.Sector1Time.total_seconds(),
+                    'Sector2Time': lap.Sector2Time.total_seconds(),
+                    'Sector3Time': lap.Sector3Time.total_seconds(),
+                    'TrackStatus': lap.TrackStatus,
+                    'IsPersonalBest': lap.IsPersonalBest,
+                    'Deleted': lap.Deleted
+                })
+        return pd.DataFrame(rows)
+
+    def legacy_fastest_laps(laps, drivers, results):
+        positions = results.set_index('DriverNumber')['Position']
+        rows = []
+        for driver in drivers:
+            fastest_lap = laps.pick_drivers(driver).pick_fastest()
+            if fastest_lap is None or isinstance(fastest_lap.LapTime, float):
+                continue
+            rows.append({
+                'DriverNumber': driver,
+                'BestLapTime': fastest_lap.LapTime.total_seconds(),
+                'QualifyingPosition': positions[driver],
+                'QualiCompound': fastest_lap.Compound,
+                'QualiSector1Time': fastest_lap.Sector1Time.total_seconds(),
+                'QualiSector2Time': fastest_lap.Sector2Time.total_seconds(),
+                'QualiSector3Time': fastest_lap.Sector3Time.total_seconds(),
+            })
+        return pd.DataFrame(rows)
+
+    print(f"Lap extraction on {n_drivers} drivers x {n_laps} laps:")
+    for name, legacy, vectorized, args in [
+                ('Race laps', legacy_lap_table, extract_lap_table, (laps, drivers)),
+                ('Fastest laps', legacy_fastest_laps, extract_fastest_laps,
+                    (laps, drivers, results)),
+            ]:
+        legacy_time, expected = time_call(legacy, *args)
+        vectorized_time, actual = time_call(vectorized, *args)
+        pd.testing.assert_frame_equal(
+                    actual.reset_index(drop=True),
+                    expected.reset_index(drop=True),
+                    check_dtype=False
+                )
+        print(f"\t- {name}: {legacy_time * 1000:.1f}ms -> "
+              f"{vectorized_time * 1000:.1f}ms "
+              f"({legacy_time / vectorized_time:.0f}x)")
+
+
+def synthetic_weather(n_events=22, duration=7200, seed=0):
+    """
+    Weather samples about once a minute, with jitter and a few dropped
+    samples, for every event
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for event in range(n_events):
+        time = np.arange(0, duration, 60) + rng.uniform(-20, 20, duration // 60)
+        time = time[rng.random(len(time)) > 0.05]
+        frames.append(pd.DataFrame({
+            'year': 2023,
+            'round': event + 1,
+            'Time': time,
+            'AirTemp': rng.normal(25, 3, len(time)),
+            'TrackTemp': rng.normal(40, 5, len(time)),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def benchmark_weather_join(n_events=22, n_drivers=20, n_laps=70):
+    """
+    Compare the nearest-sample join against the former exact join on
+    quantized minutes, in time and in laps kept
+    """
+    weather = synthetic_weather(n_events)
+    laps = pd.concat([
+        pd.DataFrame({
+            'year': 2023,
+            'round': event + 1,
+            'LapStartTime': synthetic_laps(n_drivers, n_laps, seed=event)['LapStartTime']
+                                .dt.total_seconds().to_numpy(),
+        })
+        for event in range(n_events)
+    ], ignore_index=True)
+
+    def legacy_join(laps, weather):
+        weather = weather.copy()
+        laps = laps.copy()
+        weather['key'] = (weather['year'] * 1000 + weather['round']) * 10000 \
+                            + (weather['Time'] / 86400 * 10**5 // 60).astype(int)
+        weather = weather.drop_duplicates('key').set_index('key')
+        laps['key'] = laps['year'] * 1000 * 10000 \
+                        + laps['round'] * 10000 \
+                        + (laps['LapStartTime'] / 86400 * 10**5 // 60).astype(int)
+        laps = laps.set_index('key')
+        return laps.join(weather, how='left', rsuffix='_r').dropna().reset_index()
+
+    legacy_time, legacy = time_call(legacy_join, laps, weather)
+    asof_time, (joined, hit_rate) = time_call(
+                    asof_join, laps, weather,
+                    left_on='LapStartTime', right_on='Time', tolerance=90
+                )
+
+    print(f"Weather join on {len(laps):,} laps:")
+    print(f"\t- Exact quantized join: {legacy_time * 1000:.1f}ms, "
+          f"{len(legacy) / len(laps):.1%} of laps kept")
+    print(f"\t- As-of join: {asof_time * 1000:.1f}ms, "
+          f"{hit_rate:.1%} of laps kept")
+
+
+def peak_memory(function, *args, **kwargs):
+    """
+    Peak Python heap allocation, in bytes, while calling function
+    """
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def synthetic_events(n_events, n_drivers=20, n_laps=70):
+    """
+    Yield the raw lap rows of one synthetic event at a time
+    """
+    for event in range(n_events):
+        laps = extract_lap_table(
+                    synthetic_laps(n_drivers, n_laps, seed=event),
+                    [str(d + 1) for d in range(n_drivers)]
+                )
+        laps.insert(0, 'year', 2000 + event // 25)
+        laps.insert(1, 'round', event % 25 + 1)
+        laps.insert(2, 'location', f'Track {event % 25 + 1}')
+        yield laps
+
+
+def benchmark_streaming_memory(n_events=200):
+    """
+    Peak memory of collecting and cleaning many synthetic events when
+    accumulating them with pd.concat versus streaming partitions
+    """
+    def accumulate(store):
+        track_data = None
+        for laps in synthetic_events(n_events):
+            if track_data is None:
+                track_data = laps
+            else:
+                track_data = pd.concat([track_data, laps])
+        store.write(RAW, 'Race Telemetry', track_data)
+        store.write(CLEANED, 'Race Telemetry', clean_race_telemetry(store.read(RAW, 'Race Telemetry')))
+
+    def stream(store):
+        for laps in synthetic_events(n_events):
+            store.write_partition(RAW, 'Race Telemetry', laps['year'].iloc[0], laps['round'].iloc[0], laps)
+        for (year, round_number), raw in store.iter_partitions(RAW, 'Race Telemetry'):
+            store.write_partition(CLEANED, 'Race Telemetry', year, round_number, clean_race_telemetry(raw))
+
+    print(f"Peak memory over {n_events} synthetic events:")
+    for name, run in [('Accumulated', accumulate), ('Streamed', stream)]:
+        with tempfile.TemporaryDirectory() as root:
+            peak = peak_memory(run, ParquetStore(root))
+        print(f"\t- {name}: {peak / 1024**2:.1f} MB")
+
+
+def benchmark_session_prefetch(n_events=6, latency=1.0):
+    """
+    Wall time of collecting events on synthetic sessions whose loads
+    are delayed like a download, with sessions loaded on demand versus
+    prefetched in the background
+    """
+    loader = SyntheticSessionLoader(n_rounds=n_events)
+
+    def slow_loader(year, grand_prix, session_type='Race'):
+        session = loader(year, grand_prix, session_type)
+        load = session.load
+
+        def delayed_load(**parts):
+            time.sleep(latency)
+            load(**parts)
+
+        session.load = delayed_load
+        return session
+
+    schedule = loader.get_event_schedule(2023)
+    races = pd.DataFrame({
+        'year': 2023,
+        'round': schedule['RoundNumber'],
+        'location': schedule['Location'],
+    })
+
+    def collect(prefetch):
+        pool = SessionPool(loader=slow_loader, schedule_loader=loader.get_event_schedule)
+        calendar = SessionPrefetcher(races, session_pool=pool, lookahead=prefetch) if prefetch \
+                        else (races.iloc[i] for i in range(len(races)))
+        for race in calendar:
+            for collect_table in (dataCollection.collect_track_geometry,
+                                  dataCollection.collect_track_weather,
+                                  dataCollection.collect_race_telemetry):
+                collect_table(race, session_pool=pool)
+
+    cache_enabled = feature_cache.enabled
+    feature_cache.enabled = False
+    try:
+        on_demand_time, _ = time_call(collect, 0, repeat=1)
+        prefetch_time, _ = time_call(collect, 2, repeat=1)
+    finally:
+        feature_cache.enabled = cache_enabled
+
+    print(f"Collection of {n_events} events with {latency:.1f}s session loads:")
+    print(f"\t- On demand: {on_demand_time:.2f}s")
+    print(f"\t- Prefetched: {prefetch_time:.2f}s")
+
+
+def benchmark_race_simulation(n_drivers=20, total_laps=57, legacy_strategies=200):
+    """
+    Strategies simulated per second from a lap-time table, for every
+    driver at once, against a loop over strategies and laps
+    """
+    rng = np.random.default_rng(0)
+    life = np.arange(1, total_laps + 1)
+    # Lap times of (driver, compound, tyre life, lap), degrading with age
+    table = (
+        90 + rng.normal(0, 0.4, size=(n_drivers, 1, 1, 1))
+        + np.array([0.0, 0.5, 1.0])[None, :, None, None]
+        + np.array([0.08, 0.05, 0.03])[None, :, None, None] * life[None, None, :, None]
+        - 0.06 * (total_laps - life)[None, None, None, :] / total_laps
+    ).astype(np.float32)
+    pit_laps, compounds = enumerate_strategies(total_laps, max_stops=2, min_stint=5)
+
+    def legacy(pit_laps, compounds):
+        times = np.zeros((n_drivers, len(pit_laps)))
+        for d in range(n_drivers):
+            for s in range(len(pit_laps)):
+                stint, tyre_life = 0, 0
+                for lap in range(1, total_laps + 1):
+                    tyre_life += 1
+                    times[d, s] += table[d, compounds[s, stint], tyre_life - 1, lap - 1]
+                    if stint < pit_laps.shape[1] and lap == pit_laps[s, stint] < total_laps:
+                        stint, tyre_life = stint + 1, 0
+                        times[d, s] += 22.0
+        return times
+
+    legacy_time, _ = time_call(legacy, pit_laps[:legacy_strategies], compounds[:legacy_strategies], repeat=1)
+    vectorized_time, _ = time_call(simulate_strategies, table, pit_laps, compounds)
+
+    print(f"Race simulation of {len(pit_laps):,} strategies x {n_drivers} drivers, {total_laps} laps:")
+    print(f"\t- Loop: {legacy_strategies / legacy_time:,.0f} strategies/s")
+    print(f"\t- Vectorized: {len(pit_laps) / vectorized_time:,.0f} strategies/s")
+
+
+def benchmark_telemetry_store(n_drivers=20, n_laps=57, hz=4, season_events=22):
+    """
+    Disk size of one race's car telemetry and the time to read one
+    lap from the memory-mapped store against loading the whole race
+    """
+    loader = SyntheticSessionLoader(n_drivers=n_drivers, n_laps=n_laps, hz=hz, n_rounds=1)
+    pool = SessionPool(loader=loader, schedule_loader=loader.get_event_schedule)
+    telemetry = CarTelemetry(2023, 1, session_pool=pool).get_car_telemetry()
+    samples = sum(int(driver['Samples'].sum()) for driver in telemetry)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = TelemetryStore(root)
+        store.write_event(2023, 1, telemetry)
+        size = store.size()
+        lap_time, _ = time_call(store.read_lap, 2023, 1, telemetry[0]['DriverNumber'], 10)
+
+        def read_race():
+            return {
+                channel: np.load(f'{root}/year=2023/round=1/{channel}.npy')
+                for channel in CHANNEL_DTYPES
+            }
+        race_time, _ = time_call(read_race)
+
+    print(f"Car telemetry of {n_drivers} drivers x {n_laps} laps at {hz} Hz:")
+    print(f"\t- {samples:,} samples, {size / samples:.1f} bytes/sample, {size / 1024**2:.1f} MB/race, "
+          f"{season_events * size / 1024**3:.2f} GB/season")
+    print(f"\t- One lap: {lap_time * 1000:.2f}ms, whole race: {race_time * 1000:.2f}ms")
+
+
+def benchmark_driver_comparison(n_drivers=20, n_laps=57, hz=4, grid_points=1000, minisectors=25):
+    """
+    Time to align every lap of a race by distance and compare every
+    pair of drivers per minisector, against interpolating lap by lap
+    and comparing pair by pair
+    """
+    loader = SyntheticSessionLoader(n_drivers=n_drivers, n_laps=n_laps, hz=hz, n_rounds=1)
+    pool = SessionPool(loader=loader, schedule_loader=loader.get_event_schedule)
+    telemetry = CarTelemetry(2023, 1, session_pool=pool).get_car_telemetry()
+
+    def legacy():
+        per_point = grid_points // minisectors
+        profiles = {}
+        for driver in telemetry:
+            laps = []
+            start = 0
+            for samples in driver['Samples']:
+                time = driver['Time'][start:start + samples]
+                speed = np.asarray(driver['Speed'][start:start + samples], dtype=float)
+                if samples >= 2:
+                    distance = np.concatenate(([0], np.cumsum(np.diff(time) * (speed[1:] + speed[:-1]) / 2 / 3.6)))
+                    grid = np.linspace(0, distance[-1], grid_points)
+                    laps.append(pd.DataFrame({
+                        'MinSpeed': np.interp(grid, distance, speed),
+                        'FullThrottle': np.interp(grid, distance, driver['Throttle'][start:start + samples]) >= FULL_THROTTLE,
+                    }))
+                start += samples
+            profiles[driver['DriverNumber']] = pd.concat(laps).groupby(level=0).median()
+        rows = []
+        for a in profiles:
+            for b in profiles:
+                if a != b:
+                    for m in range(minisectors):
+                        sector = slice(m * per_point, (m + 1) * per_point)
+                        rows.append({
+                            'Driver': a, 'Opponent': b, 'Minisector': m + 1,
+                            'DeltaMinSpeed': profiles[a]['MinSpeed'].iloc[sector].min()
+                                                - profiles[b]['MinSpeed'].iloc[sector].min(),
+                        })
+        return pd.DataFrame(rows)
+
+    def vectorized():
+        comparison = DriverComparison.from_car_telemetry(
+                    telemetry, grid_points=grid_points, minisectors=minisectors
+                )
+        return comparison.pairwise_deltas()
+
+    legacy_time, _ = time_call(legacy, repeat=1)
+    vectorized_time, deltas = time_call(vectorized)
+
+    print(f"Driver comparison of {n_drivers} drivers x {n_laps} laps, {minisectors} minisectors:")
+    print(f"\t- Per lap and pair: {legacy_time:.2f}s")
+    print(f"\t- Vectorized: {vectorized_time:.3f}s ({len(deltas):,} rows)")
+
+
+def benchmark_circuit_index(n_seasons=5, n_samples=1_000_000):
+    """
+    Time to take the geometry of a circuit visited every season from
+    the circuit index cache against rebuilding it for every event, and
+    to map position samples to lap distance and corner
+    """
+    loader = SyntheticSessionLoader(n_rounds=1)
+    sessions = []
+    for year in range(2019, 2019 + n_seasons):
+        session = loader(year, 1)
+        session.load()
+        sessions.append(session)
+
+    with tempfile.TemporaryDirectory() as root:
+        rebuilt_time, _ = time_call(
+                    lambda: [CircuitIndexCache(root + f'/{i}').get(s) for i, s in enumerate(sessions)],
+                    repeat=1
+                )
+        cache = CircuitIndexCache(root + '/shared')
+        cached_time, indexes = time_call(lambda: [cache.get(s) for s in sessions], repeat=1)
+        index = indexes[0]
+
+        rng = np.random.default_rng(0)
+        points = index.reference[rng.integers(0, len(index.reference), n_samples), :2] \
+                    + rng.normal(0, 2, size=(n_samples, 2))
+        locate_time, distance = time_call(index.locate, points)
+        corner_time, _ = time_call(index.corner_at, distance)
+
+    print(f"Circuit index over {n_seasons} seasons of one layout:")
+    print(f"\t- Rebuilt per event: {rebuilt_time:.2f}s, shared: {cached_time:.2f}s "
+          f"({len({i.layout for i in indexes})} layout)")
+    print(f"\t- {n_samples:,} samples to distance: {locate_time:.2f}s, to corner: {corner_time * 1000:.1f}ms")
+
+
+def benchmark_query_layer(n_events=100):
+    """
+    Time to pull a filtered slice of the cleaned laps from the SQLite
+    query layer against reading the whole table and filtering it
+    """
+    filters = [('Compound', '==', 'SOFT'), ('TyreLife', '>', 20), ('round', '<=', 5)]
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ParquetStore(root)
+        for laps in synthetic_events(n_events):
+            store.write_partition(CLEANED, 'Race Telemetry', laps['year'].iloc[0], laps['round'].iloc[0],
+                                  clean_race_telemetry(laps))
+        layer = QueryLayer(f'{root}/Pipeline.sqlite', store=store)
+        refresh_time, _ = time_call(layer.refresh, repeat=1)
+
+        full_time, expected = time_call(
+                    lambda: apply_filters(store.read(CLEANED, 'Race Telemetry'), filters)
+                )
+        query_time, rows = time_call(layer.read, 'race_telemetry', filters=filters)
+        layer.close()
+
+    print(f"Filtered slice of {n_events} events of cleaned laps ({len(rows):,} of them, {len(expected):,} expected):")
+    print(f"\t- Whole table + pandas filter: {full_time * 1000:.1f}ms")
+    print(f"\t- Query layer: {query_time * 1000:.1f}ms (first refresh {refresh_time:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
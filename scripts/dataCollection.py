@@ -1,20 +1,53 @@
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 from helpers.dataCollection.raceCalendar import RaceCalendar
 from helpers.dataCollection.trackGeometry import TrackGeometryAnalyzer
 from helpers.dataCollection.trackWeather import TrackWeatherAnalyzer
 from helpers.dataCollection.raceTelemetry import RaceTelemetry
 from helpers.dataCollection.driverMetrics import DriverMetrics
+from helpers.dataCollection.pointsLedger import get_points_ledger
+from helpers.dataCollection.sessionPrefetcher import SessionPrefetcher
+from helpers.dataCollection.carTelemetry import CarTelemetry
+from helpers.telemetryStore import TelemetryStore
+from helpers.storage import get_store, RAW
+from helpers.featureCache import feature_cache
+from helpers.manifest import get_manifest, fingerprint
+from helpers.profiling import tracer
 
 
 years = [2023]
 
+# Track geometry is summarized from the circuit index's reference lap,
+# shared by every event on a layout, or, when no lap can be traced,
+# averaged over the laps of this many classified finishers
+geometry_reference_lap = True
+geometry_finishers = 3
 
-def main():
+# Results of this many of the latest collected rounds of a season are
+# re-read on incremental runs, as penalties can change them after the
+# race, and the events after a changed round are collected again
+refresh_rounds = 2
+
+# Per-sample car telemetry, kept out of the table store for its size
+telemetry_store = TelemetryStore()
+
+
+def main(workers=1, incremental=False, prefetch=2, car_telemetry=False, resume=False):
+    """
+    Parameters:
+    - resume: Continue an interrupted run, skipping the events it
+              completed. Events are checkpointed in the manifest once
+              all their partitions are written, so this is collection
+              in incremental mode
+    """
     store_race_calendar()
-    store_track_geometry()
-    store_track_weather()
-    store_driver_metrics()
-    store_race_telemetry()
+    store_event_data(
+                workers=workers,
+                incremental=incremental or resume,
+                prefetch=prefetch,
+                car_telemetry=car_telemetry
+            )
 
 
 def store_race_calendar():
@@ -31,141 +64,324 @@ def store_race_calendar():
             all_races = all_races._append(rc)
             del rc
     
-    all_races.to_excel(
-                'Data/Raw Data/Race Calendar.xlsx', 
-                index=False
-            )
+    get_store().write(RAW, 'Race Calendar', all_races)
     
     return all_races
 
 
-def store_track_geometry():
-    races = pd.read_excel('Data/Raw Data/Race Calendar.xlsx')
-    races = races[['year', 'round', 'location']]
-    track_data = None
-    for i in range(len(races)):
-        year = races.iloc[i]['year']
-        location = races.iloc[i]['location']
+def store_event_data(workers=1, incremental=False, prefetch=2, car_telemetry=False):
+    """
+    Run every collector event by event, so each race session is
+    loaded once and shared through the session pool. Each event's rows
+    are written as partitions as soon as they are produced, so memory
+    holds about one event at a time
 
-        TGA = TrackGeometryAnalyzer(
-                    year=year,
-                    grand_prix=location
-                    )
-        
-        geometry = {
-                    **races.iloc[i],
-                    **TGA.calculate_track_geometry()
-                }
-        geometry = pd.DataFrame(geometry, index=[i])
-        if track_data is None:
-            track_data = geometry
-        else:
-            track_data = pd.concat([track_data, geometry])
-    
-    track_data.to_excel(
-        'Data/Raw Data/Track Geometry.xlsx',
-        index=False
-    )
-    
-    return track_data
+    Parameters:
+    - workers: Number of processes events are spread across
+    - incremental: Only collect events that are new or changed in the
+                   calendar since the last run, or whose standings
+                   changed with refreshed results, replacing their
+                   partitions
+    - prefetch: Number of upcoming events whose sessions are loaded in
+                the background while one event is collected, 0 to load
+                them on demand. Only used with a single worker
+    - car_telemetry: Also store every lap's per-sample car telemetry
+                     in the telemetry store
+    """
+    races = read_races()
+    fingerprints = race_fingerprints(races)
+    manifest = get_manifest()
 
+    if incremental:
+        pending = set(manifest.pending(RAW, fingerprints))
+        pending |= refresh_points(set(fingerprints) - pending)
+        races = races[[
+            (int(race.year), int(race.round)) in pending
+            for race in races.itertuples()
+        ]]
+    else:
+        for table in collectors:
+            get_store().clear(RAW, table)
+        manifest.reset(RAW)
 
-def store_track_weather():
-    races = pd.read_excel('Data/Raw Data/Race Calendar.xlsx')
-    races = races[['year', 'round', 'location']]
-    track_data = None
-    for i in range(len(races)):
-        year = races.iloc[i]['year']
-        location = races.iloc[i]['location']
+    for race, tables in iter_collected_events(races, workers=workers, prefetch=prefetch,
+                                              car_telemetry=car_telemetry):
+        partition = (int(race['year']), int(race['round']))
+        with tracer.span('store.event', memory=True, year=partition[0], round=partition[1]):
+            for table, df in tables.items():
+                tracer.count(f'collect.{table}.rows_out', len(df))
+                get_store().write_partition(RAW, table, *partition, df)
+        manifest.record(RAW, *partition, fingerprints[partition])
 
-        TWA = TrackWeatherAnalyzer(
-                    year=year,
-                    grand_prix=location
-                    )
-        
-        weather = {
-                    **races.iloc[i],
-                    **TWA.engineer_weather_features()
-                }
-        weather = pd.DataFrame(weather)
-        
-        if track_data is None:
-            track_data = weather
-        else:
-            track_data = pd.concat([track_data, weather])
-    
-    track_data.to_excel(
-        'Data/Raw Data/Track Weather.xlsx',
-        index=False
-    )
+    # Once per run rather than on every cache write
+    feature_cache.evict()
+    return get_store().partitions(RAW, 'Race Telemetry')
 
-    return track_data
 
+def iter_collected_events(races, workers=1, prefetch=2, car_telemetry=False):
+    """
+    Yield (race, tables) for every event in calendar order. An event
+    whose collection fails, e.g. a cancelled race, is reported and
+    skipped instead of aborting the season
+    """
+    if workers <= 1:
+        # Events served entirely from the feature cache read no session,
+        # so they are not prefetched, unless car telemetry needs them
+        calendar = SessionPrefetcher(
+                        races, lookahead=prefetch,
+                        needs_sessions=None if car_telemetry else lambda race: not event_cached(race)
+                    ) if prefetch > 0 \
+                        else (races.iloc[i] for i in range(len(races)))
+        for race in calendar:
+            try:
+                tables = collect_event(race, car_telemetry)
+            except Exception:
+                report_failed_event(race)
+                continue
+            yield race, tables
+        return
 
-def store_driver_metrics():
-    races = pd.read_excel('Data/Raw Data/Race Calendar.xlsx')
-    races = races[['year', 'round', 'location']]
-    driver_data = None
-    for i in range(len(races)):
-        year = races.iloc[i]['year']
-        location = races.iloc[i]['location']
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Results arrive in completion order and are released in
+        # calendar order, so the written tables are deterministic. Only
+        # a couple of events per worker are in flight or waiting, which
+        # bounds the memory held by finished but unreleased events
+        window = 2 * workers
+        futures = {}
+        finished = {}
+        next_submit = next_event = 0
+        while next_event < len(races):
+            while next_submit < len(races) and next_submit - next_event < window:
+                future = executor.submit(collect_event_in_worker, races.iloc[next_submit], car_telemetry,
+                                         tracer.origin if tracer.enabled else None)
+                futures[future] = next_submit
+                next_submit += 1
 
-        DM = DriverMetrics(
-                    year=year,
-                    grand_prix=location
-                    )
-        
-        metrics = {
-                    **races.iloc[i],
-                    **DM.get_driver_metrics()
-                }
-        metrics = pd.DataFrame(metrics)
-        metrics['BestLapTimeDelta'] = metrics['BestLapTime'] - metrics['BestLapTime'].min()
-        
-        if driver_data is None:
-            driver_data = metrics
-        else:
-            driver_data = pd.concat([driver_data, metrics])
-    
-    driver_data.to_excel(
-        'Data/Raw Data/Driver Metrics.xlsx',
-        index=False
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures.pop(future)
+                try:
+                    finished[i], trace = future.result()
+                    tracer.merge(*trace)
+                except Exception:
+                    report_failed_event(races.iloc[i])
+                    finished[i] = None
+
+            while next_event in finished:
+                tables = finished.pop(next_event)
+                if tables is not None:
+                    yield races.iloc[next_event], tables
+                next_event += 1
+
+
+def collect_event(race, car_telemetry=False):
+    """
+    Run every collector on one event. Car telemetry is written to the
+    telemetry store from here, so workers don't send it back
+    """
+    tables = {}
+    with tracer.span('collect.event', memory=True, year=int(race['year']), round=int(race['round'])):
+        if car_telemetry:
+            with tracer.span('collect.Car Telemetry'):
+                collect_car_telemetry(race)
+        for table, collect in collectors.items():
+            with tracer.span('collect.' + table):
+                tables[table] = collect(race)
+    return tables
+
+
+def collect_event_in_worker(race, car_telemetry=False, trace_origin=None):
+    """
+    collect_event in a worker process, returning the spans and counters
+    it recorded with the tables, so the parent's trace includes them
+
+    Parameters:
+    - trace_origin: Origin of the parent's tracer, None when it is off
+    """
+    if trace_origin is not None and not tracer.enabled:
+        # Workers started by spawn don't inherit the enabled tracer
+        tracer.enable(origin=trace_origin)
+    # Drop what a forked worker inherited from its parent
+    tracer.collect()
+    tables = collect_event(race, car_telemetry)
+    return tables, tracer.collect()
+
+
+def event_cached(race):
+    """
+    Whether every collector's output for an event is in the feature cache
+    """
+    return all(
+        feature_cache.contains(
+                    collector, method, race['year'], race['location'],
+                    params=collector_params(table, race)
+                )
+        for table, (collector, method) in cached_collectors.items()
     )
+
+
+def collector_params(table, race, session_pool=None):
+    """
+    Parameters a table's cached output depends on beyond the event:
+    how track geometry is summarized, and the standings of the earlier
+    rounds for driver metrics
+    """
+    if table == 'Track Geometry':
+        return {'reference_lap': geometry_reference_lap, 'finishers': geometry_finishers}
+    if table == 'Driver Metrics':
+        ledger = get_points_ledger(race['year'], session_pool=session_pool)
+        return {'points_before': ledger.state_before(race['round'])}
+    return None
+
+
+def refresh_points(collected):
+    """
+    Re-read the results of the latest collected rounds of every season
+    into the points ledger, returning the collected events whose
+    standings before the race changed as a result
+
+    Parameters:
+    - collected: (year, round) of the events collected by earlier runs
+    """
+    stale = set()
+    for year in sorted({year for year, _ in collected}):
+        rounds = sorted(r for y, r in collected if y == year)
+        ledger = get_points_ledger(year)
+        changed = [r for r in rounds[-refresh_rounds:] if ledger.refresh_round(r)]
+        if changed:
+            stale |= {(year, r) for r in rounds if r > min(changed)}
+    return stale
+
+
+def report_failed_event(race):
+    print(f"Skipping {race['year']} round {race['round']} ({race['location']}):")
+    traceback.print_exc()
+
+
+def race_fingerprints(races):
+    """
+    Fingerprint of every event of the calendar, which changes when the
+    event moves to another circuit
+    """
+    return {
+        (int(race.year), int(race.round)): fingerprint(race.location)
+        for race in races.itertuples()
+    }
+
+
+def read_races():
+    return get_store().read(
+                RAW, 'Race Calendar',
+                columns=['year', 'round', 'location']
+            )
+
+
+def collect_track_geometry(race, session_pool=None):
+    geometry = feature_cache.get_or_compute(
+                TrackGeometryAnalyzer, 'calculate_track_geometry',
+                race['year'], race['location'],
+                params=collector_params('Track Geometry', race, session_pool),
+                compute=lambda: TrackGeometryAnalyzer(
+                            year=race['year'],
+                            grand_prix=race['location'],
+                            session_pool=session_pool,
+                            finishers=geometry_finishers,
+                            reference_lap=geometry_reference_lap
+                            ).calculate_track_geometry()
+            )
     
-    return driver_data
+    geometry = {
+                **race,
+                **geometry
+            }
+    return pd.DataFrame(geometry, index=[race.name])
 
 
-def store_race_telemetry():
-    races = pd.read_excel('Data/Raw Data/Race Calendar.xlsx')
-    races = races[['year', 'round', 'location']]
-    track_data = None
-    for i in range(len(races)):
-        year = races.iloc[i]['year']
-        location = races.iloc[i]['location']
+def collect_track_weather(race, session_pool=None):
+    weather = feature_cache.get_or_compute(
+                TrackWeatherAnalyzer, 'engineer_weather_features',
+                race['year'], race['location'],
+                lambda: TrackWeatherAnalyzer(
+                            year=race['year'],
+                            grand_prix=race['location'],
+                            session_pool=session_pool
+                            ).engineer_weather_features()
+            )
+    
+    weather = {
+                **race,
+                **weather
+            }
+    return pd.DataFrame(weather)
 
-        RC = RaceTelemetry(
-                    year=year,
-                    grand_prix=location
-                    )
-        
-        telemetry = {
-                    **races.iloc[i],
-                    **RC.get_race_telemetry()
-                }
-        telemetry = pd.DataFrame(telemetry)
-        if track_data is None:
-            track_data = telemetry
-        else:
-            track_data = pd.concat([track_data, telemetry])
+
+def collect_driver_metrics(race, session_pool=None):
+    metrics = feature_cache.get_or_compute(
+                DriverMetrics, 'get_driver_metrics',
+                race['year'], race['location'],
+                params=collector_params('Driver Metrics', race, session_pool),
+                compute=lambda: DriverMetrics(
+                            year=race['year'],
+                            grand_prix=race['location'],
+                            session_pool=session_pool
+                            ).get_driver_metrics()
+            )
     
-    track_data.dropna()
+    metrics = {
+                **race,
+                **metrics
+            }
+    metrics = pd.DataFrame(metrics)
+    metrics['BestLapTimeDelta'] = metrics['BestLapTime'] - metrics['BestLapTime'].min()
+    return metrics
 
-    track_data.to_excel(
-        'Data/Raw Data/Race Telemetry.xlsx',
-        index=False
-    )
+
+def collect_race_telemetry(race, session_pool=None):
+    telemetry = feature_cache.get_or_compute(
+                RaceTelemetry, 'get_race_telemetry',
+                race['year'], race['location'],
+                lambda: RaceTelemetry(
+                            year=race['year'],
+                            grand_prix=race['location'],
+                            session_pool=session_pool
+                            ).get_race_telemetry()
+            )
     
-    return track_data
+    telemetry = {
+                **race,
+                **telemetry
+            }
+    return pd.DataFrame(telemetry)
+
+
+def collect_car_telemetry(race, session_pool=None, store=None):
+    telemetry = CarTelemetry(
+                    year=race['year'],
+                    grand_prix=race['location'],
+                    session_pool=session_pool
+                    ).get_car_telemetry()
+
+    store = telemetry_store if store is None else store
+    return store.write_event(race['year'], race['round'], telemetry)
+
+
+# Output table of each per-event collector
+collectors = {
+    'Track Geometry': collect_track_geometry,
+    'Track Weather': collect_track_weather,
+    'Race Telemetry': collect_race_telemetry,
+    # Last, since replaying earlier rounds cycles the pool
+    'Driver Metrics': collect_driver_metrics,
+}
+
+
+# Collector class and method whose output each table is cached under
+cached_collectors = {
+    'Track Geometry': (TrackGeometryAnalyzer, 'calculate_track_geometry'),
+    'Track Weather': (TrackWeatherAnalyzer, 'engineer_weather_features'),
+    'Race Telemetry': (RaceTelemetry, 'get_race_telemetry'),
+    'Driver Metrics': (DriverMetrics, 'get_driver_metrics'),
+}
 
 
 if __name__ == "__main__":
@@ -1,80 +1,107 @@
 import pandas as pd
-from helpers.dataPreprocessing import quantize_time
+from helpers.dataPreprocessing import quantize_time, to_session_seconds
+from helpers.storage import get_store, RAW, CLEANED
+from helpers.manifest import get_manifest, partition_fingerprints
+from helpers.profiling import tracer
 
 
-input_path = 'Data/Raw Data/'
-output_path = 'Data/Cleaned Data/'
+def main(incremental=False):
+    preprocess_track_geom_data(incremental=incremental)
+    preprocess_track_weath_data(incremental=incremental)
+    preprocess_race_telemetry(incremental=incremental)
+    preprocess_driver_metrics(incremental=incremental)
 
 
-def main():
-    preprocess_track_geom_data()
-    preprocess_track_weath_data()
-    preprocess_race_telemetry()
-    preprocess_driver_metrics()
+def preprocess_track_geom_data(table="Track Geometry", incremental=False):
+    return preprocess_table(table, clean_track_geom_data, incremental)
 
 
-def preprocess_track_geom_data(file_name="Track Geometry.xlsx"):
-    track_info = pd.read_excel(input_path + file_name)
+def preprocess_track_weath_data(table="Track Weather", incremental=False):
+    return preprocess_table(table, clean_track_weath_data, incremental)
+
+
+def preprocess_race_telemetry(table="Race Telemetry", incremental=False):
+    return preprocess_table(table, clean_race_telemetry, incremental)
+
+
+def preprocess_driver_metrics(table="Driver Metrics", incremental=False):
+    return preprocess_table(table, clean_driver_metrics, incremental)
+
+
+def preprocess_table(table, clean, incremental=False):
+    """
+    Clean a raw table into the cleaned stage, streaming one (year,
+    round) partition at a time
+
+    Parameters:
+    - table: Name of the table in both stages
+    - clean: Function cleaning a frame of raw rows
+    - incremental: Only clean the raw partitions that changed since the
+                   last run, replacing their cleaned partitions
+    """
+    store = get_store()
+    manifest = get_manifest()
+    stage = CLEANED + '/' + table
+    fingerprints = partition_fingerprints(store, RAW, [table])
+
+    if incremental:
+        partitions = manifest.pending(stage, fingerprints)
+    else:
+        partitions = sorted(fingerprints)
+        store.clear(CLEANED, table)
+        manifest.reset(stage)
+
+    for (year, round_number), raw in store.iter_partitions(RAW, table, partitions=partitions):
+        with tracer.span('clean.' + table, year=year, round=round_number):
+            cleaned = clean(raw)
+        tracer.count_dropped('clean.' + table, len(raw), len(cleaned))
+        store.write_partition(CLEANED, table, year, round_number, cleaned)
+        manifest.record(stage, year, round_number, fingerprints[(year, round_number)])
+
+    return partitions
+
+
+def clean_track_geom_data(track_info):
     track_info = track_info.drop('MaxElevation', axis=1)
     track_info = track_info.drop('location', axis=1)
-    
-    track_info.to_excel(
-            output_path + file_name,
-            index=False
-        )
 
     return track_info
 
 
-def preprocess_track_weath_data(file_name="Track Weather.xlsx"):
-    weather_info = pd.read_excel(input_path + file_name)
+def clean_track_weath_data(weather_info):
     weather_info = quantize_time(weather_info, time_col='Time')
     weather_info = weather_info.drop('location', axis=1)
-    weather_info = weather_info.drop('Time', axis=1)
-    
-    weather_info.to_excel(
-            output_path + file_name,
-            index=False
-        )
+    # Kept in seconds for the as-of join with the laps
+    weather_info['Time'] = to_session_seconds(weather_info['Time'])
 
     return weather_info
 
 
-def preprocess_race_telemetry(file_name="Race Telemetry.xlsx"):
-    lap_info = pd.read_excel(input_path + file_name)
-    lap_info = lap_info[lap_info['TrackStatus'] == 1]
+def clean_race_telemetry(lap_info):
+    # Track status codes are stored as strings, e.g. '1' or '124'
+    lap_info = lap_info[pd.to_numeric(lap_info['TrackStatus'], errors='coerce') == 1]
     lap_info = lap_info[lap_info['Deleted'] == False]
     lap_info = lap_info.drop(['TrackStatus', 'Deleted'], axis=1)
     lap_info = quantize_time(lap_info, time_col='LapStartTime')
     lap_info = lap_info.drop('location', axis=1)
-    lap_info = lap_info.drop('LapStartTime', axis=1)
+    # Kept in seconds for the as-of join with the weather
+    lap_info['LapStartTime'] = to_session_seconds(lap_info['LapStartTime'])
+    lap_info['DriverNumber'] = lap_info['DriverNumber'].astype(int)
 
     lap_info = lap_info.drop(['Sector1Time', 'Sector2Time', 'Sector3Time'], axis=1)
     lap_info = lap_info.drop('IsPersonalBest', axis=1)
-    
-    lap_info.to_excel(
-            output_path + file_name,
-            index=False
-        )
 
     return lap_info
 
 
-def preprocess_driver_metrics(file_name="Driver Metrics.xlsx"):
-    lap_info = pd.read_excel(input_path + file_name)
+def clean_driver_metrics(lap_info):
     lap_info = lap_info.drop('location', axis=1)
 
     lap_info = lap_info.drop(['BestLapTime', 'QualifyingPosition'], axis=1)
     lap_info = lap_info.drop(['QualiSector1Time', 'QualiSector2Time', 'QualiSector3Time'], axis=1)
-    
-    
-    lap_info.to_excel(
-            output_path + file_name,
-            index=False
-        )
 
     return lap_info
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,69 +1,203 @@
 import pandas as pd
-import numpy as np
-from sklearn.preprocessing import OneHotEncoder, FunctionTransformer
-
-input_path = "Data/Cleaned Data/"
-output_path = "Data/"
-
-def main():
-    track_data = pd.read_excel(input_path + 'Track Geometry.xlsx')
-    track_data['key'] = track_data['year'] * 1000 \
-                            + track_data['round']
-    track_data = track_data.set_index('key')
-
-    weather_data = pd.read_excel(input_path + 'Track Weather.xlsx')
-    weather_data['key'] = weather_data['year'] * 1000 \
-                            + weather_data['round']
-    weather_data = weather_data.set_index('key')
-
-    df = weather_data\
-            .join(track_data, how='left', rsuffix='_r')\
-            .dropna()\
-            .reset_index()
-    df = df.drop(
-                    [
-                        col 
-                        for col in df.columns 
-                        if col[-2:] == '_r'
-                    ], 
-                    axis=1
+from helpers.config import data_path
+from helpers.storage import get_store, export_excel, CLEANED, PROCESSED
+from helpers.manifest import get_manifest, partition_fingerprints, fingerprint
+from helpers.dataProcessing import asof_join
+from helpers.profiling import tracer
+from helpers.schema import apply_schema, empty_frame, memory_usage
+from helpers.featureBuilder import LapFeatureBuilder, write_model_matrix
+
+# Cleaned tables joined into the model data, laps first as they drive
+# which partitions exist
+model_tables = ['Race Telemetry', 'Track Geometry', 'Track Weather', 'Driver Metrics']
+
+weather_features = [
+    'AirTemp', 'TrackTemp', 'Rain',
+    'HumidityWindInteraction', 'WindChillFactor', 'SurfaceGripIndex'
+]
+
+# Weather is sampled about once a minute
+weather_tolerance = 90
+
+compounds = ['SOFT', 'MEDIUM', 'HARD', 'INTERMEDIATE', 'WET']
+
+model_columns = [
+    'year', 'round', 'DriverNumber',
+    'Compound_SOFT', 'Compound_MEDIUM', 'Compound_HARD', 
+    'Compound_INTERMEDIATE', 'Compound_WET', 
+    'LapsLeft', 
+    'AirTemp', 'TrackTemp', 'Rain',
+    'HumidityWindInteraction', 'WindChillFactor', 'SurfaceGripIndex',
+    'TrackLength', 'NumberOfCorners', 'TotalCurvature', 'MaxCurvature',
+    'CurvatureSD', 'MinElevation', 'TotalElevationChange', 'ElevationSD',
+    'PointsAtStart', 'BestLapTimeDelta',
+    'LapTime',
+]
+
+key_columns = ['year', 'round', 'DriverNumber']
+target_column = 'LapTime'
+feature_columns = [
+    col
+    for col in model_columns
+    if col not in key_columns + [target_column]
+]
+
+# Fitted on the fixed compounds, so every partition, and any laps
+# predicted later, get every compound column
+feature_builder = LapFeatureBuilder(
+                categories=compounds,
+                passthrough_columns=feature_columns[len(compounds):]
+            ).fit(None)
+
+
+def main(incremental=False, interpolate_weather=False):
+    """
+    Join the cleaned tables into the model data, streaming one (year,
+    round) partition at a time
+
+    Parameters:
+    - incremental: Only rebuild the partitions whose cleaned inputs
+                   changed since the last run
+    - interpolate_weather: Give every lap the weather interpolated to
+                           its middle rather than the sample nearest its
+                           start
+    """
+    store = get_store()
+    manifest = get_manifest()
+    fingerprints = partition_fingerprints(store, CLEANED, model_tables)
+    if interpolate_weather:
+        # Partitions joined the other way are rebuilt by an incremental run
+        fingerprints = {
+            partition: fingerprint(inputs, 'interpolated weather')
+            for partition, inputs in fingerprints.items()
+        }
+
+    if incremental:
+        partitions = manifest.pending(PROCESSED, fingerprints)
+    else:
+        partitions = sorted(fingerprints)
+        store.clear(PROCESSED, 'Data')
+        manifest.reset(PROCESSED)
+
+    total_compact = total_dense = 0
+    for year, round_number in partitions:
+        with tracer.span('join', memory=True, year=year, round=round_number):
+            df = build_model_data(
+                        *read_cleaned_tables(
+                            filters=[('year', '==', year), ('round', '==', round_number)]
+                        ),
+                        interpolate_weather=interpolate_weather
+                    )
+        store.write_partition(PROCESSED, 'Data', year, round_number, df)
+        print(f"{year} round {round_number}: "
+              f"{df.attrs['WeatherHitRate']:.1%} of laps matched a weather sample")
+        manifest.record(PROCESSED, year, round_number, fingerprints[(year, round_number)])
+
+        compact, dense = memory_usage(df)
+        total_compact += compact
+        total_dense += dense
+
+    if total_compact > 0:
+        print(f"Model data: {total_compact / 1024**2:.2f} MB, "
+              f"{total_dense / total_compact:.1f}x smaller than a float64 matrix")
+
+    export_model_matrix()
+
+    return partitions
+
+
+def export_model_matrix(path=None):
+    """
+    Write the model data as memory-mappable feature, target and key
+    arrays, loaded zero-copy by the notebook, by default to Model
+    Matrix/ in the configured data folder
+    """
+    path = data_path('Model Matrix') if path is None else path
+    rows = write_model_matrix(
+                get_store(), PROCESSED, 'Data', path,
+                feature_columns=feature_columns,
+                target_column=target_column,
+                key_columns=key_columns,
+                builder=feature_builder
+            )
+    print(f"Model matrix of {rows} laps written to {path}")
+
+    return rows
+
+
+def read_cleaned_tables(filters=None):
+    """
+    Track geometry, weather, lap and driver tables of the cleaned stage,
+    restricted to the columns the model data uses
+    """
+    store = get_store()
+    track_data = store.read(CLEANED, 'Track Geometry', filters=filters)
+    weather_data = store.read(
+                    CLEANED, 'Track Weather',
+                    columns=['year', 'round', 'Time'] + weather_features,
+                    filters=filters
                 )
-    df['key'] = df['key'] * 10000 + df['TimeQuant']
-    df = df.set_index('key')
-
-    lap_data = pd.read_excel(input_path + 'Race Telemetry.xlsx')
-    lap_data['key'] = lap_data['year'] * 1000 * 10000 \
-                        + lap_data['round'] * 10000 \
-                        + lap_data['LapStartTimeQuant']
-    lap_data = lap_data.set_index('key')
-
-    df = lap_data.join(df, how='left', rsuffix='_r')\
-            .dropna()\
-            .reset_index()
-    df = df.drop(
-                    [
-                        col 
-                        for col in df.columns 
-                        if col[-2:] == '_r'
-                    ], 
-                    axis=1
+    lap_data = store.read(
+                    CLEANED, 'Race Telemetry',
+                    columns=[
+                        'year', 'round', 'DriverNumber', 'LapStartTime',
+                        'LapNumber', 'LapTime', 'Compound', 'TyreLife'
+                    ],
+                    filters=filters
                 )
-    df['key'] = df['year'] * 1000 * 1000 \
-                    + df['round'] * 1000 \
-                    + df['DriverNumber']
-    df = df.set_index('key')
-
-    driver_data = pd.read_excel(input_path + 'Driver Metrics.xlsx')
-    driver_data['key'] = driver_data['year'] * 1000 * 1000 \
-                            + driver_data['round'] * 1000 \
-                            + driver_data['DriverNumber']
-    driver_data = driver_data.set_index('key')
-
-    df = df.join(driver_data, how='left', rsuffix='_r')\
-            .dropna()\
-            .reset_index()
+    driver_data = store.read(
+                    CLEANED, 'Driver Metrics',
+                    columns=[
+                        'year', 'round', 'DriverNumber',
+                        'PointsAtStart', 'BestLapTimeDelta'
+                    ],
+                    filters=filters
+                )
+
+    return track_data, weather_data, lap_data, driver_data
+
+
+def build_model_data(track_data,
+                     weather_data,
+                     lap_data,
+                     driver_data,
+                     weather_tolerance=weather_tolerance,
+                     interpolate_weather=False):
+    """
+    Join laps with the weather, track and driver features of their event
+
+    Parameters:
+    - weather_tolerance: Largest gap, in seconds, between a lap and the
+                         weather sample it is given
+    - interpolate_weather: Interpolate the weather to the middle of the
+                           lap instead of taking the sample nearest its start
+
+    The share of laps that found a weather sample is kept in
+    df.attrs['WeatherHitRate']
+    """
+    if interpolate_weather:
+        lap_data = lap_data.assign(
+                        WeatherTime=lap_data['LapStartTime'] + lap_data['LapTime'] / 2
+                    )
+    else:
+        lap_data = lap_data.assign(WeatherTime=lap_data['LapStartTime'])
+
+    samples = len(weather_data)
+    weather_data = weather_data.dropna()
+    tracer.count_dropped('join.weather.dropna', samples, len(weather_data))
+
+    df, weather_hit_rate = asof_join(
+                    lap_data,
+                    weather_data,
+                    left_on='WeatherTime',
+                    right_on='Time',
+                    tolerance=weather_tolerance,
+                    interpolate=[col for col in weather_features if col != 'Rain']
+                                    if interpolate_weather else None
+                )
+    df = df.merge(track_data, on=['year', 'round'], how='left', suffixes=('', '_r'))
+    df = df.merge(driver_data, on=['year', 'round', 'DriverNumber'], how='left', suffixes=('', '_r'))
     df = df.drop(
-                    ['key'] + 
                     [
                         col 
                         for col in df.columns 
@@ -86,43 +220,33 @@ def main():
                 'PointsAtStart', 'BestLapTimeDelta',
                 'LapTime'
             ]]
+    laps = len(df)
+    df = df.dropna()
+    tracer.count_dropped('join.dropna', laps, len(df))
+
+    # A partition can lose every lap to the joins
+    if len(df) == 0:
+        df = empty_frame(model_columns)
+        df.attrs['WeatherHitRate'] = weather_hit_rate
+        return df
+
+    # Tyre life on each compound, without a dense one-hot matrix
+    features = feature_builder.transform(df)
+    df = pd.concat([df[key_columns + [target_column]], features], axis=1)
+    df = apply_schema(df[model_columns])
+    df.attrs['WeatherHitRate'] = weather_hit_rate
+    
+    return df
 
-    categorical_columns = ['Compound']
-    preserved_columns = ['year', 'round', 'DriverNumber', 'LapTime']
-    numerical_columns = [
-        'LapsLeft', 'TyreLife', 'AirTemp', 'TrackTemp', 'Rain', 
-        'HumidityWindInteraction', 'WindChillFactor', 'SurfaceGripIndex', 
-        'TrackLength', 'NumberOfCorners', 'TotalCurvature', 'MaxCurvature', 
-        'CurvatureSD', 'MinElevation', 'TotalElevationChange', 'ElevationSD', 
-        'PointsAtStart', 'BestLapTimeDelta'
-    ]
-
-    onehot_encoder = OneHotEncoder(handle_unknown='ignore')
-    compound_encoded = onehot_encoder.fit_transform(df[categorical_columns]).toarray()
-
-    tyre_life = df['TyreLife'].values.reshape(-1, 1)
-    multiplied_features = compound_encoded * tyre_life
-
-    other_features = df[preserved_columns + numerical_columns].values
-    X_transformed = np.hstack([multiplied_features, other_features])
 
-    compound_feature_names = onehot_encoder.get_feature_names_out(['Compound'])
-    feature_names = list(compound_feature_names) + preserved_columns + numerical_columns
+def export_report(path=None):
+    """
+    Export the model data as a workbook, for the R analysis and for
+    reading outside Python, by default to Data.xlsx in the configured
+    data folder
+    """
+    path = data_path('Data.xlsx') if path is None else path
+    df = get_store().read(PROCESSED, 'Data')
+    export_excel(df, path)
 
-    df = pd.DataFrame(X_transformed, columns=feature_names, index=df.index)
-    df = df[[
-                'year', 'round', 'DriverNumber',
-                'Compound_SOFT', 'Compound_MEDIUM', 'Compound_HARD', 
-                'Compound_INTERMEDIATE', 'Compound_WET', 
-                'LapsLeft', 
-                'AirTemp', 'TrackTemp', 'Rain',
-                'HumidityWindInteraction', 'WindChillFactor', 'SurfaceGripIndex',
-                'TrackLength', 'NumberOfCorners', 'TotalCurvature', 'MaxCurvature',
-                'CurvatureSD', 'MinElevation', 'TotalElevationChange', 'ElevationSD',
-                'PointsAtStart', 'BestLapTimeDelta',
-                'LapTime',
-       ]]
-    
-    df.to_excel(output_path + "Data.xlsx", index=False)
-    
-    return df
\ No newline at end of file
+    return df
@@ -0,0 +1,210 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import pandas as pd
+from helpers.config import working_directory
+from helpers.workQueue import WorkQueue, LeaseLost, DONE, FAILED
+from helpers.storage import ParquetStore, get_store, RAW
+from helpers.manifest import get_manifest
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.dataCollection.syntheticSession import use_synthetic_sessions
+import scripts.dataCollection as dataCollection
+
+# Folder of the queue the workers write their partitions to
+OUTPUTS = 'Outputs'
+
+# Folder of the queue partitions are written to, one subfolder per
+# worker, before the task is completed
+STAGING = 'Staging'
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect events on several machines through a shared-directory work queue")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = commands.add_parser('enqueue', help="Queue a (year, round, collector) task for every event of the calendar")
+    enqueue.add_argument('--queue', required=True, help="Queue folder on the shared filesystem")
+
+    worker = commands.add_parser('worker', help="Claim and run tasks until the queue is finished")
+    worker.add_argument('--queue', required=True)
+    worker.add_argument('--lease-seconds', type=float, default=300,
+                        help="Time without a heartbeat after which a task is requeued")
+    worker.add_argument('--max-tasks', type=int, default=None, help="Tasks to run before exiting")
+    worker.add_argument('--synthetic', type=int, metavar='EVENTS', default=None,
+                        help="Collect synthetic sessions of a season of EVENTS events")
+
+    merge = commands.add_parser('merge', help="Write the collected partitions to the pipeline store")
+    merge.add_argument('--queue', required=True)
+
+    local = commands.add_parser('local', help="Enqueue, run worker processes on this machine and merge")
+    local.add_argument('--queue', default=None, help="Queue folder, defaults to Queue/ in the working folder")
+    local.add_argument('--workers', type=int, default=4)
+    local.add_argument('--lease-seconds', type=float, default=30)
+    local.add_argument('--synthetic', type=int, metavar='EVENTS', default=None,
+                       help="Run on synthetic sessions in a temporary folder")
+
+    args = parser.parse_args()
+    if args.command == 'enqueue':
+        enqueue_tasks(args.queue)
+    elif args.command == 'worker':
+        if args.synthetic is not None:
+            use_synthetic_sessions(shared_pool, n_rounds=args.synthetic)
+        run_worker(args.queue, args.lease_seconds, args.max_tasks)
+    elif args.command == 'merge':
+        merge_outputs(args.queue)
+    elif args.synthetic is not None:
+        with tempfile.TemporaryDirectory() as root, working_directory(root):
+            use_synthetic_sessions(shared_pool, n_rounds=args.synthetic)
+            run_local(args.queue or 'Queue', args.workers, args.lease_seconds, args.synthetic)
+    else:
+        run_local(args.queue or 'Queue', args.workers, args.lease_seconds)
+
+
+def task_id(year, round_number, table):
+    """
+    Id of a task, sorting the collectors of an event together
+    """
+    return f"{int(year)}-{int(round_number):02d}-{table.replace(' ', '_')}"
+
+
+def enqueue_tasks(queue_root, races=None):
+    """
+    Queue every collector of every event of the calendar that is not
+    queued or done yet
+    """
+    races = dataCollection.read_races() if races is None else races
+    queue = WorkQueue(queue_root)
+    added = queue.enqueue([
+        {
+            'id': task_id(race.year, race.round, table),
+            'year': int(race.year),
+            'round': int(race.round),
+            'location': race.location,
+            'table': table,
+        }
+        for race in races.itertuples()
+        for table in dataCollection.collectors
+    ])
+    print(f"Queued {len(added)} tasks in {queue_root}: {queue.counts()}")
+
+    return added
+
+
+def run_worker(queue_root, lease_seconds=300, max_tasks=None, idle_wait=None):
+    """
+    Claim tasks and write their partitions to the queue's output store
+    until no task is pending or leased. Tasks of the event this worker
+    last collected are claimed first, as its session is still pooled
+
+    Parameters:
+    - idle_wait: Seconds to wait when every remaining task is leased
+                 by other workers, defaults to a tenth of the lease
+    """
+    queue = WorkQueue(queue_root, lease_seconds=lease_seconds)
+    outputs = ParquetStore(os.path.join(queue_root, OUTPUTS))
+    staging = ParquetStore(os.path.join(queue_root, STAGING, queue.worker_id))
+    idle_wait = lease_seconds / 10 if idle_wait is None else idle_wait
+    last_event = None
+    completed = 0
+
+    while max_tasks is None or completed < max_tasks:
+        task = queue.claim(prefer=lambda name: last_event is not None and name.startswith(last_event))
+        if task is None:
+            if queue.finished():
+                break
+            # Others hold the remaining leases, which may yet expire
+            time.sleep(idle_wait)
+            continue
+
+        last_event = task_id(task['year'], task['round'], '')
+        race = pd.Series({'year': task['year'], 'round': task['round'], 'location': task['location']})
+        try:
+            with queue.lease(task):
+                df = dataCollection.collectors[task['table']](race)
+            # Staged under this worker, and moved into the outputs by
+            # complete only if the lease is still held
+            partition = (RAW, task['table'], task['year'], task['round'])
+            staging.write_partition(*partition, df)
+            queue.complete(task, {'rows': len(df)}, outputs={
+                staging.partition_path(*partition): outputs.partition_path(*partition)
+            })
+        except LeaseLost:
+            print(f"{task['id']} was requeued while running, leaving it to its new worker")
+            continue
+        except Exception as error:
+            print(f"{queue.worker_id} failed {task['id']} (attempt {task['attempts']}):")
+            traceback.print_exc()
+            try:
+                queue.fail(task, error)
+            except LeaseLost:
+                pass
+            continue
+        completed += 1
+
+    print(f"{queue.worker_id} completed {completed} tasks")
+    return completed
+
+
+def merge_outputs(queue_root, store=None):
+    """
+    Write the partitions of every event whose collectors all finished
+    to the pipeline store, checkpointing them in the manifest so a
+    later --resume or --incremental run skips them
+    """
+    queue = WorkQueue(queue_root)
+    outputs = ParquetStore(os.path.join(queue_root, OUTPUTS))
+    store = get_store() if store is None else store
+    manifest = get_manifest()
+    fingerprints = dataCollection.race_fingerprints(dataCollection.read_races())
+    done = {(task['year'], task['round'], task['table']) for task in queue.tasks(DONE)}
+
+    merged = []
+    for year, round_number in sorted(fingerprints):
+        if not all((year, round_number, table) in done for table in dataCollection.collectors):
+            continue
+        partition_filters = [('year', '==', year), ('round', '==', round_number)]
+        for table in dataCollection.collectors:
+            store.write_partition(RAW, table, year, round_number,
+                                  outputs.read(RAW, table, filters=partition_filters))
+        manifest.record(RAW, year, round_number, fingerprints[(year, round_number)])
+        merged.append((year, round_number))
+
+    for task in queue.tasks(FAILED):
+        print(f"Failed after {task['attempts']} attempts: {task['id']} ({task.get('error')})")
+    print(f"Merged {len(merged)} of {len(fingerprints)} events into the {RAW} stage")
+
+    return merged
+
+
+def run_local(queue_root, workers=4, lease_seconds=30, synthetic=None):
+    """
+    Run the distributed collection on this machine, with worker
+    processes sharing a local folder as the queue
+    """
+    dataCollection.store_race_calendar()
+    enqueue_tasks(queue_root)
+
+    command = [
+        sys.executable, '-m', 'scripts.distributedCollection', 'worker',
+        '--queue', os.path.abspath(queue_root), '--lease-seconds', str(lease_seconds),
+    ] + (['--synthetic', str(synthetic)] if synthetic is not None else [])
+    environment = {**os.environ, 'PYTHONPATH': os.pathsep.join(
+                        filter(None, [repo_root, os.environ.get('PYTHONPATH')])
+                    )}
+    started = time.perf_counter()
+    processes = [subprocess.Popen(command, env=environment) for _ in range(workers)]
+    codes = [process.wait() for process in processes]
+    print(f"{workers} workers finished in {time.perf_counter() - started:.1f}s "
+          f"(exit codes {codes}): {WorkQueue(queue_root).counts()}")
+
+    return merge_outputs(queue_root)
+
+
+if __name__ == "__main__":
+    main()
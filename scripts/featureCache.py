@@ -0,0 +1,65 @@
+import argparse
+import time
+from helpers.featureCache import feature_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the derived-feature cache")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help="List cached entries, most recently used first")
+
+    prune = commands.add_parser('prune', help="Remove cached entries")
+    prune.add_argument('--keep-stale', action='store_true',
+                       help="Keep entries whose collector code changed")
+    prune.add_argument('--collector', default=None,
+                       help="Remove every entry of this collector class")
+    prune.add_argument('--older-than-days', type=float, default=None,
+                       help="Remove entries not used for this many days")
+    prune.add_argument('--max-size-mb', type=float, default=None,
+                       help="Evict least recently used entries above this size")
+
+    args = parser.parse_args()
+    if args.command == 'list':
+        list_entries()
+    else:
+        prune_entries(
+            stale=not args.keep_stale,
+            collector=args.collector,
+            older_than_days=args.older_than_days,
+            max_size_mb=args.max_size_mb
+        )
+
+
+def list_entries():
+    entries = feature_cache.entries()
+    for entry in entries:
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))
+        print(f"{entry['key'][:12]}  {entry['year']} {entry['grand_prix']:<20} "
+              f"{entry['collector']}.{entry['method']:<28} "
+              f"{entry['size'] / 1024:>9.1f} KB  {last_used}"
+              f"{'  (stale)' if entry['stale'] else ''}")
+
+    total = sum(entry['size'] for entry in entries)
+    print(f"{len(entries)} entries, {total / 1024**2:.1f} MB")
+
+
+def prune_entries(stale=True,
+                  collector=None,
+                  older_than_days=None,
+                  max_size_mb=None):
+    removed = feature_cache.prune(
+                    stale=stale,
+                    collector=collector,
+                    older_than=None if older_than_days is None
+                                else older_than_days * 24 * 3600
+                )
+    if max_size_mb is not None:
+        removed += feature_cache.evict(max_bytes=max_size_mb * 1024**2)
+
+    print(f"Removed {len(removed)} entries, "
+          f"{sum(entry['size'] for entry in removed) / 1024**2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from helpers import config
+from helpers.config import working_directory
+from helpers.dataCollection.sessionPool import shared_pool
+from helpers.dataCollection.syntheticSession import use_synthetic_sessions
+from helpers.dataCollection import pointsLedger
+from helpers.featureCache import feature_cache
+from helpers.storage import configure_store, RAW, CLEANED
+import scripts.dataCollection as dataCollection
+import scripts.dataPreprocessing as dataPreprocessing
+import scripts.dataProcessing as dataProcessing
+
+cleaners = {
+    'Track Geometry': dataPreprocessing.clean_track_geom_data,
+    'Track Weather': dataPreprocessing.clean_track_weath_data,
+    'Race Telemetry': dataPreprocessing.clean_race_telemetry,
+    'Driver Metrics': dataPreprocessing.clean_driver_metrics,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and memory-profile every pipeline stage on synthetic sessions")
+    parser.add_argument('--events', type=int, default=4, help="Events in the synthetic season")
+    parser.add_argument('--drivers', type=int, default=20, help="Drivers on the grid")
+    parser.add_argument('--laps', type=int, default=57, help="Race laps per event")
+    parser.add_argument('--hz', type=float, default=4, help="Telemetry samples per second")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Relative slowdown or memory growth flagged as a regression")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = run_pipeline_benchmark(
+                    n_events=args.events,
+                    n_drivers=args.drivers,
+                    n_laps=args.laps,
+                    hz=args.hz
+                )
+    display_results(results)
+
+    if args.update_baseline or not os.path.exists(baseline_path()):
+        save_baseline(results)
+        print(f"Baseline stored in {baseline_path()}")
+        return
+
+    regressions = find_regressions(results, load_baseline(), args.tolerance)
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"\t- {regression}")
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+def run_pipeline_benchmark(n_events=4, n_drivers=20, n_laps=57, hz=4):
+    """
+    Run every stage of the pipeline event by event on synthetic
+    sessions, in a temporary data folder, and measure each call
+
+    Returns {stage: {'events', 'per_event_s', 'season_s', 'peak_mb'}}
+    plus the settings the run used under 'settings'
+    """
+    settings = {'events': n_events, 'drivers': n_drivers, 'laps': n_laps, 'hz': hz}
+    measurements = {}
+
+    loader, schedule_loader = shared_pool.loader, shared_pool.schedule_loader
+    cache_enabled = feature_cache.enabled
+    data_dir = config.settings['data_dir']
+    with tempfile.TemporaryDirectory() as root, working_directory(root):
+        # Every stage reads and writes the temporary folder's data
+        config.configure(data_dir=os.path.join(root, 'Data'))
+        use_synthetic_sessions(
+                    shared_pool,
+                    n_drivers=n_drivers, n_laps=n_laps, hz=hz, n_rounds=n_events
+                )
+        pointsLedger._ledgers.clear()
+        feature_cache.enabled = False
+        store = configure_store('parquet')
+        try:
+            measure(measurements, 'calendar', dataCollection.store_race_calendar)
+            races = dataCollection.read_races()
+
+            for i in range(len(races)):
+                race = races.iloc[i]
+                for table, collect in dataCollection.collectors.items():
+                    df = measure(measurements, 'collect/' + table, collect, race)
+                    store.write_partition(RAW, table, race['year'], race['round'], df)
+
+            for table, clean in cleaners.items():
+                for (year, round_number), raw in store.iter_partitions(RAW, table):
+                    df = measure(measurements, 'clean/' + table, clean, raw)
+                    store.write_partition(CLEANED, table, year, round_number, df)
+
+            for year, round_number in store.partitions(CLEANED, 'Race Telemetry'):
+                tables = dataProcessing.read_cleaned_tables(
+                            filters=[('year', '==', year), ('round', '==', round_number)]
+                        )
+                measure(measurements, 'join', dataProcessing.build_model_data, *tables)
+        finally:
+            shared_pool.clear()
+            shared_pool.loader, shared_pool.schedule_loader = loader, schedule_loader
+            pointsLedger._ledgers.clear()
+            feature_cache.enabled = cache_enabled
+            config.settings['data_dir'] = data_dir
+            configure_store()
+
+    results = {
+        stage: {
+            'events': len(calls),
+            'per_event_s': sum(seconds for seconds, _ in calls) / len(calls),
+            'season_s': sum(seconds for seconds, _ in calls),
+            'peak_mb': max(peak for _, peak in calls) / 1024**2,
+        }
+        for stage, calls in measurements.items()
+    }
+    results['settings'] = settings
+    return results
+
+
+def measure(measurements, stage, function, *args):
+    """
+    Call function, recording its wall time and peak Python allocation
+    under the given stage
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    measurements.setdefault(stage, []).append((seconds, peak))
+    return result
+
+
+def find_regressions(results, baseline, tolerance=0.25):
+    """
+    Stages whose season time or peak memory grew by more than tolerance
+    """
+    if results['settings'] != baseline.get('settings'):
+        return [f"settings {results['settings']} differ from the baseline's "
+                f"{baseline.get('settings')}; rerun with --update-baseline"]
+
+    regressions = []
+    for stage, current in results.items():
+        if stage == 'settings' or stage not in baseline:
+            continue
+        for metric in ('season_s', 'peak_mb'):
+            if current[metric] > baseline[stage][metric] * (1 + tolerance):
+                regressions.append(
+                    f"{stage} {metric}: {baseline[stage][metric]:.3f} -> {current[metric]:.3f}"
+                )
+    return regressions
+
+
+def display_results(results):
+    print(f"Pipeline benchmark, {results['settings']}:")
+    for stage, result in results.items():
+        if stage == 'settings':
+            continue
+        print(f"\t- {stage:<28} {result['per_event_s'] * 1000:>9.1f} ms/event "
+              f"{result['season_s']:>8.2f} s/season {result['peak_mb']:>8.1f} MB peak")
+
+
+def baseline_path():
+    return os.path.abspath(config.data_path('Benchmarks', 'Pipeline Baseline.json'))
+
+
+def save_baseline(results):
+    os.makedirs(os.path.dirname(baseline_path()), exist_ok=True)
+    with open(baseline_path(), 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_baseline():
+    with open(baseline_path()) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    main()
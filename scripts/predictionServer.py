@@ -0,0 +1,273 @@
+import argparse
+import json
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+import numpy as np
+import pandas as pd
+from helpers.lapTimeModel import LapTimeModel, EventFeatures
+from helpers.storage import get_store, CLEANED
+
+# Columns every lap of a request must hold
+REQUEST_COLUMNS = [
+    'year', 'round', 'DriverNumber',
+    'Compound', 'TyreLife', 'LapsLeft',
+    'AirTemp', 'TrackTemp', 'Humidity', 'WindSpeed', 'Rainfall',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve lap-time predictions of the trained model")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help="Fit a model on the model matrix and save it")
+    train.add_argument('--model', default=None,
+                       help="Folder the model is saved to, defaults to Models/Lap Time Model/ in the data folder")
+    train.add_argument('--max-depth', type=int, default=15, help="Depth of the random forest's trees")
+
+    serve = commands.add_parser('serve', help="Answer POST /predict requests")
+    serve.add_argument('--model', default=None,
+                       help="Folder the model is loaded from, defaults to Models/Lap Time Model/ in the data folder")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--max-batch', type=int, default=256, help="Laps predicted in one call")
+    serve.add_argument('--max-wait-ms', type=float, default=2.0,
+                       help="Time a request waits for others to share its batch")
+
+    load_test = commands.add_parser('loadtest', help="Measure latency and throughput of a server")
+    load_test.add_argument('--url', default=None,
+                           help="Server to test, defaults to one started in this process")
+    load_test.add_argument('--model', default=None)
+    load_test.add_argument('--clients', type=int, default=8, help="Concurrent clients")
+    load_test.add_argument('--laps', type=int, default=20, help="Laps per request")
+    load_test.add_argument('--duration', type=float, default=10.0, help="Seconds to run for")
+
+    args = parser.parse_args()
+    if args.command == 'train':
+        from sklearn.ensemble import RandomForestRegressor
+        model = LapTimeModel.train(RandomForestRegressor(max_depth=args.max_depth, random_state=42))
+        print(f"Model saved to {model.save(args.model)}")
+    elif args.command == 'serve':
+        server = create_server(args.model, args.host, args.port, args.max_batch, args.max_wait_ms)
+        print(f"Serving predictions on http://{args.host}:{server.server_port}/predict")
+        server.serve_forever()
+    else:
+        run_load_test(args.url, args.model, args.clients, args.laps, args.duration)
+
+
+class MicroBatcher:
+    def __init__(self,
+                 predict,
+                 max_batch=256,
+                 max_wait_ms=2.0):
+        """
+        Gathers the laps of concurrent requests into one model call.
+        A batch is predicted once it holds max_batch laps, or when its
+        first request has waited max_wait_ms
+
+        Parameters:
+        - predict: Callable taking a lap frame and returning one
+                   prediction per row
+        - max_batch: Laps above which a batch is closed
+        - max_wait_ms: Longest time a request waits for others
+        """
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+
+    def submit(self, laps):
+        """
+        Future of the predictions of a lap frame
+        """
+        future = Future()
+        self._queue.put((laps, future))
+        return future
+
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                size += len(batch[-1][0])
+            self._predict_batch(batch)
+
+
+    def _predict_batch(self, batch):
+        try:
+            predictions = self.predict(pd.concat([laps for laps, _ in batch], ignore_index=True))
+        except Exception as error:
+            # One bad request fails alone, the others are retried without it
+            if len(batch) > 1:
+                for item in batch:
+                    self._predict_batch([item])
+            else:
+                batch[0][1].set_exception(error)
+            return
+
+        start = 0
+        for laps, future in batch:
+            future.set_result(predictions[start:start + len(laps)])
+            start += len(laps)
+
+
+class PredictionService:
+    def __init__(self,
+                 model,
+                 event_features,
+                 max_batch=256,
+                 max_wait_ms=2.0):
+        """
+        Model and per-event features kept in memory between requests,
+        with the requests micro-batched into model calls
+        """
+        self.model = model
+        self.event_features = event_features
+        self.batcher = MicroBatcher(self._predict, max_batch, max_wait_ms)
+
+
+    def predict(self, laps):
+        """
+        Lap times of a list of lap dicts holding REQUEST_COLUMNS
+        """
+        laps = pd.DataFrame(laps)
+        missing = [col for col in REQUEST_COLUMNS if col not in laps.columns]
+        if missing:
+            raise ValueError(f"Laps are missing {missing}")
+        return self.batcher.submit(laps[REQUEST_COLUMNS]).result()
+
+
+    def _predict(self, laps):
+        return self.model.predict(self.event_features.assemble(laps))
+
+
+def create_server(path=None, host='127.0.0.1', port=8765, max_batch=256, max_wait_ms=2.0):
+    """
+    HTTP server answering POST /predict with {"laps": [...]} by
+    {"LapTime": [...]}, with the model and every stored event warm
+    """
+    event_features = EventFeatures()
+    event_features.warm(get_store().partitions(CLEANED, 'Driver Metrics'))
+    service = PredictionService(LapTimeModel.load(path), event_features, max_batch, max_wait_ms)
+
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/predict':
+                return self._reply(404, {'error': f'Unknown path {self.path}'})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                if length <= 0:
+                    return self._reply(400, {'error': 'Request has no body'})
+                body = json.loads(self.rfile.read(length))
+                predictions = service.predict(body['laps'])
+            except (KeyError, ValueError, TypeError) as error:
+                return self._reply(400, {'error': str(error)})
+            except Exception as error:
+                traceback.print_exc()
+                return self._reply(500, {'error': f'{type(error).__name__}: {error}'})
+            self._reply(200, {'LapTime': [float(p) for p in predictions]})
+
+
+        def _reply(self, status, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+
+        def log_message(self, *args):
+            # One line per request would dominate a load test
+            pass
+
+    return ThreadingHTTPServer((host, port), PredictionHandler)
+
+
+def run_load_test(url=None, path=None, clients=8, laps=20, duration=10.0):
+    """
+    Send requests of random laps from concurrent clients for a while,
+    and report latency percentiles and throughput
+    """
+    server = None
+    if url is None:
+        server = create_server(path, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/predict'
+
+    sample = sample_laps(laps * clients)
+    deadline = time.perf_counter() + duration
+
+    def client(seed):
+        rng = np.random.default_rng(seed)
+        latencies = []
+        while time.perf_counter() < deadline:
+            rows = rng.choice(len(sample), size=laps)
+            body = json.dumps({'laps': sample.iloc[rows].to_dict(orient='records')}).encode()
+            start = time.perf_counter()
+            with urlrequest.urlopen(urlrequest.Request(
+                        url, data=body, headers={'Content-Type': 'application/json'}
+                    )) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = np.concatenate([
+            np.asarray(result, dtype=float)
+            for result in executor.map(client, range(clients))
+        ])
+    elapsed = time.perf_counter() - started
+
+    if server is not None:
+        server.shutdown()
+
+    print(f"Load test, {clients} clients x {laps} laps per request for {elapsed:.1f}s:")
+    print(f"\t- Requests: {len(latencies)}")
+    print(f"\t- Latency p50: {np.percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"\t- Latency p99: {np.percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"\t- Throughput: {len(latencies) / elapsed:.1f} requests/s, "
+          f"{len(latencies) * laps / elapsed:.1f} laps/s")
+    return latencies
+
+
+def sample_laps(n):
+    """
+    Plausible laps of the stored events to send in a load test
+    """
+    store = get_store()
+    drivers = store.read(CLEANED, 'Driver Metrics', columns=['year', 'round', 'DriverNumber'])
+    rng = np.random.default_rng(0)
+    laps = drivers.iloc[rng.choice(len(drivers), size=n)].reset_index(drop=True)
+    return laps.assign(
+                DriverNumber=laps['DriverNumber'].astype(int),
+                Compound=rng.choice(['SOFT', 'MEDIUM', 'HARD'], size=n),
+                TyreLife=rng.integers(1, 35, size=n),
+                LapsLeft=rng.integers(0, 60, size=n),
+                AirTemp=rng.uniform(15, 35, size=n).round(1),
+                TrackTemp=rng.uniform(20, 55, size=n).round(1),
+                Humidity=rng.uniform(20, 90, size=n).round(1),
+                WindSpeed=rng.uniform(0, 6, size=n).round(1),
+                Rainfall=False,
+            ).astype({'year': int, 'round': int})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Modules the pipeline entry points are imported as
+entry_points = [
+    'dataPipeline',
+    'scripts.initialization',
+    'scripts.dataCollection',
+    'scripts.dataPreprocessing',
+    'scripts.dataProcessing',
+]
+
+# Imports deferred until they are needed, reported when an entry point
+# pulls them in anyway
+heavy_modules = ['fastf1', 'sklearn', 'scipy', 'matplotlib']
+
+# Run in a fresh interpreter, so nothing is already imported
+_probe = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': seconds,
+    'loaded': [m for m in {heavy} if m in sys.modules],
+}}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the import of every pipeline entry point")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per entry point")
+    args = parser.parse_args()
+
+    print(f"Import time, best of {args.repeat} fresh interpreters:")
+    for module in entry_points + heavy_modules[:2]:
+        seconds, loaded = time_import(module, repeat=args.repeat)
+        reference = ' (reference)' if module in heavy_modules else ''
+        print(f"\t- {module + reference:<28} {seconds * 1000:>8.1f} ms"
+              f"   heavy imports: {', '.join(loaded) or 'none'}")
+
+
+def time_import(module, repeat=5):
+    """
+    Best import time of a module in a fresh interpreter, with the heavy
+    modules it loaded
+    """
+    best, loaded = float('inf'), []
+    for _ in range(repeat):
+        output = subprocess.run(
+                    [sys.executable, '-c', _probe.format(module=module, heavy=heavy_modules)],
+                    cwd=os.getcwd(),
+                    capture_output=True,
+                    text=True,
+                    check=True
+                ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if result['seconds'] < best:
+            best, loaded = result['seconds'], result['loaded']
+    return best, loaded
+
+
+if __name__ == "__main__":
+    main()
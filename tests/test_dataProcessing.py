@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from helpers.dataProcessing import asof_join
+
+
+def laps(times, round_number=1):
+    return pd.DataFrame({'year': 2023, 'round': round_number, 'LapStartTime': times})
+
+
+def weather(times, values, round_number=1):
+    return pd.DataFrame({'year': 2023, 'round': round_number, 'Time': times, 'AirTemp': values})
+
+
+def test_tolerance_keeps_gaps_up_to_and_including_it():
+    df, share = asof_join(laps([100.0, 130.0, 130.5]), weather([70.0], [20.0]),
+                          left_on='LapStartTime', right_on='Time', tolerance=60)
+    np.testing.assert_array_equal(df['AirTemp'].isna(), [False, False, True])
+    assert share == pytest.approx(2 / 3)
+
+
+def test_nearest_sample_wins_and_ties_take_the_earlier_one():
+    df, _ = asof_join(laps([14.0, 16.0, 15.0]), weather([10.0, 20.0], [1.0, 2.0]),
+                      left_on='LapStartTime', right_on='Time')
+    np.testing.assert_array_equal(df['AirTemp'], [1.0, 2.0, 1.0])
+
+
+def test_rows_only_match_within_their_event():
+    left = pd.concat([laps([100.0], round_number=1), laps([100.0], round_number=2)])
+    right = weather([100.0], [20.0], round_number=2)
+    df, share = asof_join(left, right, left_on='LapStartTime', right_on='Time', tolerance=1000)
+    assert df['AirTemp'].isna().tolist() == [True, False]
+    assert share == 0.5
+
+
+def test_missing_times_never_match():
+    df, _ = asof_join(laps([np.nan, 10.0]), weather([10.0, np.nan], [1.0, 2.0]),
+                      left_on='LapStartTime', right_on='Time')
+    assert df['AirTemp'].isna().tolist() == [True, False]
+    assert df['AirTemp'].iloc[1] == 1.0
+
+
+def test_interpolation_between_the_samples_around_a_lap():
+    df, _ = asof_join(laps([12.5, 5.0, 20.0]), weather([10.0, 20.0], [1.0, 2.0]),
+                      left_on='LapStartTime', right_on='Time', tolerance=10, interpolate=['AirTemp'])
+    # Before the first sample and on the last one, the nearest is taken
+    np.testing.assert_allclose(df['AirTemp'], [1.25, 1.0, 2.0])
+
+
+def test_interpolation_respects_the_tolerance():
+    df, _ = asof_join(laps([15.0]), weather([0.0, 30.0], [1.0, 2.0]),
+                      left_on='LapStartTime', right_on='Time', tolerance=10, interpolate=['AirTemp'])
+    assert df['AirTemp'].isna().all()
+
+
+def test_no_right_rows_leaves_every_row_unmatched():
+    df, share = asof_join(laps([1.0, 2.0]), weather([], []), left_on='LapStartTime', right_on='Time')
+    assert df['AirTemp'].isna().all()
+    assert share == 0.0
@@ -0,0 +1,73 @@
+import numpy as np
+from sklearn.linear_model import Ridge
+from helpers.modelSearch import ModelSearch, FoldCache, _worker_source, _open_worker_source
+
+
+def uneven_races(seed=0):
+    """
+    Rows of races of very different sizes, so race folds differ in size
+    """
+    rng = np.random.default_rng(seed)
+    sizes = [40, 80, 120, 160, 200, 240]
+    keys = np.concatenate([
+        np.column_stack([np.full(size, 2023), np.full(size, r + 1)])
+        for r, size in enumerate(sizes)
+    ])
+    X = rng.normal(size=(len(keys), 3))
+    y = X @ np.array([1.0, -2.0, 0.5]) + rng.normal(0, 0.1, len(keys))
+    return X, y, keys
+
+
+def fold_sizes(search, X, y, keys):
+    return [len(train) for train, _ in search._folds(X, y, keys)]
+
+
+def test_full_folds_without_halving():
+    X, y, keys = uneven_races()
+    search = ModelSearch(Ridge(), {'alpha': [0.1, 1.0]}, n_splits=3, workers=1,
+                         cache=FoldCache(enabled=False)).fit(X, y, keys)
+
+    sizes = fold_sizes(search, X, y, keys)
+    assert len(set(sizes)) > 1
+    for result in search.results_:
+        assert result['resources'] == 1.0
+        assert result['train_rows'] == sizes
+
+
+def test_halving_subsamples_every_fold_by_the_same_share():
+    X, y, keys = uneven_races()
+    search = ModelSearch(Ridge(), {'alpha': [0.01, 0.1, 1.0, 10.0]}, n_splits=3, workers=1,
+                         factor=2, min_resources=100,
+                         cache=FoldCache(enabled=False)).fit(X, y, keys)
+
+    sizes = fold_sizes(search, X, y, keys)
+    first = search.results_[0]
+    assert first['resources'] < 1.0
+    assert first['train_rows'] == [int(round(size * first['resources'])) for size in sizes]
+
+    # The last round decides on the full folds
+    last = search.results_[-1]
+    assert last['resources'] == 1.0
+    assert last['train_rows'] == sizes
+
+
+def test_workers_open_memory_mapped_matrices_from_their_files(tmp_path):
+    X, y, keys = uneven_races()
+    np.save(tmp_path / 'X.npy', X)
+    np.save(tmp_path / 'y.npy', y)
+    X_map = np.load(tmp_path / 'X.npy', mmap_mode='r')
+    y_map = np.load(tmp_path / 'y.npy', mmap_mode='r')
+
+    source = _worker_source(X_map)
+    assert isinstance(source, dict)
+    np.testing.assert_array_equal(_open_worker_source(source), X)
+    # A slice doesn't span its file, so it is sent as an array
+    assert not isinstance(_worker_source(X_map[10:]), dict)
+
+    params = {'alpha': [0.1, 1.0]}
+    mapped = ModelSearch(Ridge(), params, n_splits=3, workers=1,
+                         cache=FoldCache(enabled=False)).fit(X_map, y_map, keys)
+    in_memory = ModelSearch(Ridge(), params, n_splits=3, workers=1,
+                            cache=FoldCache(enabled=False)).fit(X, y, keys)
+    assert [r['mean_score'] for r in mapped.results_] \
+        == [r['mean_score'] for r in in_memory.results_]
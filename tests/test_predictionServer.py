@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+from scripts.predictionServer import MicroBatcher, PredictionService, REQUEST_COLUMNS
+
+
+class RecordingModel:
+    """
+    Lap time of TyreLife + 80, recording the size of every call
+    """
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+
+    def predict(self, laps):
+        with self._lock:
+            self.calls.append(len(laps))
+        if (laps['TyreLife'] < 0).any():
+            raise ValueError("Negative tyre life")
+        return laps['TyreLife'].to_numpy(dtype=np.float64) + 80
+
+
+def lap_requests(tyre_life):
+    return [
+        {'year': 2023, 'round': 1, 'DriverNumber': 1, 'Compound': 'SOFT', 'TyreLife': life,
+         'LapsLeft': 10, 'AirTemp': 20.0, 'TrackTemp': 30.0, 'Humidity': 50.0,
+         'WindSpeed': 1.0, 'Rainfall': False}
+        for life in tyre_life
+    ]
+
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_rows():
+    model = RecordingModel()
+    batcher = MicroBatcher(model.predict, max_batch=1000, max_wait_ms=200)
+    requests = [pd.DataFrame({'TyreLife': [i, i + 100]}) for i in range(8)]
+
+    futures = [batcher.submit(laps) for laps in requests]
+    for i, future in enumerate(futures):
+        np.testing.assert_array_equal(future.result(timeout=5), [80 + i, 180 + i])
+    assert len(model.calls) < len(requests)
+    assert sum(model.calls) == 2 * len(requests)
+
+
+def test_a_batch_closes_at_max_batch():
+    model = RecordingModel()
+    batcher = MicroBatcher(model.predict, max_batch=4, max_wait_ms=200)
+    futures = [batcher.submit(pd.DataFrame({'TyreLife': [1, 2]})) for _ in range(4)]
+    for future in futures:
+        future.result(timeout=5)
+    assert max(model.calls) <= 4
+
+
+def test_a_bad_request_fails_alone():
+    model = RecordingModel()
+    batcher = MicroBatcher(model.predict, max_batch=1000, max_wait_ms=200)
+    good = batcher.submit(pd.DataFrame({'TyreLife': [1]}))
+    bad = batcher.submit(pd.DataFrame({'TyreLife': [-1]}))
+    other = batcher.submit(pd.DataFrame({'TyreLife': [2]}))
+
+    np.testing.assert_array_equal(good.result(timeout=5), [81])
+    np.testing.assert_array_equal(other.result(timeout=5), [82])
+    with pytest.raises(ValueError):
+        bad.result(timeout=5)
+
+
+class IdentityFeatures:
+    def assemble(self, laps):
+        assert list(laps.columns) == REQUEST_COLUMNS
+        return laps
+
+
+def test_service_answers_concurrent_clients():
+    service = PredictionService(RecordingModel(), IdentityFeatures(), max_wait_ms=20)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: service.predict(lap_requests([i, i + 1])), range(16)))
+    for i, predictions in enumerate(results):
+        np.testing.assert_array_equal(predictions, [80 + i, 81 + i])
+
+
+def test_service_rejects_laps_missing_columns():
+    service = PredictionService(RecordingModel(), IdentityFeatures())
+    laps = lap_requests([1])
+    del laps[0]['TrackTemp']
+    with pytest.raises(ValueError, match='TrackTemp'):
+        service.predict(laps)
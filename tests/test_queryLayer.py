@@ -0,0 +1,89 @@
+import pandas as pd
+import pytest
+from helpers.queryLayer import QueryLayer
+from helpers.storage import ParquetStore, CLEANED
+
+
+def event_tables(round_number, laps=3):
+    drivers = [1, 44]
+    race_telemetry = pd.DataFrame([
+        {'year': 2023, 'round': round_number, 'DriverNumber': driver, 'LapNumber': lap,
+         'LapStartTime': 60.0 * lap, 'LapTime': 90.0 + lap, 'Compound': 'SOFT', 'TyreLife': lap}
+        for driver in drivers
+        for lap in range(1, laps + 1)
+    ])
+    track_weather = pd.DataFrame({
+        'year': 2023, 'round': round_number,
+        'Time': [0.0, 120.0, 240.0], 'AirTemp': [20.0, 21.0, 22.0], 'TrackTemp': [30.0, 31.0, 32.0],
+    })
+    track_geometry = pd.DataFrame({'year': [2023], 'round': [round_number],
+                                   'TotalLaps': [laps], 'TrackLength': [5000.0]})
+    driver_metrics = pd.DataFrame({'year': 2023, 'round': round_number, 'DriverNumber': drivers,
+                                   'PointsAtStart': [10.0, 5.0], 'BestLapTimeDelta': [0.0, 0.2]})
+    return {
+        'Race Telemetry': race_telemetry,
+        'Track Weather': track_weather,
+        'Track Geometry': track_geometry,
+        'Driver Metrics': driver_metrics,
+    }
+
+
+def write_event(store, round_number, laps=3):
+    for table, df in event_tables(round_number, laps).items():
+        store.write_partition(CLEANED, table, 2023, round_number, df)
+
+
+@pytest.fixture
+def layer(tmp_path):
+    store = ParquetStore(str(tmp_path / 'Data'))
+    write_event(store, 1)
+    write_event(store, 2)
+    layer = QueryLayer(str(tmp_path / 'Pipeline.sqlite'), store=store)
+    yield layer
+    layer.close()
+
+
+def lap_counts(layer):
+    counts = layer.query('SELECT round, COUNT(*) AS Laps FROM lap_features GROUP BY round ORDER BY round')
+    return dict(zip(counts['round'], counts['Laps']))
+
+
+def test_first_refresh_builds_every_event(layer):
+    assert layer.refresh() == [(2023, 1), (2023, 2)]
+    assert lap_counts(layer) == {1: 6, 2: 6}
+    assert {'lap_features', 'driver_laps', 'event_summary'} <= set(layer.tables())
+
+
+def test_refresh_without_changes_rebuilds_nothing(layer):
+    layer.refresh()
+    assert layer.refresh() == []
+    assert lap_counts(layer) == {1: 6, 2: 6}
+
+
+def test_refresh_rebuilds_only_the_changed_event(layer):
+    layer.refresh()
+    write_event(layer.store, 2, laps=5)
+    write_event(layer.store, 3)
+
+    assert layer.refresh() == [(2023, 2), (2023, 3)]
+    assert lap_counts(layer) == {1: 6, 2: 10, 3: 6}
+    laps_left = layer.read(columns=['LapsLeft'], filters=[('round', '==', 2), ('LapNumber', '==', 1)])
+    assert laps_left['LapsLeft'].tolist() == [4, 4]
+
+
+def test_removed_partitions_are_dropped(layer):
+    layer.refresh()
+    layer.store.clear(CLEANED, 'Race Telemetry')
+    write_event(layer.store, 1)
+
+    layer.refresh()
+    assert lap_counts(layer) == {1: 6}
+
+
+def test_weather_is_joined_within_the_tolerance(layer):
+    layer.weather_tolerance = 30
+    layer.refresh()
+    weather = layer.read(columns=['LapNumber', 'AirTemp'],
+                         filters=[('round', '==', 1), ('DriverNumber', '==', 1)])
+    # Laps start at 60, 120 and 180 s, the samples are 120 s apart
+    assert weather.sort_values('LapNumber')['AirTemp'].isna().tolist() == [True, False, True]
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from helpers.raceSimulator import simulate_strategies, enumerate_strategies
+
+
+def lap_time_table(n_drivers=2, n_compounds=3, max_life=30, total_laps=30, seed=0):
+    """
+    Lap times growing with tyre life at a rate of each compound
+    """
+    rng = np.random.default_rng(seed)
+    base = 90 + rng.uniform(0, 1, size=(n_drivers, 1, 1, total_laps))
+    pace = np.array([0.0, 0.4, 0.8])[:n_compounds].reshape(1, -1, 1, 1)
+    wear = np.array([0.12, 0.06, 0.03])[:n_compounds].reshape(1, -1, 1, 1) \
+                * np.arange(max_life).reshape(1, 1, -1, 1)
+    return (base + pace + wear).astype(np.float32)
+
+
+def race_time(table, pits, compounds, pit_loss, initial_tyre_life=1):
+    """
+    A strategy's race time, lap by lap
+    """
+    _, _, max_life, total_laps = table.shape
+    times = np.zeros(table.shape[0])
+    stint, life = 0, initial_tyre_life
+    for lap in range(1, total_laps + 1):
+        times += table[:, compounds[stint], min(life, max_life) - 1, lap - 1]
+        life += 1
+        if stint < len(pits) and lap == pits[stint]:
+            stint, life = stint + 1, 1
+    stops = sum(1 for pit in pits if pit < total_laps)
+    return times + pit_loss * stops
+
+
+def test_strategies_respect_the_stint_rules():
+    pit_laps, compounds = enumerate_strategies(30, max_stops=2, min_stint=5, step=5)
+    assert pit_laps.shape[1] == 2 and compounds.shape[1] == 3
+    for pits, plan in zip(pit_laps, compounds):
+        stops = pits[pits < 30]
+        stints = np.diff(np.concatenate([[0], stops, [30]]))
+        assert (stints >= 5).all()
+        assert len(set(plan[:len(stops) + 1])) >= 2
+    # No one-compound race is left
+    assert (pit_laps == 30).all(axis=1).sum() == 0
+
+
+@pytest.mark.parametrize('initial_tyre_life', [1, 4])
+def test_simulated_times_match_a_lap_by_lap_sum(initial_tyre_life):
+    table = lap_time_table()
+    pit_laps, compounds = enumerate_strategies(30, max_stops=2, min_stint=5, step=3)
+    times = simulate_strategies(table, pit_laps, compounds, pit_loss=20.0,
+                                initial_tyre_life=initial_tyre_life)
+
+    assert times.shape == (2, len(pit_laps))
+    for s in range(0, len(pit_laps), 7):
+        np.testing.assert_allclose(
+                    times[:, s],
+                    race_time(table, pit_laps[s], compounds[s], 20.0, initial_tyre_life),
+                    rtol=1e-6
+                )
+
+
+def test_chunks_give_the_same_times():
+    table = lap_time_table()
+    strategies = enumerate_strategies(30, max_stops=2, min_stint=5, step=2)
+    np.testing.assert_allclose(
+                simulate_strategies(table, *strategies, chunk_size=50),
+                simulate_strategies(table, *strategies, chunk_size=len(strategies[0]))
+            )
+
+
+def test_tyre_life_beyond_the_table_is_capped():
+    table = lap_time_table(max_life=10)
+    pit_laps = np.array([[30]], dtype=np.int32)
+    compounds = np.array([[2, 2]], dtype=np.int32)
+    times = simulate_strategies(table, pit_laps, compounds)
+    np.testing.assert_allclose(times[:, 0], race_time(table, [30], [2, 2], 22.0), rtol=1e-6)
@@ -0,0 +1,92 @@
+import pandas as pd
+import pytest
+from helpers.storage import ParquetStore, ExcelStore, CLEANED
+
+FILTERS = [
+    None,
+    [('year', '==', 2023), ('round', '==', 2)],
+    [('round', 'in', [1, 3])],
+    [('round', '!=', 1), ('LapTime', '<', 91.0)],
+    [('Compound', '==', 'SOFT'), ('TyreLife', '>=', 3)],
+    [('DriverNumber', 'not in', [1]), ('round', '>', 1)],
+    [('round', '>', 9)],
+]
+
+
+def laps():
+    rows = []
+    for round_number in (1, 2, 3):
+        for driver in (1, 44):
+            for lap in range(1, 5):
+                rows.append({
+                    'year': 2023,
+                    'round': round_number,
+                    'DriverNumber': driver,
+                    'LapNumber': lap,
+                    'LapTime': 90.0 + round_number * 0.3 + lap * 0.1 + (driver == 44) * 0.5,
+                    'Compound': 'SOFT' if lap <= 2 else 'MEDIUM',
+                    'TyreLife': lap if lap <= 2 else lap - 2,
+                })
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture(params=[ParquetStore, ExcelStore])
+def store(request, tmp_path):
+    store = request.param(str(tmp_path))
+    store.write(CLEANED, 'Race Telemetry', laps())
+    return store
+
+
+def ordered(df):
+    return df.sort_values(['year', 'round', 'DriverNumber', 'LapNumber']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_filters_match_the_rows_of_the_table(store, filters):
+    df = store.read(CLEANED, 'Race Telemetry', filters=filters)
+
+    expected = laps()
+    for column, op, value in filters or []:
+        if op in ('in', 'not in'):
+            matches = expected[column].isin(value)
+            expected = expected[matches if op == 'in' else ~matches]
+        else:
+            expected = expected[{'==': expected[column] == value,
+                                 '!=': expected[column] != value,
+                                 '<': expected[column] < value,
+                                 '>': expected[column] > value,
+                                 '>=': expected[column] >= value}[op]]
+    pd.testing.assert_frame_equal(ordered(df), ordered(expected),
+                                  check_dtype=False, check_categorical=False)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_selected_columns_need_not_include_the_filter_columns(store, filters):
+    columns = ['DriverNumber', 'LapNumber', 'LapTime']
+    df = store.read(CLEANED, 'Race Telemetry', columns=columns, filters=filters)
+    full = store.read(CLEANED, 'Race Telemetry', filters=filters)
+
+    assert list(df.columns) == columns
+    pd.testing.assert_frame_equal(
+                df.sort_values(['DriverNumber', 'LapNumber', 'LapTime']).reset_index(drop=True),
+                full[columns].sort_values(['DriverNumber', 'LapNumber', 'LapTime']).reset_index(drop=True),
+                check_dtype=False
+            )
+
+
+def test_write_partition_replaces_only_its_event(store):
+    replacement = laps()
+    replacement = replacement[replacement['round'] == 2].head(3)
+    store.write_partition(CLEANED, 'Race Telemetry', 2023, 2, replacement)
+
+    assert store.partitions(CLEANED, 'Race Telemetry') == [(2023, 1), (2023, 2), (2023, 3)]
+    counts = store.read(CLEANED, 'Race Telemetry', columns=['round'])['round'].value_counts()
+    assert counts.to_dict() == {1: 8, 2: 3, 3: 8}
+
+
+def test_iter_partitions_yields_every_event_once(store):
+    seen = [
+        (partition, len(rows))
+        for partition, rows in store.iter_partitions(CLEANED, 'Race Telemetry', columns=['LapTime'])
+    ]
+    assert seen == [((2023, 1), 8), ((2023, 2), 8), ((2023, 3), 8)]
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from helpers.telemetryStore import TelemetryStore, CHANNEL_DTYPES
+
+
+def driver_telemetry(driver, samples):
+    """
+    Telemetry of one driver whose lap i has samples[i] samples, the
+    Speed of every sample encoding its driver, lap and position
+    """
+    n = sum(samples)
+    laps = np.repeat(np.arange(1, len(samples) + 1), samples)
+    position = np.concatenate([np.arange(count) for count in samples])
+    return {
+        'DriverNumber': driver,
+        'LapNumber': np.arange(1, len(samples) + 1),
+        'Samples': np.array(samples),
+        'Time': position * 0.25,
+        'Speed': driver + laps * 10 + position / 4,
+        'RPM': np.full(n, 11000),
+        'nGear': np.full(n, 7),
+        'Throttle': np.full(n, 100),
+        'Brake': np.zeros(n),
+        'DRS': np.zeros(n),
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    store.write_event(2023, 1, [driver_telemetry(1, [4, 6, 5]), driver_telemetry(44, [3, 3])])
+    return store
+
+
+def test_laps_are_indexed_end_to_end(store):
+    laps = store.laps(2023, 1)
+    assert laps[['DriverNumber', 'LapNumber']].values.tolist() == [[1, 1], [1, 2], [1, 3], [44, 1], [44, 2]]
+    assert laps['Start'].tolist() == [0, 4, 10, 15, 18]
+    assert laps['Stop'].tolist() == [4, 10, 15, 18, 21]
+
+
+def test_a_lap_reads_only_its_samples(store):
+    lap = store.read_lap(2023, 1, 1, 2)
+    assert list(lap.columns) == list(CHANNEL_DTYPES)
+    assert len(lap) == 6
+    np.testing.assert_allclose(lap['Speed'], 1 + 20 + np.arange(6) / 4)
+    np.testing.assert_allclose(lap['Time'], np.arange(6) * 0.25)
+
+    lap = store.read_lap(2023, 1, 44, 2, channels=['Speed'])
+    assert list(lap.columns) == ['Speed']
+    np.testing.assert_allclose(lap['Speed'], 44 + 20 + np.arange(3) / 4)
+
+
+def test_channels_are_stored_at_their_dtypes(store):
+    _, channels = store.read_event(2023, 1)
+    for channel, dtype in CHANNEL_DTYPES.items():
+        assert channels[channel].dtype == np.dtype(dtype)
+        assert len(channels[channel]) == 21
+
+
+def test_read_laps_labels_the_laps(store):
+    laps = store.read_laps(2023, 1, 1, laps=[1, 3], channels=['Speed'])
+    assert laps['LapNumber'].tolist() == [1] * 4 + [3] * 5
+
+
+def test_unknown_laps_raise(store):
+    with pytest.raises(KeyError):
+        store.read_lap(2023, 1, 44, 3)
+
+
+def test_rewriting_an_event_replaces_it(store):
+    store.write_event(2023, 1, [driver_telemetry(16, [2])])
+    assert store.laps(2023, 1)[['DriverNumber', 'LapNumber']].values.tolist() == [[16, 1]]
+    assert store.events() == [(2023, 1)]
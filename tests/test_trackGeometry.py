@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from helpers.dataCollection.circuitIndex import CircuitIndex, CircuitIndexCache
+from helpers.dataCollection.sessionPool import SessionPool
+from helpers.dataCollection.syntheticSession import SyntheticSessionLoader
+from helpers.dataCollection.trackGeometry import TrackGeometryAnalyzer
+
+
+@pytest.fixture
+def session_pool():
+    return SessionPool(loader=SyntheticSessionLoader(n_drivers=4, n_laps=20, n_rounds=1))
+
+
+def previous_geometry(session):
+    """
+    Track geometry as computed before the circuit index: every lap of
+    the first classified driver, reduced to per-lap metrics
+    """
+    telemetry = session.laps.pick_drivers(session.drivers[0]).get_telemetry()
+    positions = telemetry[['X', 'Y', 'Z']].to_numpy(dtype=np.float64) / 10
+    steps = np.diff(positions, axis=0)
+    distance = np.sqrt((steps ** 2).sum(axis=1))
+    angle_changes = np.diff(np.arctan2(steps[:, 1], steps[:, 0]))
+    elevation = positions[:, 2]
+    return {
+        'TrackLength': distance.sum() / session.total_laps,
+        'TotalLaps': session.total_laps,
+        'MaxElevation': np.nanmax(elevation),
+        'MinElevation': np.nanmin(elevation),
+        'TotalElevationChange': np.nanmax(elevation) - np.nanmin(elevation),
+        'ElevationSD': np.nanstd(elevation, ddof=1),
+        'NumberOfCorners': len(session.get_circuit_info().corners),
+        'TotalCurvature': np.abs(angle_changes).sum() / session.total_laps,
+        'MaxCurvature': np.abs(angle_changes).max(),
+        'CurvatureSD': np.std(angle_changes),
+    }
+
+
+def test_default_geometry_matches_previous_output(session_pool, tmp_path):
+    analyzer = TrackGeometryAnalyzer(2023, 'Synthetic 1', session_pool=session_pool,
+                                     circuit_index_cache=CircuitIndexCache(str(tmp_path)))
+    geometry = analyzer.calculate_track_geometry()
+
+    expected = previous_geometry(analyzer.session)
+    assert geometry.keys() == expected.keys()
+    for key, value in expected.items():
+        assert geometry[key] == pytest.approx(value, rel=1e-9)
+
+
+def test_reference_lap_geometry_is_close_to_previous_output(session_pool, tmp_path):
+    analyzer = TrackGeometryAnalyzer(2023, 'Synthetic 1', session_pool=session_pool, reference_lap=True,
+                                     circuit_index_cache=CircuitIndexCache(str(tmp_path)))
+    geometry = analyzer.calculate_track_geometry()
+
+    expected = previous_geometry(analyzer.session)
+    assert geometry['TotalLaps'] == expected['TotalLaps']
+    assert geometry['NumberOfCorners'] == expected['NumberOfCorners']
+    for key in ('TrackLength', 'TotalElevationChange'):
+        assert geometry[key] == pytest.approx(expected[key], rel=0.05)
+    # One lap against the average of the race, at the same sampling
+    for key in ('TotalCurvature', 'MaxCurvature', 'CurvatureSD'):
+        assert geometry[key] == pytest.approx(expected[key], rel=0.15)
+
+
+def synthetic_session():
+    session = SyntheticSessionLoader(n_drivers=4, n_laps=20, n_rounds=1)(2023, 1)
+    session.load()
+    return session
+
+
+def test_circuit_index_traces_the_fastest_lap():
+    session = synthetic_session()
+    index = CircuitIndex.from_session(session)
+
+    fastest = session.laps.pick_fastest()
+    lap = session.laps.pick_drivers(fastest['DriverNumber'])
+    lap = lap[lap['LapNumber'] == fastest['LapNumber']]
+    lap.session = session
+    trace = lap.get_telemetry()[['X', 'Y', 'Z']].to_numpy(dtype=np.float64) / 10
+    np.testing.assert_allclose(index.trace, trace)
+
+    # Reference line at 1 m spacing along the traced lap
+    assert index.length == pytest.approx(np.sqrt((np.diff(trace, axis=0) ** 2).sum(axis=1)).sum())
+    np.testing.assert_allclose(np.diff(index.distance), 1.0)
+    np.testing.assert_allclose(index.locate(index.reference), index.distance)
+
+
+def test_circuit_index_places_the_corners():
+    session = synthetic_session()
+    index = CircuitIndex.from_session(session)
+
+    corners = session.get_circuit_info().corners.sort_values('Distance')
+    np.testing.assert_array_equal(index.corner_numbers, corners['Number'].to_numpy())
+    np.testing.assert_allclose(index.corner_distance, corners['Distance'].to_numpy())
+    on_lap = index.corner_distance < index.length
+    np.testing.assert_array_equal(index.corner_at(index.corner_distance[on_lap]), index.corner_numbers[on_lap])
+
+
+def test_circuit_index_cache_reuses_saved_indexes(tmp_path):
+    session = synthetic_session()
+    cache = CircuitIndexCache(str(tmp_path))
+    index = cache.get(session)
+    assert cache.get(session) is index
+
+    saved = list(tmp_path.glob('*.npz'))
+    assert len(saved) == 1
+    loaded = CircuitIndex.load(str(saved[0]))
+    np.testing.assert_allclose(loaded.trace, index.trace)
+    np.testing.assert_array_equal(loaded.corner_numbers, index.corner_numbers)
+    assert loaded.layout == index.layout
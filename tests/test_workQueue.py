@@ -0,0 +1,108 @@
+import os
+import time
+import pytest
+from helpers.workQueue import WorkQueue, LeaseLost, PENDING, LEASED, DONE, FAILED
+
+
+def queues(root, lease_seconds=0.05, max_attempts=3):
+    """
+    Two workers sharing one queue folder
+    """
+    return WorkQueue(str(root), lease_seconds=lease_seconds, max_attempts=max_attempts, worker_id='a'), \
+                WorkQueue(str(root), lease_seconds=lease_seconds, max_attempts=max_attempts, worker_id='b')
+
+
+def test_a_task_is_claimed_once(tmp_path):
+    a, b = queues(tmp_path)
+    assert a.enqueue([{'id': '2023-1'}]) == ['2023-1']
+    assert a.enqueue([{'id': '2023-1'}]) == []
+
+    task = a.claim()
+    assert task['worker'] == 'a' and task['attempts'] == 1
+    assert b.claim() is None
+    assert a.counts() == {PENDING: 0, LEASED: 1, DONE: 0, FAILED: 0}
+
+
+def test_a_lease_expires_only_after_lease_seconds_without_heartbeat(tmp_path):
+    a, b = queues(tmp_path)
+    a.enqueue([{'id': '2023-1'}])
+    task = a.claim()
+
+    # The first sight of a lease starts its clock
+    assert b.requeue_expired() == []
+    assert b.requeue_expired() == []
+    time.sleep(0.1)
+    assert b.requeue_expired() == ['2023-1']
+
+    with pytest.raises(LeaseLost):
+        a.heartbeat(task)
+    assert b.claim()['attempts'] == 2
+
+
+def test_a_heartbeat_keeps_the_lease(tmp_path):
+    a, b = queues(tmp_path)
+    a.enqueue([{'id': '2023-1'}])
+    task = a.claim()
+
+    b.requeue_expired()
+    time.sleep(0.1)
+    a.heartbeat(task)
+    # Changed since b last looked, so timed again from now
+    assert b.requeue_expired() == []
+    a.complete(task, {'rows': 1})
+    assert [done['result'] for done in a.tasks(DONE)] == [{'rows': 1}]
+
+
+def test_an_expired_lease_without_attempts_left_fails(tmp_path):
+    a, b = queues(tmp_path, max_attempts=1)
+    a.enqueue([{'id': '2023-1'}])
+    a.claim()
+
+    b.requeue_expired()
+    time.sleep(0.1)
+    assert b.requeue_expired() == ['2023-1']
+    assert b.counts()[FAILED] == 1
+    assert b.claim() is None
+
+
+def test_a_lost_lease_is_raised_when_the_block_ends(tmp_path):
+    a, _ = queues(tmp_path, lease_seconds=0.15)
+    a.enqueue([{'id': '2023-1'}])
+    task = a.claim()
+
+    with pytest.raises(LeaseLost):
+        with a.lease(task):
+            # Requeued behind the worker's back
+            os.rename(a._path(LEASED, task['id']), a._path(PENDING, task['id']))
+            time.sleep(0.2)
+
+
+def test_complete_moves_staged_outputs_into_place(tmp_path):
+    a, _ = queues(tmp_path / 'queue')
+    a.enqueue([{'id': '2023-1'}])
+    task = a.claim()
+    staged = tmp_path / 'staging' / 'part.parquet'
+    staged.parent.mkdir()
+    staged.write_text('rows')
+    final = tmp_path / 'out' / 'year=2023' / 'part.parquet'
+
+    a.complete(task, outputs={str(staged): str(final)})
+    assert final.read_text() == 'rows'
+    assert not staged.exists()
+    assert a.finished()
+
+
+def test_outputs_of_a_lost_lease_are_not_moved(tmp_path):
+    a, b = queues(tmp_path / 'queue')
+    a.enqueue([{'id': '2023-1'}])
+    task = a.claim()
+    b.requeue_expired()
+    time.sleep(0.1)
+    b.requeue_expired()
+
+    staged = tmp_path / 'part.parquet'
+    staged.write_text('rows')
+    final = tmp_path / 'out' / 'part.parquet'
+    with pytest.raises(LeaseLost):
+        a.complete(task, outputs={str(staged): str(final)})
+    assert not final.exists()